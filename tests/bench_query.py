@@ -0,0 +1,76 @@
+"""比较搜索框查询的速度：python tests/bench_query.py [条数]
+
+同样 N 条 test item 分别放在一个 SKU 中（单个 SKU 的搜索）和 50 个 SKU 中（Search All SKUs），
+对每种查询比较逐行判断（不传文档，不用倒排索引）和使用倒排索引的耗时。
+"""
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_split_values import _timed  # noqa: E402
+from conftest import HEADER  # noqa: E402
+from wanchai_core import loads  # noqa: E402
+from wanchai_search import compile_query, search_all_skus  # noqa: E402
+
+QUERIES = [
+    "TestID:RF_1*",
+    "TestID:rf_12",
+    "Description:name",
+    "Unit=dB",
+    "LowLimit<-3",
+    "LowLimit>HighLimit",
+    "TestID~^AUD_4",
+    "/Link/",
+    "rf_1",
+    "Enabled=0 Unit=V",
+]
+
+
+def make_doc(sku_count, count):
+    blocks = ["[Info]\nUnitCount=1\nExport Date=2025/7/14 8:55:56"]
+    per_sku = count // sku_count
+    n = 0
+    for s in range(sku_count):
+        sku = f"38599-{s:03d}-889"
+        lines = [f"[{sku}]", f"Count={per_sku}"]
+        for i in range(1, per_sku + 1):
+            n += 1
+            kind = ("RF", "AUD", "PWR")[n % 3]
+            unit = ("dB", "V", "A")[n % 3]
+            lines.append(
+                f"{i}=({HEADER}) VALUES ('{sku}','{kind}_{n % 500}','Name {n % 1000}',"
+                f"{n % 2},'SL','-{n % 7}.67','{n % 9}.62','3','{unit}',"
+                "'UC, Link390C, Black')"
+            )
+        blocks.append("\n".join(lines))
+    doc = loads("\n\n".join(blocks))
+    doc.value_index()
+    return doc
+
+
+def main(count=100000):
+    one = make_doc(1, count)
+    rows = one.rows(one.sku_list[0])
+    many = make_doc(50, count)
+    print(f"{count} items, best of 5 (ms)")
+    print(f"{'query':22} {'scan':>8} {'indexed':>8} {'all SKUs':>9}")
+    for text in QUERIES:
+        query = compile_query(text, one.test_columns)
+        if query is None:
+            scan = indexed = _timed(lambda: one.filter_rows(None, text, rows))[0]
+        else:
+            scan, expected = _timed(lambda: query.filter(rows))
+            indexed, result = _timed(lambda: query.filter(rows, one))
+            assert result == expected
+        every = _timed(lambda: search_all_skus(many, text))[0]
+        print(f"{text:22} {scan * 1000:8.1f} {indexed * 1000:8.1f} {every * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    gc.collect()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,61 @@
+"""比较 VALUES 分割的速度：python tests/bench_split_values.py [条数]
+
+对照为改为批量分割之前的逐字符实现（tests/test_parser.py 中的 reference_split），
+默认 100k 条，与生成的大文件中的 test item 格式相同。
+加载、fleet 索引和粘贴都走 split_values_many（每批 1024 条）；单行的 split_values
+只剩下批量路径处理不了的行在用，比对照快得少。
+"""
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_parser import reference_split  # noqa: E402
+from wanchai_parser import split_values, split_values_many  # noqa: E402
+
+
+def _timed(fn, repeat=5):
+    """与 timeit 一样取多次中最快的一次，计时时关掉循环垃圾回收"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(count=100000):
+    rows = [
+        f"'38599-{i % 50:03d}-889','RF_{i}','Name, {i}',{i % 2},'SL',"
+        f"'-{i % 7}.67','{i % 9}.62','3','dB','UC, Link390C, Black'"
+        for i in range(count)
+    ]
+    old, expected = _timed(lambda: [reference_split(s) for s in rows])
+    single, by_row = _timed(lambda: [split_values(s) for s in rows])
+    batch = 1024
+    many, batched = _timed(
+        lambda: [
+            values
+            for i in range(0, count, batch)
+            for values in split_values_many(rows[i : i + batch])
+        ]
+    )
+    assert by_row == expected and batched == expected
+    print(f"{count} items")
+    print(f"per-character loop : {old:.3f}s")
+    print(f"split_values       : {single:.3f}s ({old / single:.1f}x)")
+    print(f"split_values_many  : {many:.3f}s ({old / many:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
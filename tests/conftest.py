@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+
+import pytest
+
+# 直接从仓库根目录导入各模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADER = (
+    "Identifier,TestID,Description,Enabled,StringLimit,"
+    "LowLimit,HighLimit,LimitType,Unit,Parameters"
+)
+
+
+def item_line(index, sku, test_id, low="0", high="1", description="Name"):
+    return (
+        f"{index}=({HEADER}) VALUES ('{sku}','{test_id}','{description}',1,"
+        f"'SL','{low}','{high}','3','dB','x,y')"
+    )
+
+
+def ini_text(skus, date="2025/7/14 8:55:56"):
+    """skus 为 [(sku, [(TestID, LowLimit), ...]), ...]，生成完整的 INI 文本"""
+    blocks = [f"[Info]\nUnitCount=1\nExport Date={date}"]
+    for sku, items in skus:
+        lines = [f"[{sku}]", f"Count={len(items)}"]
+        for i, (test_id, low) in enumerate(items, 1):
+            lines.append(item_line(i, sku, test_id, low))
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def random_skus(seed=0, sku_count=5, items=40):
+    """随机生成的 SKU 列表，TestID 有重复，字段里有引号内的逗号"""
+    rng = random.Random(seed)
+    skus = []
+    for s in range(sku_count):
+        rows = [
+            (f"{rng.choice(['RF', 'AUD', 'PWR'])}_{rng.randint(1, 30)}", str(i))
+            for i in range(items)
+        ]
+        skus.append((f"38599-{s:03d}-889", rows))
+    return skus
+
+
+# 比较和合并测试共用的三个版本
+BASE = [
+    ("S1", [("A1", "1"), ("A2", "2"), ("A3", "3"), ("A4", "4")]),
+    ("S2", [("B1", "1")]),
+    ("S3", [("C1", "1")]),
+    ("S4", [("D1", "1")]),
+]
+# 改 A2、A3，删 A4，在 A1 后加 AO，删 S3，改 S4
+OURS = [
+    ("S1", [("A1", "1"), ("AO", "0"), ("A2", "20"), ("A3", "30")]),
+    ("S2", [("B1", "1")]),
+    ("S4", [("D1", "11")]),
+]
+# 改 A1、A3（与 ours 冲突），在 A3 后加 AT，删 S2，改 S3（ours 已删），删 S4（ours 已改），加 S5
+THEIRS = [
+    ("S1", [("A1", "10"), ("A2", "2"), ("A3", "33"), ("AT", "7"), ("A4", "4")]),
+    ("S3", [("C1", "2")]),
+    ("S5", [("E1", "5")]),
+]
+
+
+@pytest.fixture
+def write_ini(tmp_path):
+    """write_ini(name, skus 或文本) 写出 INI 文件并返回路径"""
+
+    def write(name, content, date="2025/7/14 8:55:56"):
+        path = tmp_path / name
+        text = content if isinstance(content, str) else ini_text(content, date)
+        path.write_bytes(text.encode("utf-8"))
+        return str(path)
+
+    return write
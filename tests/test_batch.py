@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+import wanchai_batch
+import wanchai_core
+from conftest import random_skus
+
+
+def test_parse_script_rejects_bad_operations():
+    with pytest.raises(wanchai_batch.ScriptError, match="unknown operation"):
+        wanchai_batch.parse_script([{"op": "explode"}])
+    with pytest.raises(wanchai_batch.ScriptError, match="missing 'value'"):
+        wanchai_batch.parse_script([{"op": "set_field", "where": {}, "field": "X"}])
+    with pytest.raises(wanchai_batch.ScriptError, match="'where'"):
+        wanchai_batch.parse_script({"operations": [{"op": "delete", "where": 5}]})
+    with pytest.raises(wanchai_batch.ScriptError):
+        wanchai_batch.parse_script({"operations": "delete"})
+
+
+def test_select_rows_by_dict_and_query(write_ini):
+    doc = wanchai_core.load(
+        write_ini("a.ini", [("S1", [("RF_1", "1"), ("AUD_2", "2"), ("RF_3", "3")])])
+    )
+    by_dict = wanchai_batch.select_rows(doc, {"TestID": ["RF_1", " RF_3 "]})
+    assert [row[2] for row in by_dict] == ["RF_1", "RF_3"]
+    by_query = wanchai_batch.select_rows(doc, "TestID:RF_* LowLimit>1")
+    assert [row[2] for row in by_query] == ["RF_3"]
+    with pytest.raises(wanchai_batch.ScriptError):
+        wanchai_batch.select_rows(doc, {"Nope": "1"})
+
+
+def test_apply_operations(write_ini):
+    doc = wanchai_core.load(
+        write_ini("a.ini", [("S1", [("A", "1"), ("B", "2")]), ("S2", [("C", "3")])])
+    )
+    operations = wanchai_batch.parse_script(
+        [
+            {
+                "op": "set_field",
+                "where": {"TestID": "A"},
+                "field": "LowLimit",
+                "value": -5,
+            },
+            {"op": "copy_to_all_skus", "sku": "S1", "where": {"TestID": "A"}},
+            {"op": "delete", "where": {"TestID": "B"}},
+            {"op": "add_suffix", "suffix": "_GRC"},
+            {"op": "update_export_date", "value": "2026/1/1 0:00:00"},
+        ]
+    )
+    changes = wanchai_batch.apply_operations(doc, operations)
+    assert changes == [
+        ("set_field", 1),
+        ("copy_to_all_skus", 1),
+        ("delete", 1),
+        ("add_suffix", 2),
+        ("update_export_date", 1),
+    ]
+    assert doc.sku_list == ["S1_GRC", "S2_GRC"]
+    low = doc.test_columns.index("LowLimit")
+    assert [(r[0], r[1], r[2], r[low]) for r in doc.rows("S2_GRC")] == [
+        ("1", "S2_GRC", "A", "-5"),
+        ("2", "S2_GRC", "C", "3"),
+    ]
+    assert doc.info["Export Date"] == "2026/1/1 0:00:00"
+
+
+def test_run_writes_outputs_and_reports_failures(write_ini, tmp_path):
+    good = write_ini("good.ini", random_skus())
+    missing = str(tmp_path / "missing.ini")
+    script = tmp_path / "script.json"
+    script.write_text(
+        json.dumps({"operations": [{"op": "add_suffix", "suffix": "_X"}]})
+    )
+    operations = wanchai_batch.load_script(str(script))
+    out_dir = tmp_path / "out"
+    summaries = list(
+        wanchai_batch.run([good, missing], operations, str(out_dir), jobs=1)
+    )
+    assert [s["ok"] for s in summaries] == [True, False]
+    assert "FileNotFoundError" in summaries[1]["error"]
+    result = wanchai_core.load(str(out_dir / "good.ini"))
+    assert all(sku.endswith("_X") for sku in result.sku_list)
+
+
+def test_output_paths_detects_collisions(tmp_path):
+    with pytest.raises(wanchai_batch.ScriptError):
+        wanchai_batch.output_paths(["a/x.ini", "b/x.ini"], str(tmp_path))
+
+
+@pytest.mark.parametrize("op", ["set_field", "delete"])
+def test_destructive_operations_refuse_plain_text(write_ini, op):
+    path = write_ini("a.ini", [("S1", [("RF_1", "1"), ("AUD_RF", "2")])])
+    doc = wanchai_core.load(path)
+    before = wanchai_core.dumps(doc)
+    operation = {"op": op, "where": "rf", "field": "LowLimit", "value": "0"}
+    with pytest.raises(wanchai_batch.ScriptError, match="plain text"):
+        wanchai_batch.apply_operations(doc, [operation])
+    assert wanchai_core.dumps(doc) == before
+    # 查询语法和按列取值照常使用，只读的查询也仍然可以用普通文本
+    operation["where"] = "TestID:RF_*"
+    assert wanchai_batch.apply_operations(doc, [operation]) == [(op, 1)]
+    assert len(wanchai_batch.select_rows(doc, "rf")) == 2 - (op == "delete")
+
+
+@pytest.mark.parametrize("jobs", [None, 2])
+def test_run_in_a_process_pool_keeps_order(write_ini, tmp_path, jobs):
+    paths = [write_ini(f"{i}.ini", random_skus(seed=i)) for i in range(3)]
+    operations = [{"op": "add_suffix", "suffix": "_X"}]
+    summaries = list(wanchai_batch.run(paths, operations, jobs=jobs))
+    assert [s["path"] for s in summaries] == paths
+    assert all(s["ok"] and s["changes"] == [("add_suffix", 5)] for s in summaries)
@@ -0,0 +1,108 @@
+import importlib.util
+import os
+
+import pytest
+
+import wanchai_cache
+import wanchai_core
+from conftest import random_skus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_cli():
+    spec = importlib.util.spec_from_file_location(
+        "wanchai_cli", os.path.join(ROOT, "wanchai-cli.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """记录 file_fingerprint（读全文件算哈希）被调用的次数"""
+    calls = []
+    fingerprint = wanchai_cache.file_fingerprint
+
+    def counting(path, f=None):
+        calls.append(path)
+        return fingerprint(path, f)
+
+    monkeypatch.setattr(wanchai_cache, "file_fingerprint", counting)
+    return calls
+
+
+def _parse(path, cache):
+    doc = wanchai_core.load(path, cache=cache)
+    doc.parse_all()
+    return doc
+
+
+def test_cache_hit_does_not_hash(write_ini, tmp_path, hashes):
+    path = write_ini("a.ini", random_skus())
+    cache = wanchai_cache.ParseCache(str(tmp_path / "cache"))
+    _parse(path, cache)
+    assert len(hashes) == 1
+    entry = cache.open(path)
+    assert len(hashes) == 1
+    assert entry.get(random_skus()[0][0]) is not None
+
+
+def test_touched_file_keeps_cache(write_ini, tmp_path, hashes):
+    path = write_ini("a.ini", random_skus())
+    cache = wanchai_cache.ParseCache(str(tmp_path / "cache"))
+    expected = [list(row) for row in _parse(path, cache).all_rows()]
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    entry = cache.open(path)
+    assert len(hashes) == 2
+    assert entry.get(random_skus()[0][0]) is not None
+    # 改写了文件头中的修改时间，再打开就不用算哈希
+    doc = _parse(path, cache)
+    assert len(hashes) == 2
+    assert [list(row) for row in doc.all_rows()] == expected
+
+
+def test_changed_file_drops_cache(write_ini, tmp_path, hashes):
+    path = write_ini("a.ini", random_skus())
+    cache = wanchai_cache.ParseCache(str(tmp_path / "cache"))
+    _parse(path, cache)
+    write_ini("a.ini", random_skus(seed=1))
+    entry = cache.open(path)
+    assert len(hashes) == 2
+    assert entry.get(random_skus()[0][0]) is None
+
+
+@pytest.mark.parametrize("command", ["diff", "merge"])
+def test_cli_no_cache(write_ini, tmp_path, monkeypatch, command):
+    cli = _load_cli()
+
+    def no_cache(*args, **kwargs):
+        raise AssertionError("parse cache used")
+
+    monkeypatch.setattr(cli, "ParseCache", no_cache)
+    path = write_ini("a.ini", random_skus())
+    argv = [command, path, path, "--no-cache"]
+    if command == "merge":
+        argv[3:3] = [path, "-o", str(tmp_path / "out.ini")]
+    assert cli.main(argv) == 0
+
+
+def test_file_replaced_while_opening_uses_one_version(write_ini, tmp_path):
+    path = write_ini("a.ini", random_skus())
+    cache = wanchai_cache.ParseCache(str(tmp_path / "cache"))
+    expected = [list(row) for row in _parse(path, cache).all_rows()]
+    other = write_ini("b.ini", random_skus(seed=1))
+    open_entry = cache.open
+
+    def replace_then_open(*args):
+        # 在取指纹之前原文件被另一个版本替换
+        os.replace(other, path)
+        return open_entry(*args)
+
+    cache.open = replace_then_open
+    doc = _parse(path, cache)
+    # 扫描的是打开时的版本，缓存也按这个版本的指纹取出
+    assert [list(row) for row in doc.all_rows()] == expected
+    assert wanchai_core.section_source(doc, doc.sku_list[0]) is None
@@ -0,0 +1,239 @@
+import pytest
+
+import wanchai_core
+from conftest import HEADER, item_line, random_skus
+
+
+def _rows(doc):
+    return {sku: [list(row) for row in doc.rows(sku)] for sku in doc.sku_list}
+
+
+def test_row_operations_stay_within_their_sku(write_ini):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus(items=10)))
+    a, b = doc.sku_list[:2]
+    others = _rows(doc)
+    rows_b = list(doc.rows(b))
+    assert doc.delete_items([doc.rows(a)[2].uid]) == [a]
+    new_row = doc.make_row(a, [a, "NEW", "N", "1", "SL", "0", "1", "3", "dB", ""])
+    doc.insert_rows(a, 0, [new_row])
+    assert [row[0] for row in doc.rows(a)] == [str(i) for i in range(1, 11)]
+    assert doc.find_row(a, "1") is new_row
+    assert doc.position_of(a, "3") == 2
+    assert doc.rows(a)[3][2] == others[a][3][2]
+    assert doc.count(a) == 10 and doc.count("missing") == 0
+    assert doc.rows(b) == rows_b
+    assert [sku for _, sku in doc.iter_rows()] == [
+        sku for sku in doc.sku_list for _ in doc.rows(sku)
+    ]
+    del others[a]
+    assert {sku: rows for sku, rows in _rows(doc).items() if sku != a} == others
+
+
+def test_items_are_slotted_records_in_one_store(write_ini):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus(items=10)))
+    a, b = doc.sku_list[:2]
+    row, other = doc.rows(a)[0], doc.rows(b)[0]
+    assert not hasattr(row, "__dict__")
+    assert doc.get_item(row.uid) is row and doc.get_item(str(row.uid)) is row
+    # 相同的字段值共用同一个字符串对象
+    unit = doc.test_columns.index("Unit")
+    assert row.values[unit] is other.values[unit]
+    assert row[doc.id_idx] == a and row.sku == a
+    low = doc.test_columns.index("LowLimit")
+    doc.set_field([row], low, "-9")
+    assert doc.find_row(a, row[0])[low] == "-9"
+    assert [r for r in doc.all_rows() if r[low] == "-9"] == [row]
+
+
+def test_uids_survive_renumbering_and_pick_exact_rows(write_ini):
+    lines = [item_line(1, "A", "T1"), item_line(1, "A", "T2"), item_line(2, "A", "T3")]
+    text = "[Info]\nUnitCount=1\nExport Date=x\n\n[A]\nCount=3\n" + "\n".join(lines)
+    doc = wanchai_core.load(write_ini("a.ini", text))
+    first, second, third = doc.rows("A")
+    assert len({first.uid, second.uid, third.uid}) == 3
+    # Index 重复时按 uid 删除只删掉选中的那一行
+    doc.delete_items([second.uid])
+    assert doc.rows("A") == [first, third]
+    doc.move_row("A", 1, 0)
+    assert [(row.uid, row[0]) for row in doc.rows("A")] == [
+        (third.uid, "1"),
+        (first.uid, "2"),
+    ]
+    assert doc.position(first.uid) == 1 and doc.get_item(second.uid) is None
+    doc.duplicate_rows("A", [third.uid])
+    copy = doc.rows("A")[1]
+    assert copy.uid not in (first.uid, second.uid, third.uid)
+    assert copy[1:] == third[1:]
+
+
+def _copy_reference(doc, sku, uids):
+    """原来的做法：按 index 顺序逐行插入到每个其他 SKU 的 index - 1 处（超出则插入末尾）"""
+    selected = [
+        (int(row[0]), list(row)) for row in map(doc.get_item, uids) if row.sku == sku
+    ]
+    # Index 相同的行保持选中的顺序
+    selected.sort(key=lambda pair: pair[0])
+    result = {}
+    for target in doc.sku_list:
+        rows = [list(row) for row in doc.rows(target)]
+        if target != sku:
+            for index, values in selected:
+                copy = ["TMP_INDEX"] + values[1:]
+                copy[doc.id_idx] = target
+                rows.insert(min(index - 1, len(rows)), copy)
+            for i, row in enumerate(rows, 1):
+                row[0] = str(i)
+        result[target] = rows
+    return result
+
+
+def test_copy_to_other_skus_matches_inserting_one_by_one(write_ini):
+    skus = [("A", [(f"T{i}", str(i)) for i in range(8)]), ("B", [("X", "0")])]
+    skus += random_skus(sku_count=3, items=6)
+    doc = wanchai_core.load(write_ini("a.ini", skus))
+    rows = doc.rows("A")
+    # 行 2 的 Index 改成与行 1 相同，两行插入到同一位置
+    rows[2][0] = rows[1][0]
+    uids = [rows[i].uid for i in (6, 0, 2, 1, 7)] + [doc.rows("B")[0].uid]
+    expected = _copy_reference(doc, "A", uids)
+    assert doc.copy_to_other_skus("A", uids) == [s for s in doc.sku_list if s != "A"]
+    assert _rows(doc) == expected
+    assert all(row.sku == row[doc.id_idx] for row in doc.all_rows())
+
+
+def test_sku_renames_follow_into_every_row(write_ini):
+    # B 区块第二行的 Identifier 与区块名不一致
+    lines = [item_line(1, "A", "T1"), item_line(2, "A", "T2")]
+    text = "[Info]\nUnitCount=1\nExport Date=x\n\n[A]\nCount=2\n" + "\n".join(lines)
+    lines = [item_line(1, "B", "T3"), item_line(2, "Z", "T4")]
+    text += "\n\n[B]\nCount=2\n" + "\n".join(lines)
+    doc = wanchai_core.load(write_ini("a.ini", text))
+    rows = list(doc.rows("A"))
+    assert doc.rows("B")[1][doc.id_idx] == "Z"
+    with pytest.raises(ValueError):
+        doc.rename_sku("A", "B")
+    assert doc.add_suffix("A", "_X") == "A_X"
+    assert doc.rows("A_X") == rows and doc.rows("A") == []
+    assert [row[doc.id_idx] for row in rows] == ["A_X", "A_X"]
+    assert doc.backspace_sku("A_X") == "A_"
+    assert doc.backspace_sku("x") is None
+    # 改名后 Identifier 不一致的行也是新名称（与原来逐行改写的结果相同）
+    assert doc.add_suffix_to_all("_G") == {"A_": "A__G", "B": "B_G"}
+    assert doc.sku_list == ["A__G", "B_G"]
+    assert [row[doc.id_idx] for row in doc.all_rows()] == ["A__G"] * 2 + ["B_G"] * 2
+    assert _rows(wanchai_core.loads(wanchai_core.dumps(doc))) == _rows(doc)
+
+
+def test_fields_follow_each_sections_header(write_ini):
+    reordered = (
+        "TestID,Identifier,Description,Enabled,StringLimit,"
+        "LowLimit,HighLimit,LimitType,Unit,Parameters,Extra"
+    )
+    text = (
+        "[Info]\nUnitCount=2\nExport Date=x\n\n"
+        "[A]\nCount=1\n"
+        f"1=({HEADER}) VALUES ('A','T1','N',1,'SL','0','1','3','dB','p')\n\n"
+        "[B]\nCount=1\n"
+        f"1=({reordered}) VALUES ('T2','B','N',0,'SL','2','3','3','V','q','e')"
+    )
+    path = write_ini("a.ini", text)
+    doc = wanchai_core.load(path)
+    assert doc.test_columns[-1] == "Extra"
+    row = doc.rows("B")[0]
+    assert row[doc.test_columns.index("TestID")] == "T2"
+    assert row[doc.test_columns.index("Extra")] == "e"
+    doc.set_field(doc.rows("B"), doc.test_columns.index("Extra"), "f")
+    assert wanchai_core.dumps(doc) == text.replace("'q','e')", "'q','f')")
+
+
+def test_rows_short_of_their_header_are_logged_and_dropped(write_ini, caplog):
+    text = (
+        "[Info]\nUnitCount=1\nExport Date=x\n\n"
+        "[A]\nCount=2\n"
+        f"1=({HEADER}) VALUES ('A','T1','N',1,'SL','0','1','3','dB','p')\n"
+        f"2=({HEADER}) VALUES ('A','T2','N',1)"
+    )
+    doc = wanchai_core.load(write_ini("a.ini", text))
+    with caplog.at_level("WARNING", logger="wanchai_core"):
+        assert [row[2] for row in doc.rows("A")] == ["T1"]
+    assert "index=2" in caplog.text
+    skipped = []
+    rows = wanchai_core.parse_clipboard(text, doc.test_columns, skipped)
+    assert [row[1] for row in rows] == ["T1"]
+    assert skipped == [line for line in text.splitlines() if line[:2] != "1="]
+
+
+def _edit_doc(write_ini):
+    text = (
+        "[Info]\nUnitCount=1\nExport Date=x\n\n"
+        "[A]\nCount=3\n"
+        f"1=({HEADER}) VALUES ('A','T1','N',1,'SL','1','2','3','dB','p')\n"
+        f"2=({HEADER}) VALUES ('A','T2','N',1,'SL','1','9','3','dB','p')\n"
+        f"3=({HEADER}) VALUES ('A','T3','N',1,'SL','7','9','3','dB','p')\n\n"
+        "[B]\nCount=1\n"
+        f"1=({HEADER}) VALUES ('B','T4','N',1,'SL','5','2','3','dB','p')"
+    )
+    return wanchai_core.load(write_ini("edit.ini", text))
+
+
+def _snapshot(doc):
+    return [list(row) for row in doc.all_rows()]
+
+
+def test_edit_preview_counts_what_apply_changes(write_ini):
+    modes = (
+        wanchai_core.APPLY_ALL,
+        wanchai_core.APPLY_ALL_BY_FIELD,
+        wanchai_core.APPLY_SKU_ONLY,
+        wanchai_core.APPLY_SKU_BY_FIELD,
+    )
+    low = wanchai_core.DEFAULT_COLUMNS.index("LowLimit")
+    high = wanchai_core.DEFAULT_COLUMNS.index("HighLimit")
+    # 交换 LowLimit 和 HighLimit：按任意字段替换时 "1" -> "2" 之后又 "2" -> "1"（连锁替换），
+    # 只有 1 的行最后没有变化，不应计入
+    for mode in modes:
+        for swap in ((low, "2"), (high, "1")), ((low, "5"),):
+            doc = _edit_doc(write_ini)
+            row = doc.rows("A")[0]
+            new_row = list(row)
+            for col, value in swap:
+                new_row[col] = value
+            needs_index = doc.preview_needs_index(row.uid, new_row, mode)
+            assert needs_index == (mode in modes[:2])
+            count = doc.count_edit_changes(row.uid, new_row, mode)
+            before = _snapshot(doc)
+            doc.apply_edit(row.uid, new_row, mode)
+            after = _snapshot(doc)
+            assert count == sum(a != b for a, b in zip(before, after)), (mode, swap)
+
+
+def test_bulk_edit_replaces_matching_values_in_scope(write_ini):
+    low = wanchai_core.DEFAULT_COLUMNS.index("LowLimit")
+    for mode, expected in (
+        (wanchai_core.APPLY_SKU_BY_FIELD, {"A": ["0", "0", "7"], "B": ["5"]}),
+        (wanchai_core.APPLY_SKU_ONLY, {"A": ["0", "0", "7"], "B": ["5"]}),
+        (wanchai_core.APPLY_ALL_BY_FIELD, {"A": ["0", "0", "7"], "B": ["5"]}),
+        (wanchai_core.APPLY_CURRENT, {"A": ["0", "1", "7"], "B": ["5"]}),
+    ):
+        doc = _edit_doc(write_ini)
+        row = doc.rows("A")[0]
+        new_row = list(row)
+        new_row[low] = "0"
+        doc.apply_edit(row.uid, new_row, mode)
+        got = {sku: [r[low] for r in doc.rows(sku)] for sku in doc.sku_list}
+        assert got == expected, mode
+    # 按任意字段替换时其他列中等于原值的字段也被替换（Enabled 列的 1）；
+    # 只改一个 SKU 时不为建索引解析其他区块
+    enabled = doc.test_columns.index("Enabled")
+    for mode, b_enabled in (
+        (wanchai_core.APPLY_SKU_ONLY, "1"),
+        (wanchai_core.APPLY_ALL, "0"),
+    ):
+        doc = _edit_doc(write_ini)
+        row = doc.rows("A")[0]
+        new_row = list(row)
+        new_row[low] = "0"
+        doc.apply_edit(row.uid, new_row, mode)
+        assert doc.sections["B"].parsed == (mode == wanchai_core.APPLY_ALL)
+        assert [r[enabled] for r in doc.rows("A")] == ["0", "0", "0"]
+        assert doc.rows("B")[0][enabled] == b_enabled
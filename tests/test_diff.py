@@ -0,0 +1,30 @@
+import wanchai_core
+from conftest import BASE, OURS
+from wanchai_diff import ADDED, CHANGED, MOVED, REMOVED, diff_documents, diff_info
+
+
+def test_diff_ignores_renumbering_and_reports_changes(write_ini):
+    old = wanchai_core.load(write_ini("old.ini", BASE))
+    new = wanchai_core.load(write_ini("new.ini", OURS, date="later"))
+    assert diff_info(old, new) == [("Export Date", "2025/7/14 8:55:56", "later")]
+    diffs = {d.sku: d for d in diff_documents(old, new)}
+    assert set(diffs) == {"S1", "S3", "S4"}
+    assert diffs["S3"].kind == REMOVED
+    s1 = {(item.kind, item.test_id) for item in diffs["S1"].items}
+    assert s1 == {(ADDED, "AO"), (CHANGED, "A2"), (CHANGED, "A3"), (REMOVED, "A4")}
+    changed = [i for i in diffs["S1"].items if i.test_id == "A2"][0]
+    assert changed.fields == [("LowLimit", "2", "20")]
+
+
+def test_diff_reports_moves(write_ini):
+    rows = [("A", "1"), ("B", "2"), ("C", "3")]
+    old = wanchai_core.load(write_ini("old.ini", [("S", rows)]))
+    new = wanchai_core.load(write_ini("new.ini", [("S", rows[2:] + rows[:2])]))
+    (sku_diff,) = diff_documents(old, new)
+    assert [(i.kind, i.test_id) for i in sku_diff.items] == [(MOVED, "C")]
+
+
+def test_diff_of_identical_files_is_empty(write_ini):
+    doc = wanchai_core.load(write_ini("a.ini", BASE))
+    same = wanchai_core.load(write_ini("b.ini", BASE))
+    assert diff_documents(doc, same) == []
@@ -0,0 +1,105 @@
+import io
+import os
+import stat
+
+import pytest
+
+import wanchai_core
+from conftest import random_skus
+
+
+def _rows(doc):
+    return {sku: [list(row) for row in doc.rows(sku)] for sku in doc.sku_list}
+
+
+def test_unchanged_file_round_trips_byte_for_byte(write_ini, tmp_path):
+    path = write_ini("a.ini", random_skus())
+    doc = wanchai_core.load(path)
+    out = str(tmp_path / "out.ini")
+    wanchai_core.dump(doc, out)
+    with open(path, "rb") as a, open(out, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_regenerated_sections_round_trip(write_ini):
+    path = write_ini("a.ini", random_skus())
+    with open(path, encoding="utf-8") as f:
+        original = f.read()
+    doc = wanchai_core.load(path)
+    low = doc.test_columns.index("LowLimit")
+    # 每个 SKU 都改一个字段，导出时全部重新生成
+    for sku in doc.sku_list:
+        doc.set_field(doc.rows(sku)[:1], low, "-9")
+    assert all(wanchai_core.section_source(doc, sku) is None for sku in doc.sku_list)
+    text = wanchai_core.dumps(doc)
+    assert text == original.replace("'SL','0','1'", "'SL','-9','1'")
+    assert _rows(wanchai_core.loads(text)) == _rows(doc)
+
+
+def test_renumber_without_changes_keeps_sections_clean(write_ini):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus()))
+    a, b = doc.sku_list[:2]
+    version = doc.version
+    assert not any(doc.renumber(sku) for sku in doc.sku_list)
+    assert doc.version == version
+    assert all(wanchai_core.section_source(doc, sku) for sku in doc.sku_list)
+    doc.delete_items([doc.rows(a)[0].uid])
+    assert doc.renumber(a) and doc.version > version
+    assert wanchai_core.section_source(doc, a) is None
+    # 移到原位置不算修改，移到其他位置要重新生成
+    doc.move_row(b, 1, 1)
+    assert wanchai_core.section_source(doc, b) is not None
+    doc.move_row(b, 1, 0)
+    assert wanchai_core.section_source(doc, b) is None
+    assert [row[0] for row in doc.rows(b)] == [str(i) for i in range(1, 41)]
+
+
+def test_dump_is_atomic_and_keeps_target_on_error(write_ini, tmp_path, monkeypatch):
+    path = write_ini("a.ini", random_skus())
+    out = tmp_path / "out.ini"
+    out.write_text("old")
+    doc = wanchai_core.load(path)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(wanchai_core, "write", fail)
+    with pytest.raises(RuntimeError):
+        wanchai_core.dump(doc, str(out))
+    assert out.read_text() == "old"
+    # 临时文件已删除
+    assert sorted(os.listdir(str(tmp_path))) == ["a.ini", "out.ini"]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_small_batches_and_chunks_write_the_same_bytes(write_ini, monkeypatch, newline):
+    path = write_ini("a.ini", random_skus())
+    doc = wanchai_core.load(path)
+    low = doc.test_columns.index("LowLimit")
+    doc.set_field(doc.rows(doc.sku_list[1])[:1], low, "-9")
+    expected = io.BytesIO()
+    wanchai_core.write(doc, expected, newline)
+    # 原文按很小的块复制、重新生成的区块每批只写几行，块边界落在换行和空行上
+    monkeypatch.setattr(wanchai_core, "_COPY_CHUNK", 7)
+    monkeypatch.setattr(wanchai_core, "_WRITE_BATCH", 3)
+    out = io.BytesIO()
+    wanchai_core.write(doc, out, newline)
+    assert out.getvalue() == expected.getvalue()
+    text = out.getvalue().decode("utf-8")
+    assert text.count(newline) == text.count("\n")
+    assert _rows(wanchai_core.loads(text)) == _rows(doc)
+
+
+def test_dump_over_the_source_file(write_ini):
+    path = write_ini("a.ini", random_skus())
+    doc = wanchai_core.load(path)
+    sku = doc.sku_list[2]
+    doc.delete_items([doc.rows(sku)[0].uid])
+    doc.renumber(sku)
+    os.chmod(path, 0o640)
+    wanchai_core.dump(doc, path)
+    # 还没解析的区块在覆盖前已解析出来，覆盖后照样可以使用
+    assert all(doc.sections[s].parsed for s in doc.sku_list)
+    assert _rows(wanchai_core.load(path)) == _rows(doc)
+    if os.name == "posix":
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
@@ -0,0 +1,75 @@
+import builtins
+import sqlite3
+
+import pytest
+
+import wanchai_fleet
+from conftest import random_skus
+from wanchai_search import QueryError
+
+
+def _db(tmp_path):
+    return str(tmp_path / "fleet.db")
+
+
+def test_columns_named_like_meta_columns(write_ini, tmp_path):
+    header = "Identifier,TestID,Description,Enabled,Sku,Position,Path,File_ID"
+    text = (
+        "[Info]\nUnitCount=1\nExport Date=x\n\n[S1]\nCount=2\n"
+        f"1=({header}) VALUES ('S1','T1','N',1,'x','7','p1','f')\n"
+        f"2=({header}) VALUES ('S1','T2','N',1,'y','8','p2','g')"
+    )
+    path = write_ini("a.ini", text)
+    db = _db(tmp_path)
+    assert wanchai_fleet.index(db, [path], jobs=1)["indexed"] == 1
+    columns, rows = wanchai_fleet.query(db, "Position=8 Path:p*", ["TestID", "Sku"])
+    assert columns == ["File", "SKU", "TestID", "Sku"]
+    assert rows == [(path, "S1", "T2", "y")]
+    assert wanchai_fleet.summarize(db, "File_ID=f") == [(path, "S1", 1)]
+
+
+def test_query_does_not_change_the_database(write_ini, tmp_path):
+    db = _db(tmp_path)
+    wanchai_fleet.index(db, [write_ini("a.ini", random_skus())], jobs=1)
+    conn = sqlite3.connect(db)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    assert wanchai_fleet.query(db, "TestID:RF_*")[1]
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    # 旧版本的数据库不能查询，也不会被查询改动；重新索引时重建
+    conn.execute("PRAGMA user_version = 1")
+    conn.close()
+    with pytest.raises(QueryError, match="index"):
+        wanchai_fleet.summarize(db)
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    conn.close()
+    path = write_ini("b.ini", random_skus(seed=1))
+    assert wanchai_fleet.index(db, [path], jobs=1)["indexed"] == 1
+    assert {row[0] for row in wanchai_fleet.summarize(db)} == {path}
+
+
+def test_failed_file_drops_its_old_rows(write_ini, tmp_path):
+    db = _db(tmp_path)
+    good = write_ini("a.ini", random_skus())
+    bad = write_ini("b.ini", random_skus(seed=1))
+    wanchai_fleet.index(db, [good, bad], jobs=1)
+    with open(bad, "ab") as f:
+        f.write(b"\n\xff\xfe")
+    totals = wanchai_fleet.index(db, [good, bad], jobs=1)
+    assert (totals["failed"], totals["unchanged"]) == (1, 1)
+    assert {row[0] for row in wanchai_fleet.summarize(db)} == {good}
+
+
+def test_each_file_is_read_once(write_ini, tmp_path, monkeypatch):
+    paths = [write_ini(f"{i}.ini", random_skus(seed=i)) for i in range(2)]
+    opened = []
+
+    def counting_open(file, *args, **kwargs):
+        opened.append(file)
+        return builtins.open(file, *args, **kwargs)
+
+    monkeypatch.setattr(wanchai_fleet, "open", counting_open, raising=False)
+    assert wanchai_fleet.index(_db(tmp_path), paths, jobs=1)["indexed"] == 2
+    assert opened == paths
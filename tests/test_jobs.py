@@ -0,0 +1,62 @@
+import threading
+
+import wanchai_core
+import wanchai_jobs
+from conftest import random_skus
+
+
+def _result(job):
+    job.thread.join(5)
+    return job.queue.get_nowait()
+
+
+def test_parse_job_parses_on_the_worker_thread(write_ini):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus()))
+    sku = doc.sku_list[1]
+    threads = []
+    section = doc.sections[sku]
+    loader = section._loader
+
+    def spy(section):
+        threads.append(threading.current_thread())
+        loader(section)
+
+    section._loader = spy
+    job = wanchai_jobs.ParseJob(doc, sku)
+    job.start()
+    assert _result(job) == ("done", sku)
+    assert threads == [job.thread]
+    assert doc.sections[sku].parsed and not doc.sections[doc.sku_list[0]].parsed
+    assert len(doc.rows(sku)) == 40
+
+
+def test_parse_job_reports_a_changed_source(write_ini):
+    path = write_ini("a.ini", random_skus())
+    doc = wanchai_core.load(path)
+    write_ini("a.ini", random_skus(seed=1))
+    job = wanchai_jobs.ParseJob(doc, doc.sku_list[0])
+    job.start()
+    kind, error = _result(job)
+    assert kind == "error" and isinstance(error, wanchai_core.SourceChanged)
+    # 失败后区块保持没解析，不会留下半个区块
+    assert not doc.sections[doc.sku_list[0]].parsed
+
+
+def test_load_job_reports_progress_and_cancel(write_ini, tmp_path):
+    path = write_ini("a.ini", random_skus())
+    job = wanchai_jobs.LoadJob(path, previous=None)
+    job.start()
+    job.thread.join(5)
+    messages = []
+    while not job.queue.empty():
+        messages.append(job.queue.get_nowait())
+    kinds = [kind for kind, _ in messages]
+    assert kinds[-1] == "done" and set(kinds[:-1]) == {"progress"}
+    assert messages[-1][1].sku_list == [sku for sku, _ in random_skus()]
+    job = wanchai_jobs.LoadJob(path, previous=None)
+    job.cancel()
+    job.start()
+    assert _result(job) == ("cancelled", None)
+    job = wanchai_jobs.LoadJob(str(tmp_path / "missing.ini"), previous=None)
+    job.start()
+    assert _result(job)[0] == "error"
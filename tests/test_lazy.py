@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import wanchai_core
+from conftest import ini_text, random_skus
+
+
+def _rows(doc):
+    return {sku: [list(row) for row in doc.rows(sku)] for sku in doc.sku_list}
+
+
+def test_lazy_load_matches_eager_parse(write_ini):
+    path = write_ini("a.ini", random_skus(seed=1))
+    lazy = wanchai_core.load(path)
+    assert not any(lazy.sections[sku].parsed for sku in lazy.sku_list)
+    with open(path, encoding="utf-8") as f:
+        eager = wanchai_core.loads(f)
+    assert lazy.sku_list == eager.sku_list
+    assert lazy.info == eager.info
+    assert lazy.test_columns == eager.test_columns
+    assert _rows(lazy) == _rows(eager)
+
+
+def test_rename_before_parse_matches_rename_after_parse(write_ini):
+    path = write_ini("a.ini", random_skus(seed=2))
+    before = wanchai_core.load(path)
+    after = wanchai_core.load(path)
+    after.parse_all()
+    for doc in (before, after):
+        doc.add_suffix_to_all("_GRC")
+    assert wanchai_core.dumps(before) == wanchai_core.dumps(after)
+    assert all(row[1].endswith("_GRC") for row in before.all_rows())
+
+
+def test_lazy_edits_match_eager_edits(write_ini):
+    path = write_ini("a.ini", random_skus(seed=3))
+    lazy = wanchai_core.load(path)
+    with open(path, encoding="utf-8") as f:
+        eager = wanchai_core.loads(f)
+    for doc in (lazy, eager):
+        sku = doc.sku_list[1]
+        low = doc.test_columns.index("LowLimit")
+        doc.set_field(doc.rows(sku)[:3], low, "-9")
+        doc.delete_items([doc.rows(sku)[5].uid])
+        doc.renumber(sku)
+        doc.copy_to_other_skus(sku, [doc.rows(sku)[0].uid])
+    assert wanchai_core.dumps(lazy) == wanchai_core.dumps(eager)
+
+
+def _touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5 * 10**9))
+
+
+def test_export_after_source_mtime_changes(write_ini, tmp_path):
+    path = write_ini("a.ini", random_skus())
+    with open(path, "rb") as f:
+        original = f.read()
+    doc = wanchai_core.load(path)
+    _touch(path)
+    # 内容没变，没解析的区块照样按需解析、原样复制
+    out = str(tmp_path / "out.ini")
+    wanchai_core.dump(doc, out)
+    with open(out, "rb") as f:
+        assert f.read() == original
+    sku = doc.sku_list[2]
+    low = doc.test_columns.index("LowLimit")
+    doc.set_field(doc.rows(sku)[:1], low, "-9")
+    _touch(path)
+    text = wanchai_core.dumps(doc)
+    assert wanchai_core.loads(text).rows(sku)[0][low] == "-9"
+    assert wanchai_core.section_source(doc, doc.sku_list[0]) is not None
+
+
+def test_changed_source_sections_are_regenerated_or_refused(write_ini):
+    path = write_ini("a.ini", random_skus())
+    with open(path, encoding="utf-8") as f:
+        eager = wanchai_core.loads(f)
+    doc = wanchai_core.load(path)
+    parsed, unparsed, untouched = doc.sku_list[:3]
+    doc.rows(parsed)
+    # 原地改掉两个区块的内容（长度不变），并在文件末尾追加内容
+    with open(path, "r+b") as f:
+        data = f.read()
+        for sku in (parsed, unparsed):
+            start = data.index(f"'{sku}','".encode())
+            data = data[:start] + data[start:].replace(b"'0','1'", b"'5','6'", 1)
+        f.seek(0)
+        f.write(data + b"\n\n[Extra]\nCount=0")
+    assert wanchai_core.section_source(doc, parsed) is None
+    assert wanchai_core.section_source(doc, untouched) is not None
+    assert [list(row) for row in doc.rows(untouched)] == _rows(eager)[untouched]
+    with pytest.raises(wanchai_core.SourceChanged):
+        doc.rows(unparsed)
+    doc.remove_sku(unparsed)
+    # 已解析的区块按解析出的行重新生成，内容与加载时相同
+    assert _rows(wanchai_core.loads(wanchai_core.dumps(doc)))[parsed] == (
+        _rows(eager)[parsed]
+    )
+
+
+def test_mapped_load_reads_empty_crlf_and_repeated_sections(write_ini):
+    assert wanchai_core.load(write_ini("empty.ini", "")).sku_list == []
+    text = ini_text(random_skus(items=3))
+    # 同名区块出现两次时行合并到一起
+    text += "\n\n" + ini_text(random_skus(seed=1, items=2)).split("\n\n", 1)[1]
+    path = write_ini("a.ini", text.replace("\n", "\r\n"))
+    doc = wanchai_core.load(path)
+    assert _rows(doc) == _rows(wanchai_core.loads(text))
+    assert all(len(rows) == 5 for rows in _rows(doc).values())
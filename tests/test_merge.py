@@ -0,0 +1,64 @@
+import wanchai_core
+from conftest import BASE, OURS, THEIRS
+from wanchai_merge import (
+    BOTH_CHANGED,
+    DELETED_BY_OURS,
+    DELETED_BY_THEIRS,
+    ThreeWayMerge,
+    merge_documents,
+)
+
+
+def _summary(doc, sku):
+    low = doc.test_columns.index("LowLimit")
+    return [(row[0], row[2], row[low]) for row in doc.rows(sku)]
+
+
+def test_three_way_merge(write_ini):
+    base = wanchai_core.load(write_ini("base.ini", BASE))
+    ours = wanchai_core.load(write_ini("ours.ini", OURS, date="d1"))
+    theirs = wanchai_core.load(write_ini("theirs.ini", THEIRS, date="d2"))
+    conflicts = merge_documents(base, ours, theirs)
+    assert [(c.kind, c.sku, c.test_id) for c in conflicts] == [
+        (BOTH_CHANGED, "S1", "A3"),
+        (DELETED_BY_THEIRS, "S4", None),
+        (DELETED_BY_OURS, "S3", None),
+    ]
+    assert conflicts[0].fields == [("LowLimit", "3", "30", "33")]
+    assert ours.sku_list == ["S1", "S5", "S4"]
+    assert _summary(ours, "S1") == [
+        ("1", "A1", "10"),
+        ("2", "AO", "0"),
+        ("3", "A2", "20"),
+        ("4", "A3", "30"),
+        ("5", "AT", "7"),
+    ]
+    # 导出时间两边都改过，保留 ours，不算冲突
+    assert ours.info["Export Date"] == "d1"
+
+
+def test_take_theirs(write_ini):
+    base = wanchai_core.load(write_ini("base.ini", BASE))
+    ours = wanchai_core.load(write_ini("ours.ini", OURS))
+    theirs = wanchai_core.load(write_ini("theirs.ini", THEIRS))
+    merge = ThreeWayMerge(base, ours, theirs)
+    conflicts = merge.merge()
+    assert all(merge.take_theirs(c) for c in conflicts)
+    assert not merge.take_theirs(conflicts[0])
+    assert _summary(ours, "S1")[3] == ("4", "A3", "33")
+    assert ours.sku_list == ["S1", "S5", "S3"]
+
+
+def test_one_sided_merge_reproduces_the_changed_side(write_ini, tmp_path):
+    base_path = write_ini("base.ini", BASE)
+    theirs_path = write_ini("theirs.ini", THEIRS)
+    for ours_path, expected in ((base_path, theirs_path), (theirs_path, theirs_path)):
+        ours = wanchai_core.load(ours_path)
+        conflicts = merge_documents(
+            wanchai_core.load(base_path), ours, wanchai_core.load(theirs_path)
+        )
+        assert conflicts == []
+        out = str(tmp_path / "merged.ini")
+        wanchai_core.dump(ours, out)
+        with open(out, "rb") as a, open(expected, "rb") as b:
+            assert a.read() == b.read()
@@ -0,0 +1,171 @@
+import random
+
+import pytest
+
+import wanchai_core
+from conftest import HEADER
+from wanchai_parser import (
+    TOKEN_COUNT,
+    TOKEN_END,
+    TOKEN_INFO,
+    TOKEN_ITEM,
+    TOKEN_SECTION,
+    split_values,
+    split_values_many,
+    tokenize,
+)
+
+
+def reference_split(values_str):
+    """改为批量分割之前的逐字符实现，作为 split_values 的对照"""
+    values = []
+    current = ""
+    in_quotes = False
+    for char in values_str:
+        if char == "'":
+            in_quotes = not in_quotes
+            current += char
+        elif char == "," and not in_quotes:
+            values.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current:
+        values.append(current.strip())
+    result = []
+    for v in values:
+        v = v.strip()
+        if len(v) >= 2 and v[0] == "'" and v[-1] == "'":
+            v = v[1:-1]
+        result.append(v)
+    return result
+
+
+EDGE_CASES = [
+    "",
+    ",",
+    ",,",
+    "a",
+    "a,",
+    ",a",
+    "'a','b'",
+    "'a,b',c",
+    "'it''s'",
+    "'it''s',x",
+    "''",
+    "'',''",
+    "'','',",
+    "'",
+    "'a",
+    "a'",
+    "'a,b",
+    "a,'b,c",
+    " 'a' , 'b' ",
+    "\t'a'\t,\tb",
+    "'a' 'b',c",
+    "'a'b,c",
+    "a'b'c,d",
+    "'''',x",
+    "'a,''b''',c",
+    "1,'x,y',  3  ,",
+    "'38599-000-889','RF_500','Name',1,'SL','-0.67','7.62','3','dB','UC, Link'",
+    "'a\nb',c",
+    "\x00,'\x01',\x02",
+]
+
+
+@pytest.mark.parametrize("values_str", EDGE_CASES)
+def test_split_values_matches_reference_on_edge_cases(values_str):
+    assert split_values(values_str) == reference_split(values_str)
+
+
+def _random_values_str(rng):
+    alphabet = ["'", "'", ",", ",", " ", "\t", "a", "b", "1", "-", "''", "\x00"]
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 16)))
+
+
+def test_split_values_fuzz():
+    rng = random.Random(3)
+    for _ in range(50000):
+        values_str = _random_values_str(rng)
+        assert split_values(values_str) == reference_split(values_str), values_str
+
+
+def test_split_values_many_fuzz():
+    rng = random.Random(4)
+    common = "'38599-000-889','RF_500','Name, x',1,'SL','-0.67','7.62','3','dB','it''s'"
+    for _ in range(3000):
+        batch = [
+            common if rng.random() < 0.7 else _random_values_str(rng)
+            for _ in range(rng.randint(0, 8))
+        ]
+        assert split_values_many(batch) == [reference_split(s) for s in batch], batch
+
+
+def test_split_values_many_fast_path_batch():
+    rows = [
+        f"'SKU','T{i}','d, {i}',{i % 2},'','{i}','{i * 2}','GELE','V','p=1'"
+        for i in range(2000)
+    ]
+    assert split_values_many(rows) == [reference_split(s) for s in rows]
+
+
+def test_tokenize_streams_sections_info_and_items():
+    lines = [
+        "; comment before any section\r\n",
+        "[Info]\r\n",
+        "UnitCount= 2 \r\n",
+        "Export Date=2025/7/14 8:55:56\r\n",
+        "\r\n",
+        "[38599-000-889]\n",
+        "Count=2\n",
+        f"1=({HEADER}) VALUES ('a','b')\n",
+        f"2=({HEADER})\n",
+        "  VALUES ('c','d')\n",
+        "[not a section\n",
+        "[]\n",
+    ]
+    assert list(tokenize(iter(lines))) == [
+        (TOKEN_SECTION, "Info"),
+        (TOKEN_INFO, "UnitCount", "2"),
+        (TOKEN_INFO, "Export Date", "2025/7/14 8:55:56"),
+        (TOKEN_END,),
+        (TOKEN_SECTION, "38599-000-889"),
+        (TOKEN_COUNT, "2"),
+        (TOKEN_ITEM, "1", HEADER, "'a','b'"),
+        # 跨行的 test item 拼成一条
+        (TOKEN_ITEM, "2", HEADER, "'c','d'"),
+        (TOKEN_END,),
+    ]
+
+
+def test_parse_clipboard_reports_skipped_lines():
+    good = wanchai_core.format_clipboard(
+        [["7", "S", "T1", "N", "1", "SL", "0", "1", "3", "dB", "x,y"]]
+    )
+    short = f"8=({HEADER}) VALUES ('S','T2')"
+    skipped = []
+    rows = wanchai_core.parse_clipboard(
+        "\n".join([good, "hello", short]), skipped=skipped
+    )
+    assert rows == [["S", "T1", "N", "1", "SL", "0", "1", "3", "dB", "x,y"]]
+    assert skipped == ["hello", short]
+    assert wanchai_core.parse_clipboard("hello") == []
+
+
+def test_parse_clipboard_mixes_headers():
+    reordered = "TestID,Identifier,Description"
+    text = "\n".join(
+        [
+            f"1=({HEADER}) VALUES ('S','T1','N',1,'SL','0','1','3','dB','p')",
+            f"2=({reordered}) VALUES ('T2','S','a, b')",
+            f"3=({HEADER}) VALUES ('S','T3','N',0,'SL','','','3','V','')",
+        ]
+    )
+    rows = wanchai_core.parse_clipboard(text)
+    assert [row[:3] for row in rows] == [
+        ["S", "T1", "N"],
+        ["S", "T2", "a, b"],
+        ["S", "T3", "N"],
+    ]
+    assert rows[1][3:] == [""] * 7
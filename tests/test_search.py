@@ -0,0 +1,234 @@
+import sqlite3
+
+import pytest
+
+import wanchai_batch
+import wanchai_core
+import wanchai_fleet
+import wanchai_search
+from conftest import random_skus
+from wanchai_search import (
+    IncrementalSearch,
+    QueryError,
+    compile_query,
+    compile_sql,
+    quote_identifier,
+    register_sql_functions,
+    search_all_skus,
+)
+
+
+def test_incremental_search_narrows_the_previous_result(write_ini, monkeypatch):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus()))
+    a, b = doc.sku_list[:2]
+    searched = []
+    filter_rows = doc.filter_rows
+
+    def spy(sku, term="", rows=None):
+        searched.append(None if rows is None else len(rows))
+        return filter_rows(sku, term, rows)
+
+    monkeypatch.setattr(doc, "filter_rows", spy)
+    search = IncrementalSearch()
+    narrowed = search.filter(doc, a, "rf")
+    assert search.filter(doc, a, "RF_1") == filter_rows(a, "rf_1")
+    assert searched == [None, len(narrowed)]
+    # 换 SKU、搜索词不再包含上一次的词、或文档被修改后都重新在整个 SKU 中查找
+    search.filter(doc, b, "rf_1")
+    search.filter(doc, b, "aud")
+    row = doc.rows(b)[0]
+    doc.set_field([row], doc.test_columns.index("TestID"), "AUD_x")
+    assert row in search.filter(doc, b, "aud_x")
+    assert searched[2:] == [None, None, None]
+
+
+def test_incremental_search_compiles_a_query_once(write_ini, monkeypatch):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus()))
+    search = IncrementalSearch()
+    text = "TestID:RF_* LowLimit<20"
+    expected = search.filter(doc, doc.sku_list[0], text)
+    assert expected and all(row[2].startswith("RF_") for row in expected)
+    monkeypatch.setattr(wanchai_search, "compile_query", None)
+    assert search.filter(doc, doc.sku_list[0], text) == expected
+    assert search.filter(doc, doc.sku_list[1], text)
+
+
+EXTRA_HEADER = (
+    "Identifier,TestID,Description,Enabled,StringLimit,"
+    "LowLimit,HighLimit,LimitType,Unit,Parameters,Extra"
+)
+# (TestID, LowLimit, HighLimit, Unit, Extra)；B 区块没有 Extra 列
+ITEMS = {
+    "A": [
+        ("T1", "nan", "nan", "dB", "e"),
+        ("T2", "inf", "1e400", "DB", ""),
+        ("t3", "-inf", "5", "V", "E"),
+        ("T4", "1.0", "1", "", "x y"),
+        ("T5", "abc", "ABC", "dB", "nan"),
+        ("T6", "", "", "V", "5"),
+    ],
+    "B": [
+        ("T1", "NaN", "2", "dB", None),
+        ("T7", "3", "-2.5", "e", None),
+        ("T8", "Infinity", "inf", "V", None),
+    ],
+}
+QUERIES = [
+    "LowLimit=nan",
+    "LowLimit!=nan",
+    "LowLimit=NAN HighLimit=nan",
+    "LowLimit=inf",
+    "LowLimit=Infinity",
+    "HighLimit=inf",
+    "LowLimit>5",
+    "LowLimit<=-inf",
+    "LowLimit>=-inf",
+    "HighLimit!=1",
+    "LowLimit=HighLimit",
+    "LowLimit!=HighLimit",
+    "LowLimit>HighLimit",
+    "Extra=",
+    'Extra=""',
+    "Extra!=e",
+    "Extra!=",
+    "Extra=Unit",
+    "Extra!=Unit",
+    "Extra:",
+    "Extra:*",
+    "Extra:?",
+    "Extra~^$",
+    "Extra=5",
+    "Extra>4",
+    "Unit=db",
+    "Unit!=DB",
+    "TestID:t*",
+    "TestID=T1 OR Extra=E",
+    "nan",
+    "e",
+    '"x y"',
+    "x y",
+    "X",
+    " ",
+    "AND",
+    "OR e",
+    "/^in/",
+]
+
+
+def _corpus(write_ini):
+    blocks = ["[Info]\nUnitCount=1\nExport Date=x"]
+    for sku, items in ITEMS.items():
+        lines = [f"[{sku}]", f"Count={len(items)}"]
+        for i, (test_id, low, high, unit, extra) in enumerate(items, 1):
+            values = f"'{sku}','{test_id}','N',1,'SL','{low}','{high}','3','{unit}','p'"
+            if extra is None:
+                header = EXTRA_HEADER.rsplit(",", 1)[0]
+            else:
+                header = EXTRA_HEADER
+                values += f",'{extra}'"
+            lines.append(f"{i}=({header}) VALUES ({values})")
+        blocks.append("\n".join(lines))
+    return write_ini("corpus.ini", "\n\n".join(blocks))
+
+
+def _memory(doc, text):
+    return [(row.sku, row[0]) for row in wanchai_batch.select_rows(doc, text)]
+
+
+def _null_table(doc):
+    """把文档的行放进内存中的 SQLite 表，空值存为 NULL"""
+    conn = sqlite3.connect(":memory:")
+    register_sql_functions(conn)
+    columns = ["SKU"] + doc.test_columns
+    conn.execute(f"CREATE TABLE t ({', '.join(map(quote_identifier, columns))})")
+    marks = ", ".join("?" * len(columns))
+    conn.executemany(
+        f"INSERT INTO t VALUES ({marks})",
+        [[row.sku] + [v or None for v in row] for row in doc.all_rows()],
+    )
+    return conn
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_sql_matches_in_memory_query(write_ini, tmp_path, text):
+    path = _corpus(write_ini)
+    doc = wanchai_core.load(path)
+    expected = _memory(doc, text)
+    db = str(tmp_path / "fleet.db")
+    wanchai_fleet.index(db, [path], jobs=1)
+    _, rows = wanchai_fleet.query(db, text, ["Index"])
+    assert [(sku, index) for _, sku, index in rows] == expected
+    conn = _null_table(doc)
+    where, params = compile_sql(text, doc.test_columns)
+    rows = conn.execute(f'SELECT SKU, "Index" FROM t WHERE {where}', params)
+    assert rows.fetchall() == expected
+
+
+def test_sql_and_memory_reject_the_same_numbers(write_ini):
+    doc = wanchai_core.load(_corpus(write_ini))
+    for text in ("LowLimit>nan", "LowLimit<abc"):
+        with pytest.raises(QueryError):
+            wanchai_batch.select_rows(doc, text)
+        with pytest.raises(QueryError):
+            compile_sql(text, doc.test_columns)
+
+
+@pytest.mark.parametrize(
+    "text", QUERIES + ["Identifier=A", "Identifier:b", "Identifier!=a Unit=dB"]
+)
+def test_indexed_query_matches_row_scan(write_ini, monkeypatch, text):
+    monkeypatch.setattr(wanchai_search, "INDEX_MIN_ROWS", 0)
+    doc = wanchai_core.load(_corpus(write_ini))
+    doc.parse_all()
+    rows = doc.all_rows()
+    query = compile_query(text, doc.test_columns)
+    if query is None:
+        term = text.lower()
+        assert doc.filter_rows(None, term, rows) == [r for r in rows if r.matches(term)]
+        return
+    assert query.filter(rows, doc) == query.filter(rows)
+    # 有首尾带空白的值的列不能按索引的键判断，改为逐行判断
+    for col in range(2, len(doc.test_columns)):
+        doc.set_field(rows[:1], col, f" {rows[0][col]} ")
+    assert query.filter(rows, doc) == query.filter(rows)
+
+
+def test_large_queries_use_the_value_index(write_ini, monkeypatch):
+    monkeypatch.setattr(wanchai_search, "INDEX_MIN_ROWS", 0)
+    doc = wanchai_core.load(_corpus(write_ini))
+    rows = doc.rows("A")
+    query = compile_query("Unit=db", doc.test_columns)
+    # 还有没解析的区块时不为搜索建立索引
+    assert query.filter(rows, doc) == query.filter(rows)
+    assert doc.search_index() is None
+    doc.parse_all()
+    selected = []
+    select_uids = doc.select_uids
+    monkeypatch.setattr(
+        doc, "select_uids", lambda *args: selected.append(args) or select_uids(*args)
+    )
+    assert [row[2] for row in query.filter(rows, doc)] == ["T1", "T2", "T5"]
+    assert len(selected) == 1
+
+
+@pytest.mark.parametrize("text", ["rf_1", "TestID:RF_1* OR Unit=V", "LowLimit>38"])
+def test_search_all_skus_groups_hits_by_sku(write_ini, text):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus()))
+    search = IncrementalSearch()
+    expected = [(sku, search.filter(doc, sku, text)) for sku in doc.sku_list]
+    results = search_all_skus(doc, text)
+    assert results == [(sku, rows) for sku, rows in expected if rows]
+    assert all(row.sku == sku for sku, rows in results for row in rows)
+
+
+def test_search_all_skus_reports_errors(write_ini):
+    path = write_ini("a.ini", random_skus())
+    doc = wanchai_core.load(path)
+    # 还没解析的区块在原文件中被改掉了
+    write_ini("a.ini", random_skus(seed=1))
+    with pytest.raises(wanchai_core.SourceChanged):
+        search_all_skus(doc, "rf")
+    doc = wanchai_core.load(path)
+    with pytest.raises(QueryError):
+        search_all_skus(doc, "LowLimit>x")
+    assert search_all_skus(doc, "no such text") == []
@@ -0,0 +1,151 @@
+import http.client
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import wanchai_server
+from conftest import random_skus
+
+
+def _post(store, route, **params):
+    return store.handle("POST", route, json.dumps(params).encode("utf-8"))
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"where": 5}, {"where": ["TestID"]}, {"columns": "TestID"}, {"sku": 1}],
+)
+def test_query_rejects_bad_parameters(write_ini, params):
+    store = wanchai_server.DocumentStore()
+    path = write_ini("a.ini", random_skus())
+    status, payload = _post(store, "/query", path=path, **params)
+    assert status == 400, payload
+
+
+def test_query_and_edit(write_ini):
+    store = wanchai_server.DocumentStore()
+    path = write_ini("a.ini", [("S1", [("A", "1"), ("B", "2")])])
+    operations = [
+        {"op": "set_field", "where": "TestID:A", "field": "LowLimit", "value": 7}
+    ]
+    status, payload = _post(store, "/edit", path=path, operations=operations)
+    assert (status, payload["changes"]) == (200, [("set_field", 1)])
+    status, payload = _post(
+        store, "/query", path=path, where={"TestID": "A"}, columns=["LowLimit"]
+    )
+    assert payload["rows"] == [{"LowLimit": "7", "SKU": "S1"}]
+
+
+def test_export_stays_in_the_files_directory(write_ini, tmp_path):
+    path = write_ini("a.ini", random_skus())
+    outside = tmp_path / "elsewhere"
+    outside.mkdir()
+    store = wanchai_server.DocumentStore()
+    status, _ = _post(store, "/export", path=path, output=str(outside / "x.ini"))
+    assert status == 403
+    status, _ = _post(store, "/export", path=path, output=str(tmp_path / "copy.ini"))
+    assert status == 200
+    assert os.path.exists(str(tmp_path / "copy.ini"))
+    store = wanchai_server.DocumentStore(allow_any_output=True)
+    status, _ = _post(store, "/export", path=path, output=str(outside / "x.ini"))
+    assert status == 200
+
+
+def test_concurrent_opens_load_the_file_once(write_ini, monkeypatch):
+    store = wanchai_server.DocumentStore()
+    path = write_ini("a.ini", random_skus())
+    loads = []
+    load = wanchai_server.wanchai_core.load
+
+    def slow_load(*args, **kwargs):
+        loads.append(args[0])
+        time.sleep(0.05)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(wanchai_server.wanchai_core, "load", slow_load)
+    opened = []
+    threads = [
+        threading.Thread(target=lambda: opened.append(store.open(path)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len(opened) == 4 and all(o is opened[0] for o in opened)
+
+
+def test_reload_keeps_unexported_edits_unless_forced(write_ini):
+    store = wanchai_server.DocumentStore()
+    path = write_ini("a.ini", [("S1", [("A", "1")])])
+    edit = [
+        {"op": "set_field", "where": {"TestID": "A"}, "field": "LowLimit", "value": 7}
+    ]
+    assert _post(store, "/edit", path=path, operations=edit)[0] == 200
+    status, payload = _post(store, "/open", path=path, reload=True)
+    assert status == 409, payload
+    assert _post(store, "/export", path=path)[0] == 200
+    assert _post(store, "/open", path=path, reload=True)[0] == 200
+    edit[0]["value"] = 8
+    _post(store, "/edit", path=path, operations=edit)
+    assert _post(store, "/open", path=path, reload=True, force=True)[0] == 200
+    _, payload = _post(store, "/query", path=path, columns=["LowLimit"])
+    assert payload["rows"] == [{"LowLimit": "7", "SKU": "S1"}]
+
+
+@pytest.fixture
+def server():
+    server = wanchai_server.DocumentServer(wanchai_server.DocumentStore(), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(wanchai_server.LOCALHOST, server.server_port)
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+def test_server_checks_host_and_content_type(server, write_ini):
+    body = json.dumps({"path": write_ini("a.ini", random_skus())})
+    json_type = {"Content-Type": "application/json; charset=utf-8"}
+    assert _request(server, "POST", "/open", body, json_type)[0] == 200
+    assert _request(server, "GET", "/files")[0] == 200
+    text_plain = {"Content-Type": "text/plain"}
+    assert _request(server, "POST", "/open", body, text_plain)[0] == 415
+    assert _request(server, "POST", "/open", body)[0] == 415
+    for host in (f"evil.example:{server.server_port}", "localhost.evil.example"):
+        status, _ = _request(server, "GET", "/files", headers={"Host": host})
+        assert status == 403
+    localhost = dict(json_type, Host=f"localhost:{server.server_port}")
+    assert _request(server, "POST", "/open", body, localhost)[0] == 200
+
+
+@pytest.mark.parametrize(
+    "length, expected",
+    [("abc", 400), ("-1", 400), ("1e3", 400), (str(1 << 40), 413)],
+)
+def test_server_rejects_bad_content_length(server, length, expected):
+    conn = http.client.HTTPConnection(wanchai_server.LOCALHOST, server.server_port)
+    try:
+        conn.putrequest("POST", "/open")
+        conn.putheader("Content-Type", "application/json")
+        conn.putheader("Content-Length", length)
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == expected
+        assert response.getheader("Connection") == "close"
+        assert "error" in json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
@@ -0,0 +1,56 @@
+import wanchai_core
+from conftest import random_skus
+from wanchai_view import RowWindow
+
+
+def _rows(write_ini, items=100):
+    doc = wanchai_core.load(write_ini("a.ini", random_skus(sku_count=1, items=items)))
+    return doc.rows(doc.sku_list[0])
+
+
+def test_window_is_clamped_and_keeps_position_for_the_same_key(write_ini):
+    rows = _rows(write_ini)
+    view = RowWindow()
+    view.set_rows(rows, ("A", ""))
+    view.moveto(0.5)
+    assert view.window(10, 5) == rows[50:65]
+    assert view.fractions(10) == (0.5, 0.6)
+    # 同一 SKU 和搜索词（如编辑后刷新）保持滚动位置，换了就回到顶部
+    view.set_rows(rows, ("A", ""))
+    assert view.window(10)[0] is rows[50]
+    view.top = 500
+    assert view.window(10) == rows[90:]
+    view.set_rows(rows[:3], ("A", "x"))
+    assert view.window(10) == rows[:3] and view.fractions(10) == (0.0, 1.0)
+    view.set_rows([])
+    assert view.window(10) == [] and view.fractions(10) == (0.0, 1.0)
+
+
+def test_selection_survives_scrolling(write_ini):
+    rows = _rows(write_ini)
+    view = RowWindow()
+    view.set_rows(rows, ("A", ""))
+    shown = [row.uid for row in view.window(10)]
+    view.sync_selection(shown, shown[2:4])
+    view.anchor = 2
+    view.top = 40
+    shown = [row.uid for row in view.window(10)]
+    view.sync_selection(shown, [shown[0]])
+    assert view.selected_uids() == [rows[2].uid, rows[3].uid, rows[40].uid]
+    # Shift 多选跨越可见窗口
+    view.select_range(45)
+    assert view.selected_uids() == [row.uid for row in rows[2:46]]
+
+
+def test_move_and_reveal_scroll_the_selection_into_view(write_ini):
+    rows = _rows(write_ini)
+    view = RowWindow()
+    assert view.move(1, 10) is None
+    view.set_rows(rows, ("A", ""))
+    assert view.move(1, 10) == rows[0].uid
+    assert view.move(10, 10) == rows[10].uid and view.top == 1
+    assert view.move(1000, 10) == rows[99].uid and view.top == 90
+    assert view.move(-95, 10) == rows[4].uid and view.top == 4
+    assert view.reveal(rows[60], 10) and view.top == 55
+    assert view.selected_uids() == [rows[60].uid] and view.anchor == 60
+    assert not view.reveal(_rows(write_ini, 1)[0], 10)
@@ -0,0 +1,299 @@
+import argparse
+import sqlite3
+import sys
+import time
+
+import wanchai_batch
+import wanchai_core
+import wanchai_diff
+import wanchai_fleet
+import wanchai_merge
+import wanchai_server
+from wanchai_cache import ParseCache
+from wanchai_search import QueryError
+
+
+def cmd_apply(args):
+    """对多个 INI 文件执行 JSON 编辑脚本，逐个输出摘要"""
+    try:
+        operations = wanchai_batch.load_script(args.script)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    paths = wanchai_batch.expand_paths(args.files)
+    if not paths:
+        print("Error: no INI files matched", file=sys.stderr)
+        return 2
+    output_dir = None if args.in_place or args.dry_run else args.output_dir
+    start = time.perf_counter()
+    failed = 0
+    try:
+        summaries = wanchai_batch.run(
+            paths, operations, output_dir, args.in_place, jobs=args.jobs
+        )
+        for summary in summaries:
+            print(wanchai_batch.format_summary(summary))
+            failed += not summary["ok"]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths)} file(s), {failed} failed, {elapsed:.2f}s")
+    return 1 if failed else 0
+
+
+def _parse_cache(args):
+    """--no-cache 时不读写 ~/.wanchai-editor/cache 中的解析缓存"""
+    return None if args.no_cache else ParseCache()
+
+
+def cmd_serve(args):
+    """在本机启动 JSON-over-HTTP 服务，直到 Ctrl+C"""
+    store = wanchai_server.DocumentStore(
+        cache=_parse_cache(args), allow_any_output=args.allow_any_output
+    )
+    for path in wanchai_batch.expand_paths(args.files):
+        try:
+            opened = store.open(path)
+        except (OSError, ValueError, wanchai_core.SourceChanged) as e:
+            print(f"Error: failed to open {path}: {e}", file=sys.stderr)
+            return 2
+        print(f"Loaded {opened.path} ({len(opened.doc.sku_list)} SKU(s))")
+    try:
+        server = wanchai_server.DocumentServer(
+            store, args.port, args.workers, verbose=args.verbose
+        )
+    except OSError as e:
+        print(f"Error: cannot listen on port {args.port}: {e}", file=sys.stderr)
+        return 2
+    print(f"Serving on http://{wanchai_server.LOCALHOST}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def cmd_index(args):
+    """把 INI 文件增量索引到 SQLite 数据库"""
+    paths = wanchai_batch.expand_paths(args.files)
+
+    def progress(summary):
+        if summary["status"] == "failed":
+            print(f"{summary['path']}: FAILED {summary['error']}")
+        elif summary["status"] == "indexed" or args.verbose:
+            print(f"{summary['path']}: {summary['status']} ({summary['rows']} items)")
+
+    start = time.perf_counter()
+    try:
+        totals = wanchai_fleet.index(
+            args.database, paths, jobs=args.jobs, prune=args.prune, progress=progress
+        )
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+    print(
+        f"{totals['indexed']} indexed, {totals['unchanged']} unchanged, "
+        f"{totals['failed']} failed, {totals['removed']} removed, {elapsed:.2f}s"
+    )
+    return 1 if totals["failed"] else 0
+
+
+def cmd_query(args):
+    """在 SQLite 索引中按查询语法查找，输出制表符分隔的结果"""
+    try:
+        if args.summary:
+            header = ["File", "SKU", "Items"]
+            rows = wanchai_fleet.summarize(args.database, args.query)
+        else:
+            header, rows = wanchai_fleet.query(
+                args.database, args.query, args.columns, args.limit
+            )
+    except (QueryError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print("\t".join(header))
+    for row in rows:
+        print("\t".join(map(str, row)))
+    return 0
+
+
+def cmd_diff(args):
+    """按 SKU 和 TestID 比较两个 INI 文件；有差异时返回 1"""
+    cache = _parse_cache(args)
+    try:
+        old_doc = wanchai_core.load(args.old, cache=cache)
+        new_doc = wanchai_core.load(args.new, cache=cache)
+        info_changes = wanchai_diff.diff_info(old_doc, new_doc)
+        sku_diffs = wanchai_diff.diff_documents(old_doc, new_doc)
+    except (OSError, ValueError, wanchai_core.SourceChanged) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for line in wanchai_diff.format_diff(sku_diffs, info_changes):
+        if not (args.summary and line.startswith(" ")):
+            print(line)
+    return 1 if sku_diffs or info_changes else 0
+
+
+def cmd_merge(args):
+    """三方合并：把 THEIRS 相对 BASE 的修改合并进 OURS 并写出；有冲突时返回 1"""
+    cache = _parse_cache(args)
+    try:
+        base = wanchai_core.load(args.base, cache=cache)
+        ours = wanchai_core.load(args.ours, cache=cache)
+        theirs = wanchai_core.load(args.theirs, cache=cache)
+        conflicts = wanchai_merge.merge_documents(base, ours, theirs)
+        wanchai_core.dump(ours, args.output)
+    except (OSError, ValueError, wanchai_core.SourceChanged) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for line in wanchai_merge.format_conflicts(conflicts):
+        print(line)
+    kept = " (ours kept)" if conflicts else ""
+    print(f"{len(conflicts)} conflict(s){kept}, written to {args.output}")
+    return 1 if conflicts else 0
+
+
+def _add_no_cache(parser):
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not read or write the parse cache in ~/.wanchai-editor/cache",
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="wanchai-cli", description="Headless tools for WanChai INI files"
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    apply_parser = commands.add_parser(
+        "apply", help="apply a JSON edit script to many INI files"
+    )
+    apply_parser.add_argument("script", help="JSON file with the list of operations")
+    apply_parser.add_argument(
+        "files", nargs="+", help="INI files, directories or glob patterns (** allowed)"
+    )
+    target = apply_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--in-place", action="store_true", help="overwrite the input files"
+    )
+    target.add_argument(
+        "-o", "--output-dir", help="write the edited files into this directory"
+    )
+    target.add_argument(
+        "--dry-run", action="store_true", help="only report what would change"
+    )
+    apply_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per CPU)",
+    )
+    apply_parser.set_defaults(func=cmd_apply)
+
+    serve_parser = commands.add_parser(
+        "serve", help="serve INI files as JSON over HTTP on localhost"
+    )
+    serve_parser.add_argument(
+        "files", nargs="*", help="INI files, directories or glob patterns to preload"
+    )
+    serve_parser.add_argument(
+        "-p", "--port", type=int, default=wanchai_server.DEFAULT_PORT
+    )
+    serve_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=wanchai_server.DEFAULT_WORKERS,
+        help="number of connections served at the same time",
+    )
+    serve_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log every request"
+    )
+    serve_parser.add_argument(
+        "--allow-any-output",
+        action="store_true",
+        help="let /export write outside the directory of the exported file",
+    )
+    _add_no_cache(serve_parser)
+    serve_parser.set_defaults(func=cmd_serve)
+
+    index_parser = commands.add_parser(
+        "index", help="index INI files into a SQLite database (incremental)"
+    )
+    index_parser.add_argument("database", help="SQLite database file")
+    index_parser.add_argument(
+        "files", nargs="+", help="INI files, directories or glob patterns (** allowed)"
+    )
+    index_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per CPU)",
+    )
+    index_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="drop indexed files that no longer exist",
+    )
+    index_parser.add_argument(
+        "-v", "--verbose", action="store_true", help="also list unchanged files"
+    )
+    index_parser.set_defaults(func=cmd_index)
+
+    query_parser = commands.add_parser(
+        "query", help="search a SQLite index with the search box syntax"
+    )
+    query_parser.add_argument("database", help="SQLite database file")
+    query_parser.add_argument(
+        "query", nargs="?", default="", help='e.g. "TestID=RF_500 HighLimit>5"'
+    )
+    query_parser.add_argument(
+        "-c", "--columns", nargs="+", help="columns to show (default: all)"
+    )
+    query_parser.add_argument("-n", "--limit", type=int, help="maximum number of rows")
+    query_parser.add_argument(
+        "-s",
+        "--summary",
+        action="store_true",
+        help="only count matching items per file and SKU",
+    )
+    query_parser.set_defaults(func=cmd_query)
+
+    diff_parser = commands.add_parser(
+        "diff", help="compare two INI files by SKU and TestID"
+    )
+    diff_parser.add_argument("old", help="previous INI file")
+    diff_parser.add_argument("new", help="new INI file")
+    diff_parser.add_argument(
+        "-s", "--summary", action="store_true", help="only show one line per SKU"
+    )
+    _add_no_cache(diff_parser)
+    diff_parser.set_defaults(func=cmd_diff)
+
+    merge_parser = commands.add_parser(
+        "merge", help="three-way merge of INI files by SKU and TestID"
+    )
+    merge_parser.add_argument("base", help="common ancestor INI file")
+    merge_parser.add_argument("ours", help="our edited INI file")
+    merge_parser.add_argument("theirs", help="their edited INI file")
+    merge_parser.add_argument(
+        "-o", "--output", required=True, help="where to write the merged file"
+    )
+    _add_no_cache(merge_parser)
+    merge_parser.set_defaults(func=cmd_merge)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
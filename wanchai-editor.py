@@ -1,10 +1,28 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import configparser
 import os
-from datetime import datetime
+import queue
 import re
 from tkinterdnd2 import DND_FILES, TkinterDnD
+import wanchai_core
+from wanchai_core import (
+    APPLY_ALL,
+    APPLY_ALL_BY_FIELD,
+    APPLY_CURRENT,
+    APPLY_SKU_BY_FIELD,
+    APPLY_SKU_ONLY,
+    SourceChanged,
+    WanchaiDocument,
+    format_clipboard,
+    format_export_date,
+    parse_clipboard,
+)
+from wanchai_cache import ParseCache
+from wanchai_diff import CHANGED, REMOVED, diff_documents, diff_info
+from wanchai_merge import DELETED_BY_OURS, ThreeWayMerge
+from wanchai_jobs import LoadJob, ParseJob
+from wanchai_search import IncrementalSearch, QueryError, search_all_skus
+from wanchai_view import RowWindow
 
 
 def get_version():
@@ -35,6 +53,21 @@ LABEL_FONT = ("Segoe UI", 11)
 TITLE_FONT = ("Arial", 16, "bold")
 BUTTON_FONT = ("Segoe UI", 11, "bold")
 TREE_FONT = ("Segoe UI", 10)
+TREE_ROW_HEIGHT = 28
+# 虚拟滚动时在可见窗口之外多放入 Treeview 的行数
+TREE_OVERSCAN = 5
+# 搜索框停止输入多少毫秒后才刷新
+SEARCH_DEBOUNCE_MS = 250
+# 编辑对话框停止输入多少毫秒后才重新计算会修改的行数
+PREVIEW_DEBOUNCE_MS = 300
+# 跨 SKU 搜索结果中每个 SKU 最多列出的命中行数
+SEARCH_ALL_MAX_HITS = 1000
+# 比较结果中每个 SKU 最多列出的差异行数
+COMPARE_MAX_ITEMS = 1000
+# 后台加载时界面轮询进度的间隔（毫秒）
+LOAD_POLL_MS = 100
+# 解析缓存目录的大小上限（字节），超过时删除最久没用的缓存
+PARSE_CACHE_MAX_BYTES = 256 << 20
 SPLASH_TITLE_FONT = ("Segoe UI", 20, "bold")
 SPLASH_SUB_FONT = ("Segoe UI", 12)
 SPLASH_FG = PRIMARY_COLOR
@@ -84,7 +117,7 @@ class WanchaiEditor:
         style.configure(
             "Treeview",
             font=TREE_FONT,
-            rowheight=28,
+            rowheight=TREE_ROW_HEIGHT,
             fieldbackground=TREE_BG_COLOR,
             background=TREE_BG_COLOR,
             borderwidth=0,
@@ -115,7 +148,16 @@ class WanchaiEditor:
         style.map("TNotebook.Tab", background=[("selected", TREE_HEADER_BG)])
         # 文件路径
         self.ini_file = ""
-        self.config = configparser.ConfigParser()
+        # 文档模型（解析、存储、SKU 操作都在 wanchai_core 中）
+        self.doc = WanchaiDocument()
+        # 正在进行的后台加载
+        self._load_job = None
+        # 正在后台解析的 SKU 区块、等它解析完才能显示的 SKU、解析失败的 (doc, SKU)
+        self._parse_job = None
+        self._reading_sku = None
+        self._parse_failed = None
+        # 解析结果缓存，重复打开同一文件时不必重新解析
+        self.parse_cache = ParseCache(max_bytes=PARSE_CACHE_MAX_BYTES)
         # 创建主框架
         self.create_widgets()
         # 拖入文件支持
@@ -241,6 +283,30 @@ class WanchaiEditor:
         )
         # initialize button
         initialize_btn.grid(row=0, column=5, padx=(2, 0))
+        # compare button
+        compare_btn = ttk.Button(
+            file_frame, text="Compare", command=self.compare_with_file
+        )
+        compare_btn.grid(row=0, column=6, padx=(10, 0))
+        # merge button
+        merge_btn = ttk.Button(file_frame, text="Merge", command=self.merge_files)
+        merge_btn.grid(row=0, column=7, padx=(2, 0))
+        # 后台加载进度，加载时才显示
+        self.load_frame = ttk.Frame(file_frame)
+        self.load_frame.grid(row=1, column=0, columnspan=8, sticky="we", pady=(10, 0))
+        self.load_frame.columnconfigure(1, weight=1)
+        self.load_status_var = tk.StringVar()
+        ttk.Label(self.load_frame, textvariable=self.load_status_var).grid(
+            row=0, column=0, sticky=tk.W, padx=(0, 10)
+        )
+        self.load_progress = ttk.Progressbar(
+            self.load_frame, mode="determinate", maximum=100
+        )
+        self.load_progress.grid(row=0, column=1, sticky="we")
+        ttk.Button(self.load_frame, text="Cancel", command=self.cancel_load).grid(
+            row=0, column=2, padx=(10, 0)
+        )
+        self.load_frame.grid_remove()
 
         # SKU Operations 区块
         sku_ops_frame = ttk.LabelFrame(main_frame, text="SKU Operations", padding="10")
@@ -264,74 +330,37 @@ class WanchaiEditor:
         sku_suffix_entry.pack(side=tk.LEFT, padx=(10, 0))
 
         def add_suffix_to_skus():
+            if self._loading_blocked():
+                return
             suffix = self.sku_suffix_var.get()
             if not suffix:
                 messagebox.showwarning("Warning", "Suffix cannot be empty!")
                 return
-            # 更新 SKU 列表
-            new_sku_list = [sku + suffix for sku in self._sku_list]
-            sku_map = {old: new for old, new in zip(self._sku_list, new_sku_list)}
-            # 只修改 Identifier 字段和 SKU 名称，保留其它字段
-            columns = getattr(self, "_test_columns", None)
-            id_idx = (
-                columns.index("Identifier")
-                if columns and "Identifier" in columns
-                else 1
-            )
-            for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                new_sku = sku_map.get(sku, sku)
-                # 只改 Identifier 字段
-                row[id_idx] = new_sku
-                self._all_rows_with_sku[i] = (row, new_sku)
-            for i, row in enumerate(self._all_rows):
-                row[id_idx] = sku_map.get(row[id_idx], row[id_idx])
-            self._sku_list = new_sku_list
-            self.sku_combobox["values"] = self._sku_list
+            sku_map = self.doc.add_suffix_to_all(suffix)
+            self.sku_combobox["values"] = self.doc.sku_list
             # 当前选中SKU也同步
             if self.sku_var.get() in sku_map:
                 self.sku_var.set(sku_map[self.sku_var.get()])
-            # 保证 _all_rows_with_sku 的 sku 始终等于 row 的 Identifier 字段
-            self._all_rows_with_sku = [(row, row[id_idx]) for row in self._all_rows]
+            self.filter_tests()
+
+        def rename_current_sku(new_sku):
+            if self._loading_blocked():
+                return
+            sku = self.sku_var.get()
+            try:
+                self.doc.rename_sku(sku, new_sku)
+            except ValueError as e:
+                messagebox.showwarning("SKU Duplicate", str(e))
+                return
+            self.sku_combobox["values"] = self.doc.sku_list
+            self.sku_var.set(new_sku)
             self.filter_tests()
 
         def backspace_sku_suffix():
             sku = self.sku_var.get()
             if not sku or len(sku) <= 1:
                 return
-            new_sku = sku[:-1]
-            if new_sku in self._sku_list:
-                messagebox.showwarning(
-                    "SKU Duplicate",
-                    "Target SKU name is duplicated with another SKU, please check.",
-                )
-                return
-            # 1. 更新 sku_combobox 和 self._sku_list
-            sku_list = list(self.sku_combobox["values"])
-            if sku in sku_list:
-                idx = sku_list.index(sku)
-                sku_list[idx] = new_sku
-                self.sku_combobox["values"] = sku_list
-            if sku in self._sku_list:
-                idx = self._sku_list.index(sku)
-                self._sku_list[idx] = new_sku
-            self.sku_var.set(new_sku)
-            # 2. 只重命名所有属于该 SKU 的 test item，不做插入/append
-            columns = getattr(self, "_test_columns", None)
-            id_idx = (
-                columns.index("Identifier")
-                if columns and "Identifier" in columns
-                else 1
-            )
-            for i, (row, s) in enumerate(self._all_rows_with_sku):
-                if s == sku:
-                    row[id_idx] = new_sku
-                    self._all_rows_with_sku[i] = (row, new_sku)
-            for i, row in enumerate(self._all_rows):
-                if row[id_idx] == sku:
-                    row[id_idx] = new_sku
-            # 保证 _all_rows_with_sku 的 sku 始终等于 row 的 Identifier 字段
-            self._all_rows_with_sku = [(row, row[id_idx]) for row in self._all_rows]
-            self.renumber_index_for_current_sku()
+            rename_current_sku(sku[:-1])
 
         def add_suffix_to_current_sku():
             sku = self.sku_var.get()
@@ -339,40 +368,7 @@ class WanchaiEditor:
             if not sku or not suffix:
                 messagebox.showwarning("Warning", "SKU and Suffix cannot be empty!")
                 return
-            new_sku = sku + suffix
-            if new_sku in self._sku_list:
-                messagebox.showwarning(
-                    "SKU Duplicate",
-                    "Target SKU name is duplicated with another SKU, please check.",
-                )
-                return
-            # 更新 sku_combobox 和 self._sku_list
-            sku_list = list(self.sku_combobox["values"])
-            if sku in sku_list:
-                idx = sku_list.index(sku)
-                sku_list[idx] = new_sku
-                self.sku_combobox["values"] = sku_list
-            if sku in self._sku_list:
-                idx = self._sku_list.index(sku)
-                self._sku_list[idx] = new_sku
-            self.sku_var.set(new_sku)
-            # 重命名所有属于该 SKU 的 test item，只改 Identifier 字段
-            columns = getattr(self, "_test_columns", None)
-            id_idx = (
-                columns.index("Identifier")
-                if columns and "Identifier" in columns
-                else 1
-            )
-            for i, (row, s) in enumerate(self._all_rows_with_sku):
-                if s == sku:
-                    row[id_idx] = new_sku
-                    self._all_rows_with_sku[i] = (row, new_sku)
-            for i, row in enumerate(self._all_rows):
-                if row[id_idx] == sku:
-                    row[id_idx] = new_sku
-            # 保证 _all_rows_with_sku 的 sku 始终等于 row 的 Identifier 字段
-            self._all_rows_with_sku = [(row, row[id_idx]) for row in self._all_rows]
-            self.renumber_index_for_current_sku()
+            rename_current_sku(sku + suffix)
 
         add_suffix_to_current_btn = ttk.Button(
             sku_ops_frame,
@@ -413,7 +409,7 @@ class WanchaiEditor:
             )
             if idx > 0:
                 self.sku_var.set(sku_list[idx - 1])
-                self.renumber_index_for_current_sku()
+                self.filter_tests()
             else:
                 messagebox.showinfo("Info", "This is the first SKU!")
 
@@ -428,7 +424,7 @@ class WanchaiEditor:
             )
             if 0 <= idx < len(sku_list) - 1:
                 self.sku_var.set(sku_list[idx + 1])
-                self.renumber_index_for_current_sku()
+                self.filter_tests()
             else:
                 messagebox.showinfo("Info", "This is the last SKU!")
 
@@ -511,7 +507,10 @@ class WanchaiEditor:
 
         ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
         self.search_var = tk.StringVar()
-        self.search_var.trace("w", self.filter_tests)
+        self.search = IncrementalSearch()
+        self._search_after_id = None
+        self._search_error = None  # 查询语法错误信息，显示在覆盖层上
+        self.search_var.trace("w", self._schedule_search)
         search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=60)
         search_entry.pack(side=tk.LEFT, padx=(0, 10))
 
@@ -520,6 +519,14 @@ class WanchaiEditor:
         )
         clear_search_btn.pack(side=tk.LEFT)
 
+        search_all_btn = ttk.Button(
+            search_frame,
+            text="Search All SKUs",
+            command=self.search_all_skus,
+            width=16,
+        )
+        search_all_btn.pack(side=tk.LEFT, padx=(10, 0))
+
         # 当前 SKU test item 数量标签按钮
         self.sku_count_var = tk.StringVar(value="0 items")
         sku_count_btn = ttk.Button(
@@ -531,11 +538,7 @@ class WanchaiEditor:
         sku_count_btn.pack(side=tk.LEFT, padx=(10, 0))
 
         def update_sku_count():
-            sku = self.sku_var.get()
-            count = sum(
-                1 for (row, s) in getattr(self, "_all_rows_with_sku", []) if s == sku
-            )
-            self.sku_count_var.set(f"{count} items")
+            self.sku_count_var.set(f"{self.doc.count(self.sku_var.get())} items")
 
         # 绑定 SKU 变化和数据变动时刷新
         self.sku_var.trace_add("write", lambda *args: update_sku_count())
@@ -551,29 +554,12 @@ class WanchaiEditor:
         update_sku_count()
 
         # 创建Treeview用于显示测试项目
-        columns = getattr(self, "_test_columns", None)
-        if columns is None:
-            columns = [
-                "Index",
-                "Identifier",
-                "TestID",
-                "Description",
-                "Enabled",
-                "StringLimit",
-                "LowLimit",
-                "HighLimit",
-                "LimitType",
-                "Unit",
-                "Parameters",
-            ]
-        else:
-            # 若 header 没有 Identifier，插入
-            if "Identifier" not in columns:
-                columns = columns[:1] + ["Identifier"] + columns[1:]
-        self._test_columns = columns
+        columns = self.doc.test_columns
         tree_frame = ttk.Frame(tests_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=(10, 0), pady=(0, 10))
         self.tree_frame = tree_frame  # 保存引用，便于后续操作
+        # 虚拟滚动：Treeview 里只放可见窗口内的行，滚动条位置映射到过滤后的行列表
+        self.view = RowWindow()
         self.tree = ttk.Treeview(
             tree_frame,
             columns=columns,
@@ -583,43 +569,17 @@ class WanchaiEditor:
         )
 
         # 设置列标题
-        column_headers = {
-            "Index": "Index",
-            "Identifier": "Identifier",
-            "TestID": "TestID",
-            "Description": "Description",
-            "Enabled": "Enabled",
-            "StringLimit": "StringLimit",
-            "LowLimit": "LowLimit",
-            "HighLimit": "HighLimit",
-            "LimitType": "LimitType",
-            "Unit": "Unit",
-            "Parameters": "Parameters",
-        }
-
-        for col in columns:
-            self.tree.heading(col, text=column_headers[col])
-            if col == "Index":
-                self.tree.column(col, width=50, minwidth=20, stretch=False)
-            elif col == "Identifier":
-                self.tree.column(col, width=180, minwidth=120, stretch=False)
-            elif col == "Description" or col == "StringLimit" or col == "Unit":
-                self.tree.column(col, width=180, minwidth=120, stretch=False)
-            elif col == "Parameters":
-                self.tree.column(col, width=400, minwidth=120, stretch=False)
-            else:
-                self.tree.column(col, width=80, minwidth=50, stretch=False)
+        self._setup_tree_columns(columns)
 
-        # 添加滚动条
+        # 添加滚动条（纵向滚动条由 _on_tree_yview 接管）
         scrollbar = ttk.Scrollbar(
-            tree_frame, orient=tk.VERTICAL, command=self.tree.yview
+            tree_frame, orient=tk.VERTICAL, command=self._on_tree_yview
         )
+        self.tree_vscroll = scrollbar
         h_scrollbar = ttk.Scrollbar(
             tree_frame, orient=tk.HORIZONTAL, command=self.tree.xview
         )
-        self.tree.configure(
-            yscrollcommand=scrollbar.set, xscrollcommand=h_scrollbar.set
-        )
+        self.tree.configure(xscrollcommand=h_scrollbar.set)
 
         # 使用grid布局，确保纵向滚动条在右侧，横向在底部
         self.tree.grid(row=0, column=0, sticky="nsew")
@@ -634,6 +594,21 @@ class WanchaiEditor:
         self.tree.bind("<ButtonPress-1>", self._on_tree_drag_start)
         self.tree.bind("<B1-Motion>", self._on_tree_drag_motion)
         self.tree.bind("<ButtonRelease-1>", self._on_tree_drag_release)
+        # 虚拟滚动：滚轮、方向键、Shift 多选和窗口大小变化都由模型处理
+        self.tree.bind("<Shift-ButtonPress-1>", self._on_tree_shift_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<MouseWheel>", self._on_tree_mousewheel)
+        self.tree.bind("<Button-4>", self._on_tree_mousewheel)
+        self.tree.bind("<Button-5>", self._on_tree_mousewheel)
+        self.tree.bind("<Up>", lambda e: self._on_tree_key_move(-1))
+        self.tree.bind("<Down>", lambda e: self._on_tree_key_move(1))
+        self.tree.bind(
+            "<Prior>", lambda e: self._on_tree_key_move(-self._visible_row_count())
+        )
+        self.tree.bind(
+            "<Next>", lambda e: self._on_tree_key_move(self._visible_row_count())
+        )
+        self.tree.bind("<Configure>", lambda e: self._render_tree())
 
         # 右键菜单
         self.context_menu = tk.Menu(self.root, tearoff=0)
@@ -655,73 +630,9 @@ class WanchaiEditor:
 
         # 支持键盘 Ctrl+C 复制
         def on_tree_ctrl_c(event):
-            selected = self.tree.selection()
-            if not selected:
-                return "break"
-            header = "(Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters)"
-            current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-            # 构建 index 到 row 的映射（当前 SKU）
-            index_to_row = {
-                str(row[0]): row
-                for (row, sku) in self._all_rows_with_sku
-                if sku == current_sku
-            }
-            ui_order = list(self.tree.get_children())
-            selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-            selected_ui_pos.sort()
-
-            def format_row_export(row):
-                formatted = []
-                for i, v in enumerate(row):
-                    if i == 3 and str(v) in ("0", "1"):
-                        formatted.append(str(v))
-                    else:
-                        formatted.append(f"'{v}'")
-                return f"({','.join(formatted)})"
-
-            rows = []
-            for idx, (ui_pos, item) in enumerate(selected_ui_pos, 1):
-                values = self.tree.item(item)["values"]
-                index = str(values[0])
-                row = index_to_row.get(index, list(values))
-                # 构造 export_row: Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters
-                export_row = [row[1]] + list(
-                    row[2:]
-                )  # row1]是Identifier，row[2:]是其他字段
-                line = f"{row[0]}={header} VALUES {format_row_export(export_row)}"
-                rows.append(line)
-            text = "\n".join(rows)
-            self.root.clipboard_clear()
-            self.root.clipboard_append(text)
-            self.root.update()
-
-            # 自动消失的提示框
-            def show_toast(msg, duration=2000):
-                toast = tk.Toplevel(self.root)
-                toast.overrideredirect(True)
-                toast.attributes("-topmost", True)
-                toast.configure(bg="#333")
-                label = tk.Label(
-                    toast,
-                    text=msg,
-                    fg="white",
-                    bg="#333",
-                    font=("Segoe UI", 12),
-                    padx=20,
-                    pady=10,
-                )
-                label.pack()
-                self.root.update_idletasks()
-                x = (
-                    self.root.winfo_rootx()
-                    + self.root.winfo_width() // 2
-                    - toast.winfo_reqwidth() // 2
-                )
-                y = self.root.winfo_rooty() + 60
-                toast.geometry(f"+{x}+{y}")
-                toast.after(duration, toast.destroy)
-
-            show_toast("Selected items are copied to clipboard.")
+            if self.view.selection:
+                self._copy_selection_to_clipboard()
+                self.show_toast("Selected items are copied to clipboard.")
             return "break"
 
         self.tree.bind("<Control-c>", on_tree_ctrl_c)
@@ -729,144 +640,7 @@ class WanchaiEditor:
 
         # 支持键盘 Ctrl+V 粘贴
         def on_tree_ctrl_v(event):
-            try:
-                text = self.root.clipboard_get()
-            except Exception:
-                return "break"
-            if not text:
-                return "break"
-            # 匹配 test item 导出格式的行（允许 Identifier 字段为任意字符串）
-            pattern = r"^(\d+)=.*?VALUES \((.*)\)$"
-            lines = text.strip().splitlines()
-            parsed_rows = []
-            for line in lines:
-                m = re.match(r"^(\d+)=.*?VALUES \((.*)\)$", line)
-                if not m:
-                    print(f"Regex not matched: {line}")
-                    continue
-                values_str = m.group(2)
-                values = []
-                current = ""
-                in_quotes = False
-                i = 0
-                while i < len(values_str):
-                    c = values_str[i]
-                    if c == "'":
-                        in_quotes = not in_quotes
-                        current += c
-                    elif c == "," and not in_quotes:
-                        v = current.strip()
-                        if v.startswith("'") and v.endswith("'"):
-                            v = v[1:-1]
-                        values.append(v)
-                        current = ""
-                    else:
-                        current += c
-                    i += 1
-                if current:
-                    v = current.strip()
-                    if v.startswith("'") and v.endswith("'"):
-                        v = v[1:-1]
-                    values.append(v)
-                if len(values) != 10:
-                    print(f"Wrong number of fields: {len(values)}")
-                    continue
-                parsed_rows.append(values)
-            if not parsed_rows:
-                print("No valid rows to paste")
-                return "break"
-            current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-            if not current_sku:
-                messagebox.showwarning(
-                    "Warning", "No SKU selected. Please select SKU/SKUs first."
-                )
-                return "break"
-            columns = getattr(self, "_test_columns", None)
-            id_idx = (
-                columns.index("Identifier")
-                if columns and "Identifier" in columns
-                else 1
-            )
-            # 计算插入点：选中项最后一个在当前SKU中的位置+1，否则插入SKU末尾
-            selected = self.tree.selection()
-            sku_indices = [
-                i
-                for i, (row, sku) in enumerate(self._all_rows_with_sku)
-                if sku == current_sku
-            ]
-            insert_at = None
-            if selected:
-                # 找到所有选中项在tree中的顺序
-                ui_order = list(self.tree.get_children())
-                selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-                selected_ui_pos.sort()
-                last_selected_item = selected_ui_pos[-1][1]
-                last_selected_index = str(
-                    self.tree.item(last_selected_item)["values"][0]
-                )
-                # 找到 _all_rows_with_sku 中当前SKU下最后一个选中项的全局索引
-                insert_at = None
-                for idx in reversed(sku_indices):
-                    if str(self._all_rows_with_sku[idx][0][0]) == last_selected_index:
-                        insert_at = idx + 1
-                        break
-                if insert_at is None:
-                    insert_at = (
-                        sku_indices[-1] + 1
-                        if sku_indices
-                        else len(self._all_rows_with_sku)
-                    )
-            else:
-                insert_at = (
-                    sku_indices[-1] + 1 if sku_indices else len(self._all_rows_with_sku)
-                )
-            # index 自动递增（以当前SKU下最大index+1为起点）
-            next_index = str(len(sku_indices) + 1)
-            # 但如果插入点在SKU中间，需用插入点前的index+1
-            if selected and insert_at > sku_indices[0]:
-                # 找到插入点前一个在当前SKU的index
-                prev_idx = None
-                for idx in reversed(sku_indices):
-                    if idx < insert_at:
-                        prev_idx = idx
-                        break
-                if prev_idx is not None:
-                    next_index = str(int(self._all_rows_with_sku[prev_idx][0][0]) + 1)
-            for row_values in parsed_rows:
-                new_row = [next_index] + list(row_values)
-                new_row[id_idx] = current_sku
-                self._all_rows_with_sku.insert(insert_at, (new_row, current_sku))
-                self._all_rows.insert(insert_at, new_row)
-                insert_at += 1
-                next_index = str(int(next_index) + 1)
-            self.renumber_index_for_current_sku()
-
-            def show_toast(msg, duration=2000):
-                toast = tk.Toplevel(self.root)
-                toast.overrideredirect(True)
-                toast.attributes("-topmost", True)
-                toast.configure(bg="#333")
-                label = tk.Label(
-                    toast,
-                    text=msg,
-                    fg="white",
-                    bg="#333",
-                    font=("Segoe UI", 12),
-                    padx=20,
-                    pady=10,
-                )
-                label.pack()
-                self.root.update_idletasks()
-                x = (
-                    self.root.winfo_rootx()
-                    + self.root.winfo_width() // 2
-                    - toast.winfo_reqwidth() // 2
-                )
-                y = self.root.winfo_rooty() + 60
-                toast.geometry(f"+{x}+{y}")
-                toast.after(duration, toast.destroy)
-
-            show_toast("Items are pasted to the list.")
+            self.paste_selected_item()
             return "break"
 
         self.tree.bind("<Control-v>", on_tree_ctrl_v)
@@ -884,386 +658,754 @@ class WanchaiEditor:
         self.overlay_label.place(relx=0.5, rely=0.5, anchor="center")
         self.overlay_label.lower(self.tree)  # 保证tree在上层
         self.update_overlay()
-        # 初始化sku相关
-        self._sku_list = []
-        self._all_rows_with_sku = []
 
         # 支持键盘 Ctrl+X 剪切
         def on_tree_ctrl_x(event):
-            selected = self.tree.selection()
-            if not selected:
-                return "break"
-            header = "(Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters)"
-            current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-            # 构建 index 到 row 的映射（当前 SKU）
-            index_to_row = {
-                str(row[0]): row
-                for (row, sku) in self._all_rows_with_sku
-                if sku == current_sku
-            }
-            ui_order = list(self.tree.get_children())
-            selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-            selected_ui_pos.sort()
-
-            def format_row_export(row):
-                formatted = []
-                for i, v in enumerate(row):
-                    if i == 3 and str(v) in ("0", "1"):
-                        formatted.append(str(v))
-                    else:
-                        formatted.append(f"'{v}'")
-                return f"({','.join(formatted)})"
-
-            rows = []
-            selected_indices = set()
-            for idx, (ui_pos, item) in enumerate(selected_ui_pos, 1):
-                values = self.tree.item(item)["values"]
-                index = str(values[0])
-                row = index_to_row.get(index, list(values))
-                export_row = [row[1]] + list(row[2:])
-                line = f"{row[0]}={header} VALUES {format_row_export(export_row)}"
-                rows.append(line)
-                selected_indices.add(index)
-            text = "\n".join(rows)
-            self.root.clipboard_clear()
-            self.root.clipboard_append(text)
-            self.root.update()
-
-            # 删除选中项（从 _all_rows_with_sku 和 _all_rows）
-            # 只删除当前 SKU 下的选中项
-            new_all_rows_with_sku = []
-            for row, sku in self._all_rows_with_sku:
-                if sku == current_sku and str(row[0]) in selected_indices:
-                    continue
-                new_all_rows_with_sku.append((row, sku))
-            self._all_rows_with_sku = new_all_rows_with_sku
-            self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
-            self.renumber_index_for_current_sku()
-
-            def show_toast(msg, duration=2000):
-                toast = tk.Toplevel(self.root)
-                toast.overrideredirect(True)
-                toast.attributes("-topmost", True)
-                toast.configure(bg="#333")
-                label = tk.Label(
-                    toast,
-                    text=msg,
-                    fg="white",
-                    bg="#333",
-                    font=("Segoe UI", 12),
-                    padx=20,
-                    pady=10,
-                )
-                label.pack()
-                self.root.update_idletasks()
-                x = (
-                    self.root.winfo_rootx()
-                    + self.root.winfo_width() // 2
-                    - toast.winfo_reqwidth() // 2
-                )
-                y = self.root.winfo_rooty() + 60
-                toast.geometry(f"+{x}+{y}")
-                toast.after(duration, toast.destroy)
-
-            show_toast("Selected items are cut to clipboard.")
+            if self.view.selection:
+                self.cut_selected_item()
             return "break"
 
         self.tree.bind("<Control-x>", on_tree_ctrl_x)
         self.tree.bind("<Control-X>", on_tree_ctrl_x)
 
     def load_ini_file(self):
-        """加载INI文件"""
+        """在后台线程加载INI文件，界面显示进度并可取消；第一个 SKU 解析完就先显示出来"""
+        if not os.path.exists(self.ini_file):
+            messagebox.showerror("Error", f"File not found: {self.ini_file}")
+            return
+        previous = (self.doc, self.doc.path or "", self.sku_var.get())
+        if self._load_job is not None:
+            # 正在加载另一个文件：中止它，取消时恢复到最初的文档
+            previous = self._load_job.previous
+            self._load_job.cancel()
+        job = LoadJob(self.ini_file, previous, self.parse_cache)
+        self._load_job = job
+        self.load_status_var.set(f"Loading {os.path.basename(self.ini_file)}...")
+        self.load_progress["value"] = 0
+        self.load_frame.grid()
+        job.start()
+        self.root.after(LOAD_POLL_MS, self._poll_load, job)
+
+    def _poll_load(self, job):
+        """取出工作线程送来的进度，显示已解析完的 SKU"""
+        if job is not self._load_job:
+            return  # 已被取消或被新的加载取代
+        progress = None
         try:
-            if os.path.exists(self.ini_file):
-                # 直接读取文件内容
-                with open(self.ini_file, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                # 解析Info部分
-                self.parse_info_section(content)
-
-                # 解析测试项目部分
-                self.parse_tests_section(content)
+            while True:
+                kind, payload = job.queue.get_nowait()
+                if kind != "progress":
+                    self._finish_load(job, kind, payload)
+                    return
+                job.doc, sku, done, total = payload
+                if sku is not None:
+                    job.ready.append(sku)
+                progress = (done, total)
+        except queue.Empty:
+            pass
+        if progress is not None and progress[1]:
+            self.load_progress["value"] = progress[0] * 100 / progress[1]
+        if job.ready:
+            if self.doc is not job.doc:
+                self.doc = job.doc
+                self.show_document(list(job.ready))
+            elif len(self.sku_combobox["values"]) != len(job.ready):
+                self.sku_combobox["values"] = list(job.ready)
+        self.root.after(LOAD_POLL_MS, self._poll_load, job)
+
+    def _finish_load(self, job, kind, payload):
+        self._load_job = None
+        self.load_frame.grid_remove()
+        if kind == "done":
+            shown = self.doc is job.doc
+            self.doc = payload
+            # 加载过程中已经显示时，保留用户这期间选中的 SKU
+            self.show_document(keep_sku=shown)
+            return
+        # 取消或出错：恢复加载前的文档
+        previous_doc, previous_file, previous_sku = job.previous
+        self.ini_file = previous_file
+        self.file_path_var.set(previous_file)
+        if self.doc is not previous_doc:
+            self.doc = previous_doc
+            self.sku_var.set(previous_sku)
+            self.show_document(keep_sku=True)
+        if kind == "error":
+            messagebox.showerror("Error", f"Error loading file: {str(payload)}")
+        else:
+            self.show_toast("Loading cancelled.")
 
-                pass  # 不再弹窗提示，拖入时弹窗由 on_drop_file 负责
-            else:
-                messagebox.showerror("Error", f"File not found: {self.ini_file}")
-        except Exception as e:
-            import traceback
+    def cancel_load(self):
+        """取消正在进行的后台加载"""
+        if self._load_job is not None:
+            self._load_job.cancel()
 
-            traceback.print_exc()
-            messagebox.showerror("Error", f"Error loading file: {str(e)}")
+    def _loading_blocked(self):
+        """后台加载或解析未完成时不允许修改文档，提示后返回 True"""
+        if self._load_job is not None:
+            messagebox.showinfo(
+                "Loading",
+                "The file is still loading. Please wait until it finishes or click Cancel.",
+            )
+            return True
+        if self._parse_job is not None and self._parse_job.doc is self.doc:
+            messagebox.showinfo(
+                "Loading",
+                f"SKU {self._parse_job.sku} is still being read. Please wait a moment.",
+            )
+            return True
+        return False
 
-    def parse_info_section(self, content):
-        """解析Info部分"""
-        try:
-            # 查找[Info]部分
-            info_match = re.search(r"\[Info\]\s*\n(.*?)(?=\n\[|\Z)", content, re.DOTALL)
-            if info_match:
-                info_content = info_match.group(1)
-
-                # 解析UnitCount
-                unit_count_match = re.search(r"UnitCount\s*=\s*(.+)", info_content)
-                if unit_count_match:
-                    self.unit_count_var.set(unit_count_match.group(1).strip())
-
-                # 解析Export Date
-                export_date_match = re.search(r"Export Date\s*=\s*(.+)", info_content)
-                if export_date_match:
-                    self.export_date_var.set(export_date_match.group(1).strip())
-        except Exception as e:
-            print(f"Error parsing Info section: {e}")
+    def _parse_in_background(self, sku):
+        """在工作线程中解析当前文档的 SKU 区块；已有解析在进行时等它完成后再由 filter_tests 发起"""
+        if self._parse_job is not None:
+            return
+        job = ParseJob(self.doc, sku)
+        self._parse_job = job
+        job.start()
+        self.root.after(LOAD_POLL_MS, self._poll_parse, job)
 
-    def parse_tests_section(self, content):
-        """解析测试项目部分"""
+    def _poll_parse(self, job):
+        """等后台解析完成，出错时提示，然后刷新表格（可能接着解析现在选中的 SKU）"""
         try:
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            self._all_rows = []
-            self._all_rows_with_sku = []
-            self._sku_list = []
-            self._test_columns = None
-            sections = re.findall(
-                r"\[([^\]]+)\]\s*\n(.*?)(?=\n\[|\Z)", content, re.DOTALL
+            kind, payload = job.queue.get_nowait()
+        except queue.Empty:
+            self.root.after(LOAD_POLL_MS, self._poll_parse, job)
+            return
+        self._parse_job = None
+        if job.doc is not self.doc:
+            # 解析期间换了文件：丢掉结果，新文档选中的 SKU 可能也在等解析
+            self.filter_tests()
+            return
+        if kind == "error":
+            # 不再自动重试这个 SKU，重新打开文件后再读
+            self._parse_failed = (job.doc, job.sku)
+            messagebox.showerror(
+                "Error", f"Error reading SKU {job.sku}: {str(payload)}"
             )
-            for section_name, section_content in sections:
-                if section_name == "Info":
-                    continue
-                # 提取 header
-                if self._test_columns is None:
-                    header_match = re.search(
-                        r"^\s*\(([^)]*)\)", section_content, re.MULTILINE
-                    )
-                    if header_match:
-                        header_line = header_match.group(1).strip()
-                        columns = [h.strip() for h in header_line.split(",")]
-                        self._test_columns = ["Index"] + columns
-                    else:
-                        self._test_columns = [
-                            "Index",
-                            "Identifier",
-                            "TestID",
-                            "Description",
-                            "Enabled",
-                            "StringLimit",
-                            "LowLimit",
-                            "HighLimit",
-                            "LimitType",
-                            "Unit",
-                            "Parameters",
-                        ]
-                self._parse_single_section(section_name, section_content)
-            # 更新sku下拉框
-            sku_values = self._sku_list
-            self.sku_combobox["values"] = sku_values
-            if self._sku_list:
-                self.sku_var.set(self._sku_list[0])
+        self.filter_tests()
+
+    def show_document(self, sku_list=None, keep_sku=False):
+        """把当前文档的 Info 字段和 SKU 列表同步到界面。
+        sku_list 为要列出的 SKU（默认为文档中全部 SKU）；keep_sku 为 True 时尽量保留当前选中的 SKU。
+        """
+        if sku_list is None:
+            sku_list = self.doc.sku_list
+        if "UnitCount" in self.doc.info:
+            self.unit_count_var.set(self.doc.info["UnitCount"])
+        if "Export Date" in self.doc.info:
+            self.export_date_var.set(self.doc.info["Export Date"])
+        # 更新sku下拉框
+        self.sku_combobox["values"] = sku_list
+        if not (keep_sku and self.sku_var.get() in sku_list):
+            self.sku_var.set(sku_list[0] if sku_list else "")
+        self.filter_tests()
+        self.update_overlay()
+
+    def refresh_sku_list(self):
+        """SKU 列表变化后同步下拉框，当前 SKU 不存在时选中第一个"""
+        self.sku_combobox["values"] = self.doc.sku_list
+        if self.sku_var.get() not in self.doc.sku_list:
+            if self.doc.sku_list:
+                self.sku_var.set(self.doc.sku_list[0])
             else:
                 self.sku_var.set("")
-            self.filter_tests()
-            self.update_overlay()
-        except Exception as e:
-            print(f"Error parsing Test Items section: {e}")
-            self.update_overlay()
-
-    def _parse_single_section(self, section_name, section_content):
-        if section_name not in self._sku_list:
-            self._sku_list.append(section_name)
-        lines = section_content.splitlines()
-        current_idx = None
-        current_value = []
-        for line in lines:
-            m = re.match(r"^\s*(\d+)\s*=\s*(.*)", line)
-            if m:
-                # 保存前一个
-                if current_idx is not None:
-                    self._append_row_from_value(
-                        current_idx, current_value, section_name
-                    )
-                # 新项
-                current_idx = m.group(1)
-                current_value = [m.group(2)]
-            else:
-                # 多行内容
-                if current_idx is not None:
-                    current_value.append(line)
-        # 最后一项
-        if current_idx is not None:
-            self._append_row_from_value(current_idx, current_value, section_name)
-
-    def _append_row_from_value(self, idx, value_lines, section_name):
-        test_value = "\n".join(value_lines).strip()
-        parsed_data = self.parse_test_value(test_value)
-        if not parsed_data:
-            print(f"Failed to parse test item: index={idx}, content={test_value}")
-        if parsed_data:
-            columns = getattr(self, "_test_columns", None)
-            if columns is None:
-                columns = [
-                    "Index",
-                    "Identifier",
-                    "TestID",
-                    "Description",
-                    "Enabled",
-                    "StringLimit",
-                    "LowLimit",
-                    "HighLimit",
-                    "LimitType",
-                    "Unit",
-                    "Parameters",
-                ]
-            row = [str(idx)]
-            for col in columns[1:]:
-                v = parsed_data.get(col, "")
-                row.append(v if v is not None else "")
-            self._all_rows.append(list(row))
-            self._all_rows_with_sku.append((list(row), section_name))
-
-    def parse_test_value(self, test_value):
-        try:
-            values = self._extract_values_from_test_value(test_value)
-            if len(values) >= 10:
-                return {
-                    "Identifier": values[0],
-                    "TestID": values[1],
-                    "Description": values[2],
-                    "Enabled": values[3],
-                    "StringLimit": values[4],
-                    "LowLimit": values[5],
-                    "HighLimit": values[6],
-                    "LimitType": values[7],
-                    "Unit": values[8],
-                    "Parameters": values[9] if len(values) > 9 else "",
-                }
-            else:
-                print(f"Not enough fields (expected at least 10), got: {values}")
-        except Exception as e:
-            print(f"Error parsing test value: {e}")
-        return None
-
-    def _extract_values_from_test_value(self, test_value):
-        pattern = r"VALUES\s*\((.*)\)"
-        match = re.search(pattern, test_value)
-        if not match:
-            print(f"VALUES not matched: {test_value}")
-            return []
-        values_str = match.group(1)
-        # 手动分割，支持空字段和引号内逗号
-        values = []
-        current = ""
-        in_quotes = False
-        i = 0
-        while i < len(values_str):
-            char = values_str[i]
-            if char == "'":
-                in_quotes = not in_quotes
-                current += char
-            elif char == "," and not in_quotes:
-                values.append(current.strip())
-                current = ""
-            else:
-                current += char
-            i += 1
-        if current:
-            values.append(current.strip())
-        # 去除首尾单引号，保留空字符串
-        return [self._strip_quotes_keep_empty(v) for v in values]
-
-    def _strip_quotes_keep_empty(self, s):
-        s = s.strip()
-        if len(s) >= 2 and s[0] == "'" and s[-1] == "'":
-            return s[1:-1]
-        return s
 
     def filter_tests(self, *args):
-        search_term = self.search_var.get().lower()
+        search_term = self.search_var.get()
         selected_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        filtered = []
-        for row, sku in getattr(self, "_all_rows_with_sku", []):
-            if (selected_sku == sku) and any(
-                search_term in str(v).lower() for v in row
-            ):
-                filtered.append([v if v is not None else "" for v in row])
-        self.tree.delete(*self.tree.get_children())
-        for row in filtered:
-            self.tree.insert("", "end", values=row)
+        # 已经在刷新，取消还没执行的防抖搜索
+        if self._search_after_id is not None:
+            self.root.after_cancel(self._search_after_id)
+            self._search_after_id = None
+        self._reading_sku = None
+        self._search_error = None
+        section = self.doc.sections.get(selected_sku)
+        if section is not None and not section.parsed:
+            # SKU 区块第一次显示时才从原文件解析，放到工作线程中，解析完再刷新
+            filtered = []
+            if self._parse_failed != (self.doc, selected_sku):
+                self._reading_sku = selected_sku
+                self._parse_in_background(selected_sku)
+        else:
+            try:
+                filtered = self.search.filter(self.doc, selected_sku, search_term)
+            except QueryError as e:
+                filtered = []
+                self._search_error = str(e)
+        # 切换 SKU 或修改搜索词时回到顶部，其他操作后保持滚动位置
+        self.view.set_rows(filtered, (selected_sku, search_term))
+        self._render_tree()
         self.update_overlay()
         # 实时更新 test item 数量到 sku count
         if hasattr(self, "sku_count_var"):
             self.sku_count_var.set(f"{len(filtered)} items")
 
+    def _schedule_search(self, *args):
+        """搜索框输入防抖：停止输入 SEARCH_DEBOUNCE_MS 毫秒后只刷新一次"""
+        if self._search_after_id is not None:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_after_id = None
+        self.filter_tests()
+        # 搜索时显示匹配的数量
+        self.sku_count_var.set(f"{len(self.view.rows)} items")
+
+    def _selected_uids(self):
+        """当前选中行的 uid（按界面顺序，包括滚出可见窗口的行）"""
+        return self.view.selected_uids()
+
+    # ---------- 虚拟滚动 ----------
+
+    def _visible_row_count(self):
+        """Treeview 当前高度能显示的行数"""
+        height = self.tree.winfo_height()
+        if height <= 1:  # 还没显示出来
+            return int(self.tree.cget("height"))
+        # 减去表头占的一行
+        return max(1, height // TREE_ROW_HEIGHT - 1)
+
+    def _setup_tree_columns(self, columns):
+        """设置 Treeview 的列标题和列宽"""
+        for col in columns:
+            self.tree.heading(col, text=col)
+            if col == "Index":
+                self.tree.column(col, width=50, minwidth=20, stretch=False)
+            elif col == "Identifier":
+                self.tree.column(col, width=180, minwidth=120, stretch=False)
+            elif col == "Description" or col == "StringLimit" or col == "Unit":
+                self.tree.column(col, width=180, minwidth=120, stretch=False)
+            elif col == "Parameters":
+                self.tree.column(col, width=400, minwidth=120, stretch=False)
+            else:
+                self.tree.column(col, width=80, minwidth=50, stretch=False)
+
+    def _sync_tree_columns(self):
+        """文档的列（由各 SKU 区块的表头决定）变化后重建 Treeview 的列"""
+        columns = list(self.doc.test_columns)
+        if list(self.tree["columns"]) != columns:
+            self.tree.delete(*self.tree.get_children())
+            self.tree.configure(columns=columns, displaycolumns="#all")
+            self._setup_tree_columns(columns)
+
+    def _render_tree(self):
+        """只把可见窗口（加少量预留行）内的行放入 Treeview，耗时与 SKU 的总行数无关"""
+        self._sync_tree_columns()
+        visible = self._visible_row_count()
+        window = self.view.window(visible, TREE_OVERSCAN)
+        self.tree.delete(*self.tree.get_children())
+        for row in window:
+            self.tree.insert("", "end", iid=row.uid, values=list(row))
+        self.tree.selection_set(
+            [row.uid for row in window if row.uid in self.view.selection]
+        )
+        self.tree_vscroll.set(*self.view.fractions(visible))
+
+    def _scroll_tree_to(self, top):
+        self.view.top = top
+        self._render_tree()
+
+    def _on_tree_yview(self, *args):
+        """纵向滚动条回调：moveto 比例 / scroll n units|pages"""
+        if args[0] == "moveto":
+            self.view.moveto(float(args[1]))
+            self._render_tree()
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self._visible_row_count()
+            self._scroll_tree_to(self.view.top + step)
+
+    def _on_tree_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self._scroll_tree_to(self.view.top - 3)
+        else:
+            self._scroll_tree_to(self.view.top + 3)
+        return "break"
+
+    def _on_tree_select(self, event):
+        """把 Treeview 中可见行的选中状态同步回 view.selection"""
+        self.view.sync_selection(
+            [int(item) for item in self.tree.get_children()],
+            [int(item) for item in self.tree.selection()],
+        )
+
+    def _on_tree_shift_click(self, event):
+        """Shift+单击：按 view.rows 的位置选中一段（可以跨越可见窗口）"""
+        item = self.tree.identify_row(event.y)
+        if not item:
+            return "break"
+        self.view.select_range(self.view.top + self.tree.index(item))
+        self._render_tree()
+        return "break"
+
+    def _on_tree_key_move(self, step):
+        """方向键/翻页键：移动选中行并保证其可见"""
+        uid = self.view.move(step, self._visible_row_count())
+        if uid is None:
+            return "break"
+        self._render_tree()
+        self.tree.focus(uid)
+        return "break"
+
+    def _copy_selection_to_clipboard(self):
+        """把选中行以导出格式复制到剪贴板，返回选中的 uid"""
+        uids = self._selected_uids()
+        rows = [self.doc.get_item(uid) for uid in uids]
+        text = format_clipboard(
+            [row for row in rows if row is not None], self.doc.test_columns
+        )
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        self.root.update()
+        return uids
+
+    def show_toast(self, msg, duration=2000):
+        """自动消失的提示框"""
+        toast = tk.Toplevel(self.root)
+        toast.overrideredirect(True)
+        toast.attributes("-topmost", True)
+        toast.configure(bg="#333")
+        label = tk.Label(
+            toast,
+            text=msg,
+            fg="white",
+            bg="#333",
+            font=("Segoe UI", 12),
+            padx=20,
+            pady=10,
+        )
+        label.pack()
+        self.root.update_idletasks()
+        x = (
+            self.root.winfo_rootx()
+            + self.root.winfo_width() // 2
+            - toast.winfo_reqwidth() // 2
+        )
+        y = self.root.winfo_rooty() + 60
+        toast.geometry(f"+{x}+{y}")
+        toast.after(duration, toast.destroy)
+
     def clear_search(self):
         """清除搜索并恢复所有行显示"""
         self.search_var.set("")
         self.filter_tests()
 
+    def search_all_skus(self):
+        """在所有 SKU 中搜索当前搜索词，按 SKU 分组显示命中数量，双击可跳转到命中行"""
+        search_term = self.search_var.get()
+        if not search_term.strip():
+            messagebox.showinfo("Search All SKUs", "Please enter a search term first.")
+            return
+        # 要解析所有 SKU 区块，后台加载完成前不能进行
+        if self._loading_blocked():
+            return
+        try:
+            results = search_all_skus(self.doc, search_term)
+        except QueryError as e:
+            messagebox.showerror("Search All SKUs", f"Invalid search: {e}")
+            return
+        except (SourceChanged, UnicodeDecodeError) as e:
+            # 还没解析的区块这时才从原文件读出，可能已读不出来
+            messagebox.showerror("Error", f"Error reading the INI file: {str(e)}")
+            return
+        total = sum(len(rows) for sku, rows in results)
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Search All SKUs")
+        dialog.geometry("760x520")
+        dialog.transient(self.root)
+        summary = (
+            f"'{search_term}': {total} hits in {len(results)} of "
+            f"{len(self.doc.sku_list)} SKUs (double-click a row to jump to it)"
+        )
+        ttk.Label(dialog, text=summary).pack(fill=tk.X, padx=10, pady=(10, 5))
+
+        frame = ttk.Frame(dialog)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        columns = ("Index", "TestID", "Description")
+        tree = ttk.Treeview(frame, columns=columns, show="tree headings")
+        tree.heading("#0", text="SKU")
+        tree.column("#0", width=260, stretch=False)
+        for col in columns:
+            tree.heading(col, text=col)
+        tree.column("Index", width=60, stretch=False)
+        tree.column("TestID", width=160, stretch=False)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        frame.rowconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+
+        # SKU 节点 -> 命中行；命中行在展开时才插入
+        node_rows = {}
+        hit_uids = {}
+        for sku, rows in results:
+            node = tree.insert("", "end", text=f"{sku}  ({len(rows)})")
+            tree.insert(node, "end", text="...")
+            node_rows[node] = rows
+
+        def fill_node(node):
+            rows = node_rows.pop(node, None)
+            if rows is None:
+                return
+            tree.delete(*tree.get_children(node))
+            id_idx = self.doc.test_columns.index("TestID")
+            desc_idx = self.doc.test_columns.index("Description")
+            for row in rows[:SEARCH_ALL_MAX_HITS]:
+                item = tree.insert(
+                    node, "end", values=(row[0], row[id_idx], row[desc_idx])
+                )
+                hit_uids[item] = row.uid
+            if len(rows) > SEARCH_ALL_MAX_HITS:
+                tree.insert(
+                    node,
+                    "end",
+                    text=f"... {len(rows) - SEARCH_ALL_MAX_HITS} more",
+                )
+
+        def on_open(event):
+            fill_node(tree.focus())
+
+        def on_jump(event):
+            item = tree.focus()
+            if item in hit_uids:
+                self.jump_to_item(hit_uids[item])
+            elif tree.parent(item) == "":
+                # SKU 节点：跳到该 SKU 的第一条命中
+                fill_node(item)
+                children = [c for c in tree.get_children(item) if c in hit_uids]
+                if children:
+                    self.jump_to_item(hit_uids[children[0]])
+            return "break"
+
+        tree.bind("<<TreeviewOpen>>", on_open)
+        tree.bind("<Double-1>", on_jump)
+        tree.bind("<Return>", on_jump)
+
+    def compare_with_file(self):
+        """选择另一个 INI 文件作为旧版本与当前文档比较（按 SKU 和 TestID 对应，不受 Index 重新编号影响），
+        按 SKU 分组显示新增、删除、移动和修改的行，双击可跳转到当前文档中的行
+        """
+        if self._loading_blocked():
+            return
+        path = filedialog.askopenfilename(
+            title="Compare With (previous version)",
+            filetypes=[("INI files", "*.ini"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            old_doc = wanchai_core.load(path, cache=self.parse_cache)
+            info_changes = diff_info(old_doc, self.doc)
+            sku_diffs = diff_documents(old_doc, self.doc)
+        except (OSError, ValueError, SourceChanged) as e:
+            messagebox.showerror("Compare", f"Error comparing files: {str(e)}")
+            return
+        finally:
+            self.root.config(cursor="")
+        if not sku_diffs and not info_changes:
+            messagebox.showinfo(
+                "Compare", f"No differences from {os.path.basename(path)}."
+            )
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Compare With {os.path.basename(path)}")
+        dialog.geometry("900x560")
+        dialog.transient(self.root)
+        summary = (
+            f"{len(sku_diffs)} of {len(self.doc.sku_list)} SKUs differ from {path} "
+            "(double-click a row to jump to it)"
+        )
+        ttk.Label(dialog, text=summary).pack(fill=tk.X, padx=10, pady=(10, 5))
+
+        frame = ttk.Frame(dialog)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        columns = ("Change", "Index", "TestID", "Details")
+        tree = ttk.Treeview(frame, columns=columns, show="tree headings")
+        tree.heading("#0", text="SKU")
+        tree.column("#0", width=260, stretch=False)
+        for col in columns:
+            tree.heading(col, text=col)
+        tree.column("Change", width=70, stretch=False)
+        tree.column("Index", width=60, stretch=False)
+        tree.column("TestID", width=140, stretch=False)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        frame.rowconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+
+        if info_changes:
+            node = tree.insert("", "end", text="[Info]", open=True)
+            for key, old, new in info_changes:
+                tree.insert(
+                    node, "end", values=("changed", "", key, f"{old!r} -> {new!r}")
+                )
+        # SKU 节点 -> SkuDiff；差异行在展开时才插入
+        node_diffs = {}
+        item_diffs = {}
+        for sku_diff in sku_diffs:
+            if sku_diff.kind == CHANGED:
+                counts = sku_diff.counts()
+                detail = ", ".join(f"{n} {kind}" for kind, n in counts.items() if n)
+            else:
+                detail = f"SKU {sku_diff.kind}, {len(sku_diff.items)} items"
+            node = tree.insert("", "end", text=f"{sku_diff.sku}  ({detail})")
+            tree.insert(node, "end", text="...")
+            node_diffs[node] = sku_diff
+
+        def fill_node(node):
+            sku_diff = node_diffs.pop(node, None)
+            if sku_diff is None:
+                return
+            tree.delete(*tree.get_children(node))
+            for item_diff in sku_diff.items[:COMPARE_MAX_ITEMS]:
+                if item_diff.kind == REMOVED:
+                    index = item_diff.old_position
+                else:
+                    index = item_diff.new_position
+                values = (item_diff.kind, index, item_diff.test_id, item_diff.describe())
+                item_diffs[tree.insert(node, "end", values=values)] = item_diff
+            if len(sku_diff.items) > COMPARE_MAX_ITEMS:
+                tree.insert(
+                    node,
+                    "end",
+                    text=f"... {len(sku_diff.items) - COMPARE_MAX_ITEMS} more",
+                )
+
+        def on_open(event):
+            fill_node(tree.focus())
+
+        def on_jump(event):
+            item_diff = item_diffs.get(tree.focus())
+            if item_diff is None:
+                return "break"
+            if item_diff.new is None:
+                self.show_toast("This test item was removed.")
+            else:
+                self.jump_to_item(item_diff.new.uid)
+            return "break"
+
+        tree.bind("<<TreeviewOpen>>", on_open)
+        tree.bind("<Double-1>", on_jump)
+        tree.bind("<Return>", on_jump)
+
+    def merge_files(self):
+        """三方合并：当前文档为 ours，依次选择共同的原始版本（base）和另一份修改后的文件（theirs），
+        把 theirs 的修改合并进当前文档，有冲突时打开冲突列表逐个查看
+        """
+        if self._loading_blocked():
+            return
+        filetypes = [("INI files", "*.ini"), ("All files", "*.*")]
+        base_path = filedialog.askopenfilename(
+            title="Merge: Base (common original version)", filetypes=filetypes
+        )
+        if not base_path:
+            return
+        theirs_path = filedialog.askopenfilename(
+            title="Merge: Theirs (the other edited version)", filetypes=filetypes
+        )
+        if not theirs_path:
+            return
+        msg = (
+            f"Merge the changes made in {os.path.basename(theirs_path)} "
+            f"(since {os.path.basename(base_path)}) into the current document?"
+        )
+        if not messagebox.askyesno("Merge", msg):
+            return
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            base = wanchai_core.load(base_path, cache=self.parse_cache)
+            theirs = wanchai_core.load(theirs_path, cache=self.parse_cache)
+            merge = ThreeWayMerge(base, self.doc, theirs)
+            conflicts = merge.merge()
+        except (OSError, ValueError, SourceChanged) as e:
+            messagebox.showerror(
+                "Merge",
+                f"Error merging files: {str(e)}\n"
+                "The document may be partially merged, use Reload to discard it.",
+            )
+            return
+        finally:
+            self.root.config(cursor="")
+            self.refresh_sku_list()
+            self.filter_tests()
+        if not conflicts:
+            messagebox.showinfo(
+                "Merge", "Merged without conflicts. Export to save the result."
+            )
+            return
+        self.show_merge_conflicts(merge, theirs_path)
+
+    def show_merge_conflicts(self, merge, theirs_path):
+        """冲突列表：Prev / Next 逐个跳转到冲突的行，Use Theirs 改用 theirs 的内容"""
+        conflicts = merge.conflicts
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Merge Conflicts ({os.path.basename(theirs_path)})")
+        dialog.geometry("900x420")
+        dialog.transient(self.root)
+        status_var = tk.StringVar()
+        ttk.Label(dialog, textvariable=status_var).pack(
+            fill=tk.X, padx=10, pady=(10, 5)
+        )
+
+        frame = ttk.Frame(dialog)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10)
+        columns = ("Status", "Conflict", "SKU", "Index", "TestID", "Details")
+        tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+        tree.column("Status", width=60, stretch=False)
+        tree.column("Conflict", width=110, stretch=False)
+        tree.column("SKU", width=130, stretch=False)
+        tree.column("Index", width=50, stretch=False)
+        tree.column("TestID", width=110, stretch=False)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        frame.rowconfigure(0, weight=1)
+        frame.columnconfigure(0, weight=1)
+
+        def row_values(conflict):
+            row = conflict.row
+            index = row[0] if row is not None and self.doc.get_item(row.uid) else ""
+            return (
+                "theirs" if conflict.resolved else "ours",
+                conflict.kind,
+                "[Info]" if conflict.sku is None else conflict.sku,
+                index,
+                conflict.test_id or "",
+                conflict.describe(),
+            )
+
+        # iid 为冲突在列表中的下标
+        for i, conflict in enumerate(conflicts):
+            tree.insert("", "end", iid=str(i), values=row_values(conflict))
+
+        def current():
+            focus = tree.focus()
+            return int(focus) if focus else None
+
+        def show(i):
+            conflict = conflicts[i]
+            iid = str(i)
+            tree.selection_set(iid)
+            tree.focus(iid)
+            tree.see(iid)
+            status_var.set(
+                f"Conflict {i + 1} of {len(conflicts)}: "
+                f"{conflict.location()} {conflict.kind}"
+            )
+            row = conflict.row
+            if row is not None and self.doc.get_item(row.uid) is not None:
+                self.jump_to_item(row.uid)
+            elif conflict.sku is None:
+                self.show_toast("The conflict is in [Info].")
+            elif conflict.kind == DELETED_BY_OURS and not conflict.resolved:
+                self.show_toast("Deleted in the current document, changed in theirs.")
+            elif conflict.sku in self.doc.sku_list:
+                self.sku_var.set(conflict.sku)
+                self.filter_tests()
+
+        def step(delta):
+            i = current()
+            i = 0 if i is None else (i + delta) % len(conflicts)
+            show(i)
+
+        def use_theirs():
+            i = current()
+            if i is None:
+                return
+            if not merge.take_theirs(conflicts[i]):
+                self.show_toast("Already resolved, or the item was changed since.")
+                return
+            tree.item(str(i), values=row_values(conflicts[i]))
+            self.refresh_sku_list()
+            self.filter_tests()
+            show(i)
+
+        def on_jump(event):
+            i = current()
+            if i is not None:
+                show(i)
+            return "break"
+
+        tree.bind("<Double-1>", on_jump)
+        tree.bind("<Return>", on_jump)
+
+        buttons = ttk.Frame(dialog)
+        buttons.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(buttons, text="Prev", command=lambda: step(-1)).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Next", command=lambda: step(1)).pack(
+            side=tk.LEFT, padx=(5, 0)
+        )
+        ttk.Button(buttons, text="Use Theirs", command=use_theirs).pack(
+            side=tk.LEFT, padx=(20, 0)
+        )
+        ttk.Button(buttons, text="Close", command=dialog.destroy).pack(side=tk.RIGHT)
+        show(0)
+
+    def jump_to_item(self, uid):
+        """切换到 uid 所在的 SKU，滚动到该行并选中"""
+        row = self.doc.get_item(uid)
+        if row is None:
+            messagebox.showinfo("Search All SKUs", "The test item no longer exists.")
+            return
+        if self.sku_var.get() != row.sku:
+            self.sku_var.set(row.sku)
+        self.filter_tests()
+        if not self.view.reveal(row, self._visible_row_count()):
+            # 当前搜索条件下看不到该行，清空搜索
+            self.search_var.set("")
+            self.filter_tests()
+            self.view.reveal(row, self._visible_row_count())
+        self._render_tree()
+        self.tree.focus(row.uid)
+
     def edit_selected_item(self):
         """编辑选中的项目"""
-        selected = self.tree.selection()
+        selected = self._selected_uids()
         if selected:
             self.edit_test_item(None)
 
     def edit_test_item(self, event):
         """编辑测试项目"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if not selected:
             return
-        item_id = selected[0]
-        item = self.tree.item(item_id)
-        index = str(item["values"][0])
-        current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-        # Only get the row for the current SKU and index
-        row = next(
-            (
-                r
-                for r, sku in self._all_rows_with_sku
-                if str(r[0]) == index and sku == current_sku
-            ),
-            None,
-        )
+        uid = selected[0]
+        row = self.doc.get_item(uid)
         if row is None:
             return
         values = row  # 这里的 values 一定是完整的 row，含 Index
-        old_values = [v if v is not None else "" for v in values[1:]]  # 只要字段部分
 
         def open_edit_dialog_with_apply_option(on_save, values=None):
             dialog = tk.Toplevel(self.root)
             dialog.withdraw()  # 先隐藏，避免闪烁
             dialog.title("Edit Test Item")
             dialog.geometry("600x635")
-            columns = getattr(self, "_test_columns", None)
-            if columns is None:
-                columns = [
-                    "Index",
-                    "Identifier",
-                    "TestID",
-                    "Description",
-                    "Enabled",
-                    "StringLimit",
-                    "LowLimit",
-                    "HighLimit",
-                    "LimitType",
-                    "Unit",
-                    "Parameters",
-                ]
+            columns = self.doc.test_columns
             fields = list(columns)
             field_vars = {}
             if values is None:
                 row_map = {field: "" for field in fields}
                 values_list = [row_map[field] for field in fields]
             else:
-                columns_ref = (
-                    self._test_columns if self._test_columns is not None else fields
-                )
-                row_dict = {col: val for col, val in zip(columns_ref, values)}
+                row_dict = {col: val for col, val in zip(columns, values)}
                 row_map = {field: row_dict.get(field, "") for field in fields}
                 values_list = [row_map[field] for field in fields]
-                # print('fields:', fields)
-                # print('columns_ref:', columns_ref)
-                # print('row:', values)
-                # print('row_dict:', row_dict)
-                # print('row_map:', row_map)
-                # print('values_list:', values_list)
             for i, field in enumerate(fields):
                 value = values_list[i]
                 ttk.Label(dialog, text=f"{field}:").grid(
@@ -1317,7 +1459,7 @@ class WanchaiEditor:
                     if not var.get():
                         clear_btn.place_forget()
             # Apply option
-            apply_var = tk.StringVar(value="all_by_field")
+            apply_var = tk.StringVar(value=APPLY_ALL_BY_FIELD)
             option_frame = ttk.LabelFrame(dialog, text="Apply Change To:", padding=10)
             option_frame.grid(
                 row=len(fields), column=0, columnspan=2, pady=(10, 0), sticky="we"
@@ -1326,62 +1468,120 @@ class WanchaiEditor:
                 option_frame,
                 text="All SKUs + Exact field ---> Handle modified fields which have same original value.",
                 variable=apply_var,
-                value="all_by_field",
+                value=APPLY_ALL_BY_FIELD,
             ).pack(anchor=tk.W)
             ttk.Radiobutton(
                 option_frame,
                 text="All SKUs + Any fields ---> Handle any fields which have same original value.",
                 variable=apply_var,
-                value="all",
+                value=APPLY_ALL,
             ).pack(anchor=tk.W)
             ttk.Radiobutton(
                 option_frame,
                 text="Current SKU only + Exact fields ---> Handle modified fields which have same original value.",
                 variable=apply_var,
-                value="sku_by_field",
+                value=APPLY_SKU_BY_FIELD,
             ).pack(anchor=tk.W)
             ttk.Radiobutton(
                 option_frame,
                 text="Current SKU only + Any fields ---> Handle any fields which have same original value.",
                 variable=apply_var,
-                value="sku_only",
+                value=APPLY_SKU_ONLY,
             ).pack(anchor=tk.W)
             ttk.Radiobutton(
                 option_frame,
                 text="Current item only",
                 variable=apply_var,
-                value="current",
+                value=APPLY_CURRENT,
             ).pack(anchor=tk.W)
+            # 预览：保存后会修改多少行
+            preview_frame = ttk.Frame(option_frame)
+            preview_frame.pack(anchor=tk.W, pady=(5, 0))
+            preview_var = tk.StringVar()
+            ttk.Label(
+                preview_frame, textvariable=preview_var, foreground="#c0392b"
+            ).pack(side=tk.LEFT)
+            count_btn = ttk.Button(
+                preview_frame, text="Count", command=lambda: show_count()
+            )
             # Save/cancel buttons
             button_frame = ttk.Frame(dialog)
             button_frame.grid(row=len(fields) + 1, column=0, columnspan=2, pady=20)
 
-            def save_changes():
+            def collect_values():
                 new_values = []
                 for field in fields:
                     if field == "Parameters":
                         new_values.append(field_vars[field].get("1.0", tk.END).strip())
                     else:
                         new_values.append(field_vars[field].get())
+                return new_values
+
+            def count_changes():
+                return self.doc.count_edit_changes(
+                    uid, collect_values(), apply_var.get()
+                )
+
+            def show_count():
+                count_btn.pack_forget()
+                preview_var.set(f"{count_changes()} test item(s) will be changed.")
+
+            preview_after = [None]
+
+            def run_preview():
+                preview_after[0] = None
+                if not dialog.winfo_exists():
+                    return
+                apply_to = apply_var.get()
+                if apply_to == APPLY_CURRENT:
+                    count_btn.pack_forget()
+                    preview_var.set("Only this test item will be changed.")
+                elif self.doc.preview_needs_index(uid, collect_values(), apply_to):
+                    # 跨 SKU 计数要先解析所有区块并建立倒排索引，只在点 Count 时才算
+                    preview_var.set("Press Count to see how many items will change.")
+                    count_btn.pack(side=tk.LEFT, padx=(10, 0))
+                else:
+                    show_count()
+
+            def update_preview(*args):
+                # 输入防抖：停止输入 PREVIEW_DEBOUNCE_MS 毫秒后才重新计数
+                if preview_after[0] is not None:
+                    dialog.after_cancel(preview_after[0])
+                preview_after[0] = dialog.after(PREVIEW_DEBOUNCE_MS, run_preview)
+
+            apply_var.trace_add("write", update_preview)
+            for field, var in field_vars.items():
+                if isinstance(var, tk.StringVar):
+                    var.trace_add("write", update_preview)
+                else:
+                    var.bind("<KeyRelease>", update_preview)
+            run_preview()
+
+            def save_changes():
+                new_values = collect_values()
+                changes = f"{count_changes()} test item(s) will be changed.\n"
                 # 二次确认
-                if apply_var.get() == "all":
+                if apply_var.get() == APPLY_ALL:
                     if not messagebox.askyesno(
                         "Confirm Apply to All SKUs",
-                        "This operation will affect ALL SKUs. Are you sure you want to continue?",
+                        changes
+                        + "This operation will affect ALL SKUs. Are you sure you want to continue?",
                         icon="warning",
                     ):
                         return
-                if apply_var.get() == "all_by_field":
+                if apply_var.get() == APPLY_ALL_BY_FIELD:
                     if not messagebox.askyesno(
                         "Confirm Apply to All SKUs by field",
-                        "This operation will update only fields whose value matches the original, across ALL SKUs. Are you sure you want to continue?",
+                        changes
+                        + "This operation will update only fields whose value matches the original, across ALL SKUs. Are you sure you want to continue?",
                         icon="warning",
                     ):
                         return
-                if apply_var.get() == "sku_by_field":
+                if apply_var.get() == APPLY_SKU_BY_FIELD:
                     if not messagebox.askyesno(
                         "Confirm Apply to Current SKU by field",
-                        "This operation will update only fields whose value matches the original, in the current SKU. Are you sure you want to continue?",
+                        changes
+                        + "This operation will update only fields whose value matches the original, in the current SKU. Are you sure you want to continue?",
                         icon="warning",
                     ):
                         return
@@ -1409,386 +1609,41 @@ class WanchaiEditor:
             dialog.deiconify()
 
         def on_save(new_values, apply_to):
-            # new_values 现在是 fields 顺序的完整一行（含 Index）
-            columns = getattr(self, "_test_columns", None)
-            if columns is None:
-                columns = [
-                    "Index",
-                    "Identifier",
-                    "TestID",
-                    "Description",
-                    "Enabled",
-                    "StringLimit",
-                    "LowLimit",
-                    "HighLimit",
-                    "LimitType",
-                    "Unit",
-                    "Parameters",
-                ]
-            fields = list(columns)
-            current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-            row_dict = {field: val for field, val in zip(fields, new_values)}
-            row_for_storage = [row_dict.get(col, "") for col in columns]
-            # 更新 Treeview
-            self.tree.item(item_id, values=row_for_storage)
-            # 更新 _all_rows
-            for i, row in enumerate(self._all_rows):
-                if str(row[0]) == index:
-                    self._all_rows[i] = list(row_for_storage)
-                    break
-            # old_values 也只针对非 Index 字段
-            if apply_to == "sku_only":
-                columns = (
-                    self._test_columns
-                    if self._test_columns is not None
-                    else [
-                        "Index",
-                        "Identifier",
-                        "TestID",
-                        "Description",
-                        "Enabled",
-                        "StringLimit",
-                        "LowLimit",
-                        "HighLimit",
-                        "LimitType",
-                        "Unit",
-                        "Parameters",
-                    ]
-                )
-                n = len(old_values)
-                current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-                for j in range(n):
-                    old_val = old_values[j]
-                    new_val = new_values[j + 1]
-                    if old_val == new_val:
-                        continue
-                    for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                        if sku != current_sku:
-                            continue
-                        row_dict = {col_: val for col_, val in zip(columns, row)}
-                        changed = False
-                        for col in columns[1:]:  # 跳过 Index
-                            if (
-                                str(row_dict.get(col, "")).strip()
-                                == str(old_val).strip()
-                            ):
-                                row_dict[col] = new_val
-                                changed = True
-                        if changed:
-                            new_row = [row_dict.get(col_, "") for col_ in columns]
-                            self._all_rows_with_sku[i] = (new_row, current_sku)
-                self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
-                # 重新编号当前SKU下的Index字段
-                sku_to_rows = {}
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    sku_to_rows.setdefault(sku, []).append(row)
-                for sku, rows in sku_to_rows.items():
-                    for idx, row in enumerate(rows, 1):
-                        row[0] = str(idx)
-                self._all_rows_with_sku = [
-                    (row, row[columns.index("Identifier")]) for row in self._all_rows
-                ]
-                # 重新统计所有SKU并同步下拉框（保持原有顺序）
-                new_sku_list = []
-                seen = set()
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    if sku not in seen:
-                        new_sku_list.append(sku)
-                        seen.add(sku)
-                self._sku_list = new_sku_list
-                self.sku_combobox["values"] = self._sku_list
-                if self.sku_var.get() not in self._sku_list:
-                    if self._sku_list:
-                        self.sku_var.set(self._sku_list[0])
-                    else:
-                        self.sku_var.set("")
-                self.filter_tests()
-                self.root.update_idletasks()
-            elif apply_to == "all":
-                columns = (
-                    self._test_columns
-                    if self._test_columns is not None
-                    else [
-                        "Index",
-                        "Identifier",
-                        "TestID",
-                        "Description",
-                        "Enabled",
-                        "StringLimit",
-                        "LowLimit",
-                        "HighLimit",
-                        "LimitType",
-                        "Unit",
-                        "Parameters",
-                    ]
-                )
-                n = len(old_values)
-                for j in range(n):
-                    old_val = old_values[j]
-                    new_val = new_values[j + 1]
-                    if old_val == new_val:
-                        continue
-                    for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                        row_dict = {col_: val for col_, val in zip(columns, row)}
-                        changed = False
-                        for col in columns[1:]:  # 跳过 Index
-                            # 只做全等整体替换
-                            if (
-                                str(row_dict.get(col, "")).strip()
-                                == str(old_val).strip()
-                            ):
-                                row_dict[col] = new_val
-                                changed = True
-                        if changed:
-                            new_row = [row_dict.get(col_, "") for col_ in columns]
-                            new_sku = new_row[columns.index("Identifier")]
-                            self._all_rows_with_sku[i] = (new_row, new_sku)
-                self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
-                # 重新编号所有SKU下的Index字段，避免重复
-                sku_to_rows = {}
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    sku_to_rows.setdefault(sku, []).append(row)
-                for sku, rows in sku_to_rows.items():
-                    for idx, row in enumerate(rows, 1):
-                        row[0] = str(idx)
-                self._all_rows_with_sku = [
-                    (row, row[columns.index("Identifier")]) for row in self._all_rows
-                ]
-                # 重新统计所有SKU并同步下拉框（保持原有顺序）
-                new_sku_list = []
-                seen = set()
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    if sku not in seen:
-                        new_sku_list.append(sku)
-                        seen.add(sku)
-                self._sku_list = new_sku_list
-                self.sku_combobox["values"] = self._sku_list
-                if self.sku_var.get() not in self._sku_list:
-                    if self._sku_list:
-                        self.sku_var.set(self._sku_list[0])
-                    else:
-                        self.sku_var.set("")
-                self.filter_tests()
-                self.root.update_idletasks()
-            elif apply_to == "all_by_field":
-                columns = (
-                    self._test_columns
-                    if self._test_columns is not None
-                    else [
-                        "Index",
-                        "Identifier",
-                        "TestID",
-                        "Description",
-                        "Enabled",
-                        "StringLimit",
-                        "LowLimit",
-                        "HighLimit",
-                        "LimitType",
-                        "Unit",
-                        "Parameters",
-                    ]
-                )
-                fields = list(columns)
-                # old_row_dict must be built from columns and values (full row, including Index)
-                old_row_dict = {col: val for col, val in zip(columns, values)}
-                new_row_dict = {col: val for col, val in zip(columns, new_values)}
-                for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                    row_dict = {col: val for col, val in zip(columns, row)}
-                    for col in columns:
-                        old_val = old_row_dict.get(col, "")
-                        new_val = new_row_dict.get(col, "")
-                        row_val = row_dict.get(col, "")
-                        # Only update if the field was changed in the Edit dialog
-                        if (
-                            old_val != new_val
-                            and str(row_val).strip() == str(old_val).strip()
-                        ):
-                            row_dict[col] = new_val
-                    new_row = [row_dict.get(col, "") for col in columns]
-                    self._all_rows_with_sku[i] = (new_row, row_dict["Identifier"])
-                self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
-                # 重新编号所有SKU下的Index字段，避免重复
-                sku_to_rows = {}
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    sku_to_rows.setdefault(sku, []).append(row)
-                for sku, rows in sku_to_rows.items():
-                    for idx, row in enumerate(rows, 1):
-                        row[0] = str(idx)
-                self._all_rows_with_sku = [
-                    (row, row[columns.index("Identifier")]) for row in self._all_rows
-                ]
-                # 重新统计所有SKU并同步下拉框（保持原有顺序）
-                new_sku_list = []
-                seen = set()
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    if sku not in seen:
-                        new_sku_list.append(sku)
-                        seen.add(sku)
-                self._sku_list = new_sku_list
-                self.sku_combobox["values"] = self._sku_list
-                if self.sku_var.get() not in self._sku_list:
-                    if self._sku_list:
-                        self.sku_var.set(self._sku_list[0])
-                    else:
-                        self.sku_var.set("")
-                self.filter_tests()
-                self.root.update_idletasks()
-            elif apply_to == "sku_by_field":
-                columns = (
-                    self._test_columns
-                    if self._test_columns is not None
-                    else [
-                        "Index",
-                        "Identifier",
-                        "TestID",
-                        "Description",
-                        "Enabled",
-                        "StringLimit",
-                        "LowLimit",
-                        "HighLimit",
-                        "LimitType",
-                        "Unit",
-                        "Parameters",
-                    ]
-                )
-                n = len(old_values)
-                current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-                for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                    if sku != current_sku:
-                        continue
-                    row_dict = {col_: val for col_, val in zip(columns, row)}
-                    changed = False
-                    for j in range(n):
-                        col = columns[j + 1]  # 跳过 Index
-                        old_val = old_values[j]
-                        new_val = new_values[j + 1]
-                        if old_val == new_val:
-                            continue
-                        if str(row_dict.get(col, "")).strip() == str(old_val).strip():
-                            row_dict[col] = new_val
-                            changed = True
-                    if changed:
-                        new_row = [row_dict.get(col_, "") for col_ in columns]
-                        self._all_rows_with_sku[i] = (new_row, current_sku)
-                self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
-                # 重新编号当前SKU下的Index字段
-                sku_to_rows = {}
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    sku_to_rows.setdefault(sku, []).append(row)
-                for sku, rows in sku_to_rows.items():
-                    for idx, row in enumerate(rows, 1):
-                        row[0] = str(idx)
-                self._all_rows_with_sku = [
-                    (row, row[columns.index("Identifier")]) for row in self._all_rows
-                ]
-                # 重新统计所有SKU并同步下拉框（保持原有顺序）
-                new_sku_list = []
-                seen = set()
-                for row in self._all_rows:
-                    sku = row[columns.index("Identifier")]
-                    if sku not in seen:
-                        new_sku_list.append(sku)
-                        seen.add(sku)
-                self._sku_list = new_sku_list
-                self.sku_combobox["values"] = self._sku_list
-                if self.sku_var.get() not in self._sku_list:
-                    if self._sku_list:
-                        self.sku_var.set(self._sku_list[0])
-                    else:
-                        self.sku_var.set("")
-                self.filter_tests()
-                self.root.update_idletasks()
-            elif apply_to == "current":
-                columns = (
-                    self._test_columns
-                    if self._test_columns is not None
-                    else [
-                        "Index",
-                        "Identifier",
-                        "TestID",
-                        "Description",
-                        "Enabled",
-                        "StringLimit",
-                        "LowLimit",
-                        "HighLimit",
-                        "LimitType",
-                        "Unit",
-                        "Parameters",
-                    ]
-                )
-                # Build row_dict and row_for_storage
-                row_dict = {field: val for field, val in zip(fields, new_values)}
-                row_for_storage = [row_dict.get(col, "") for col in columns]
-                # Update _all_rows (only the current row)
-                for i, row in enumerate(self._all_rows):
-                    if (
-                        str(row[0]) == index
-                        and row[columns.index("Identifier")] == current_sku
-                    ):
-                        self._all_rows[i] = list(row_for_storage)
-                        break
-                # Update _all_rows_with_sku (only the current row)
-                for i, (row, sku) in enumerate(self._all_rows_with_sku):
-                    if str(row[0]) == index and sku == current_sku:
-                        self._all_rows_with_sku[i] = (list(row_for_storage), sku)
-                        break
-                # Update Treeview
-                self.tree.item(item_id, values=row_for_storage)
-                self.filter_tests()
-                self.root.update_idletasks()
-                return
-            # 兜底：无论如何都刷新主界面
+            # new_values 是 fields 顺序的完整一行（含 Index）
+            self.doc.apply_edit(uid, new_values, apply_to)
+            if apply_to != APPLY_CURRENT:
+                # 批量修改可能改变 Identifier，需同步 SKU 列表
+                self.refresh_sku_list()
             self.filter_tests()
             self.root.update_idletasks()
 
         open_edit_dialog_with_apply_option(on_save, values=values[:])
 
     def add_test_item(self):
-        """添加新测试项目到末尾"""
+        """添加新测试项目到当前 SKU 末尾"""
+        if self._loading_blocked():
+            return
 
         def on_save(new_values):
-            # 获取当前所有 index 的最大值
-            if self._all_rows:
-                max_index = max(int(row[0]) for row in self._all_rows)
-                new_index = str(max_index + 1)
-            else:
-                new_index = "1"
-            row = [str(new_index)] + [
-                str(v) if v is not None else "" for v in new_values
-            ]
-            self._all_rows.append(row)
-            self._all_rows_with_sku.append((row, self.sku_var.get()))  # 添加sku
-            self.renumber_index()
-            self.tree.delete(*self.tree.get_children())
-            for r in self._all_rows:
-                self.tree.insert("", "end", values=r)
+            current_sku = self.sku_var.get()
+            row = self.doc.make_row(current_sku, [current_sku] + list(new_values))
+            self.doc.insert_rows(current_sku, None, [row])
             self.search_var.set("")  # 清空搜索，显示全部
-            self.update_overlay()
+            self.filter_tests()
 
-        self.open_edit_dialog(on_save, values=[""] * 9)
+        self.open_edit_dialog(on_save)
 
     def insert_test_item(self, before=True):
         """在选中项前/后插入新测试项目"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if not selected:
             messagebox.showwarning("Warning", "Please select a row before inserting!")
             return
-        ref_item = selected[0]
-        ref_values = self.tree.item(ref_item)["values"]
-        ref_index_value = str(ref_values[0])  # Index 字段
-        ref_index = None
-        for i, row in enumerate(self._all_rows):
-            if str(row[0]) == ref_index_value:
-                ref_index = i
-                break
-        if ref_index is None:
+        current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
+        ref_uid = selected[0]
+        if self.doc.position(ref_uid) is None:
             messagebox.showerror(
                 "Error",
                 "Failed to locate the selected item in the main data. The data may have been filtered or modified.",
@@ -1796,74 +1651,22 @@ class WanchaiEditor:
             return
 
         def on_save(new_values):
-            current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-            # 重新获取当前选中项的 Index 字段
-            selected = self.tree.selection()
-            if not selected:
-                messagebox.showerror("Error", "No row selected for insert.")
-                return
-            ref_item = selected[0]
-            ref_values = self.tree.item(ref_item)["values"]
-            ref_index_value = str(ref_values[0])
-            # 在 _all_rows_with_sku 里查找最新的全局索引
-            sku_indices = [
-                i
-                for i, (row, sku) in enumerate(self._all_rows_with_sku)
-                if sku == current_sku
-            ]
-            ref_global_index = None
-            for i in sku_indices:
-                if str(self._all_rows_with_sku[i][0][0]) == ref_index_value:
-                    ref_global_index = i
-                    break
-            if ref_global_index is None:
+            # 重新定位选中项在当前 SKU 中的位置
+            sku_pos = self.doc.position(ref_uid)
+            if sku_pos is None:
                 messagebox.showerror(
                     "Error", "Failed to locate the selected item in the current SKU."
                 )
                 return
-            sku_pos = sku_indices.index(ref_global_index)
             # 计算插入点
-            if before:
-                insert_at = sku_indices[sku_pos]
-            else:
-                # after: 如果选中项是SKU区间最后一个，插到末尾，否则插在选中项后
-                if sku_pos == len(sku_indices) - 1:
-                    insert_at = sku_indices[-1] + 1
-                else:
-                    insert_at = sku_indices[sku_pos + 1]
-            if self._all_rows:
-                max_index = max(int(row[0]) for row in self._all_rows)
-                new_index = str(max_index + 1)
-            else:
-                new_index = "1"
-            row = [str(new_index)] + [
-                str(v) if v is not None else "" for v in new_values
-            ]
-            self._all_rows.insert(insert_at, row)
-            self._all_rows_with_sku.insert(insert_at, (row, self.sku_var.get()))
-            # 重新编号当前SKU下的index，并同步 self._all_rows
-            sku_indices = [
-                i
-                for i, (row, sku) in enumerate(self._all_rows_with_sku)
-                if sku == current_sku
-            ]
-            for new_idx, i in enumerate(sku_indices, 1):
-                row, sku = self._all_rows_with_sku[i]
-                self._all_rows_with_sku[i] = ([str(new_idx)] + list(row[1:]), sku)
-            for i, row in enumerate(self._all_rows):
-                for r, sku in self._all_rows_with_sku:
-                    if sku == current_sku and str(r[0]) == str(row[0]):
-                        self._all_rows[i] = r
-                        break
-            self.tree.delete(*self.tree.get_children())
-            for r in self._all_rows:
-                self.tree.insert("", "end", values=r)
+            insert_at = sku_pos if before else sku_pos + 1
+            row = self.doc.make_row(current_sku, [current_sku] + list(new_values))
+            self.doc.insert_rows(current_sku, insert_at, [row])
             self.search_var.set("")
-            self.update_overlay()
+            self.filter_tests()
 
         self.open_edit_dialog(
             on_save,
-            values=[""] * 9,
             title=(
                 "Insert Test Item (Before)" if before else "Insert Test Item (After)"
             ),
@@ -1871,53 +1674,18 @@ class WanchaiEditor:
 
     def delete_selected_item(self):
         """删除选中的项目，支持多选并提示即将删除的index"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if selected:
-            indices = [self.tree.item(item, "values")[0] for item in selected]
+            indices = [str(self.doc.get_item(uid)[0]) for uid in selected]
             indices_str = ", ".join(indices)
             msg = f"Are you sure you want to delete the selected test item(s)?\nIndex: {indices_str}"
             if messagebox.askyesno("Confirm Delete", msg):
-                selected_indices = set(indices)
-                self._all_rows = [
-                    row for row in self._all_rows if row[0] not in selected_indices
-                ]
-                self._all_rows_with_sku = [
-                    item
-                    for item in self._all_rows_with_sku
-                    if item[0][0] not in selected_indices
-                ]  # 更新sku列表
+                # 按 uid 删除，只影响当前 SKU 中被选中的行
+                self.doc.delete_items(selected)
                 # 重新编号当前SKU下的index
-                current_sku = self.sku_var.get() if hasattr(self, "sku_var") else None
-                # 找到当前SKU下的所有行
-                sku_rows = [
-                    (i, row, sku)
-                    for i, (row, sku) in enumerate(self._all_rows_with_sku)
-                    if sku == current_sku
-                ]
-                # 重新编号
-                for new_idx, (i, row, sku) in enumerate(sku_rows, 1):
-                    self._all_rows_with_sku[i] = ([str(new_idx)] + list(row[1:]), sku)
-                # 同步 self._all_rows
-                # 只更新当前SKU下的行
-                for i, row in enumerate(self._all_rows):
-                    for r, sku in self._all_rows_with_sku:
-                        if sku == current_sku and str(r[0]) == str(row[0]):
-                            self._all_rows[i] = r
-                            break
-                self.filter_tests()
-
-    def renumber_index(self):
-        """重新编号Index列，并同步所有数据结构和UI"""
-        for idx, row in enumerate(self._all_rows, 1):
-            new_row = [str(idx)] + list(row[1:])
-            self._all_rows[idx - 1] = new_row
-        # 同步 _all_rows_with_sku 的 index 字段
-        for i, (row, sku) in enumerate(self._all_rows_with_sku):
-            row[0] = self._all_rows[i][0]
-        # 刷新 Treeview
-        self.tree.delete(*self.tree.get_children())
-        for row in self._all_rows:
-            self.tree.insert("", "end", values=row)
+                self.renumber_index_for_current_sku()
 
     def open_edit_dialog(self, on_save, values=None, title="Edit Test Item"):
         """通用编辑/添加对话框"""
@@ -1934,20 +1702,11 @@ class WanchaiEditor:
         dialog.geometry(f"{w}x{h}+{x}+{y}")
         dialog.transient(self.root)
         dialog.grab_set()
-        fields = [
-            "TestID",
-            "Description",
-            "Enabled",
-            "StringLimit",
-            "LowLimit",
-            "HighLimit",
-            "LimitType",
-            "Unit",
-            "Parameters",
-        ]
+        # Index 自动编号、Identifier 取当前 SKU，其余列（包括表头中的新列）都可填写
+        fields = self.doc.test_columns[2:]
         field_vars = {}
         if values is None:
-            values = [""] * 9
+            values = [""] * len(fields)
         for i, field in enumerate(fields):
             ttk.Label(dialog, text=f"{field}:").grid(
                 row=i, column=0, sticky=tk.W, padx=10, pady=5
@@ -1987,7 +1746,7 @@ class WanchaiEditor:
     def show_context_menu(self, event):
         """显示右键菜单"""
         # 只有未选中任何行时才自动选中鼠标下的行
-        if not self.tree.selection():
+        if not self.view.selection:
             row_id = self.tree.identify_row(event.y)
             if row_id:
                 self.tree.selection_set(row_id)
@@ -1998,9 +1757,7 @@ class WanchaiEditor:
 
     def update_export_date(self):
         """更新导出日期为当前时间"""
-        now = datetime.now()
-        current_time = f"{now.month}/{now.day}/{now.year} {now.strftime('%I:%M:%S %p')}"
-        self.export_date_var.set(current_time)
+        self.export_date_var.set(format_export_date())
 
     def browse_file(self):
         """浏览文件"""
@@ -2031,26 +1788,10 @@ class WanchaiEditor:
     #     except Exception as e:
     #         messagebox.showerror("错误", f"保存文件时出错: {str(e)}")
 
-    def update_info_section(self, content):
-        """导出时直接用UI变量重建[Info]区内容，保证导出和UI一致"""
-        try:
-            # 构造新的Info区内容
-            info_lines = [
-                f"UnitCount={self.unit_count_var.get()}",
-                f"Export Date={self.export_date_var.get()}",
-            ]
-            new_info = "[Info]\n" + "\n".join(info_lines)
-            # 用正则替换原有[Info]区
-            content = re.sub(
-                r"\[Info\]\s*\n(.*?)(?=\n\[|\Z)", new_info, content, flags=re.DOTALL
-            )
-            return content
-        except Exception as e:
-            print(f"Error updating Info section: {e}")
-            return content
-
     def export(self):
         """导出"""
+        if self._loading_blocked():
+            return
         if not os.path.exists(self.ini_file):
             messagebox.showerror("Error", f"File not found")
             return
@@ -2067,120 +1808,10 @@ class WanchaiEditor:
             )
 
             if filename:
-                # 读取原文件内容
-                with open(self.ini_file, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                # 更新Info部分
-                content = self.update_info_section(content)
-
-                # 只导出当前 self._sku_list 中的 SKU
-                sku_to_rows = {}
-                for row, sku in self._all_rows_with_sku:
-                    if sku in self._sku_list:
-                        sku_to_rows.setdefault(sku, []).append(row)
-
-                # 1. 提取每个 section 的 header_line
-                section_headers = {}
-                for m in re.finditer(
-                    r"\[([^\]]+)\]\s*\n(.*?)(?=\n\[|\Z)", content, flags=re.DOTALL
-                ):
-                    section_name = m.group(1)
-                    section_content = m.group(2)
-                    if section_name == "Info":
-                        continue
-                    header_match = re.search(
-                        r"^\s*\(([^)]*)\)", section_content, re.MULTILINE
-                    )
-                    if header_match:
-                        header_line = header_match.group(0).strip()
-                    else:
-                        header_line = "(Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters)"
-                    section_headers[section_name] = header_line
-
-                def format_row(row):
-                    formatted = []
-                    for i, v in enumerate(row):
-                        if i == 3 and str(v) in ("0", "1"):
-                            formatted.append(str(v))  # Enabled 字段不加引号
-                        else:
-                            formatted.append(f"'{v}'")
-                    return f"({','.join(formatted)})"
-
-                sections = []
-                # 只导出 self._sku_list 中的 SKU
-                for idx, sku in enumerate(self._sku_list):
-                    rows = sku_to_rows.get(sku, [])
-                    header_line = section_headers.get(
-                        sku,
-                        "Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters",
-                    )
-                    header_line_stripped = header_line.strip()
-                    if header_line_stripped.startswith(
-                        "("
-                    ) and header_line_stripped.endswith(")"):
-                        header_line_final = header_line_stripped[1:-1]
-                    else:
-                        header_line_final = header_line_stripped
-                    if header_line_final:
-                        header_fields = [
-                            h.strip() for h in header_line_final.split(",")
-                        ]
-                    else:
-                        header_fields = [
-                            "Identifier",
-                            "TestID",
-                            "Description",
-                            "Enabled",
-                            "StringLimit",
-                            "LowLimit",
-                            "HighLimit",
-                            "LimitType",
-                            "Unit",
-                            "Parameters",
-                        ]
-                    lines = [f"Count={len(rows)}"]
-                    for i, row in enumerate(rows, 1):
-                        # 按 header_fields 顺序组装 new_row
-                        test_columns = (
-                            self._test_columns
-                            if isinstance(self._test_columns, list)
-                            else [
-                                "Index",
-                                "Identifier",
-                                "TestID",
-                                "Description",
-                                "Enabled",
-                                "StringLimit",
-                                "LowLimit",
-                                "HighLimit",
-                                "LimitType",
-                                "Unit",
-                                "Parameters",
-                            ]
-                        )
-                        row_dict = {col: val for col, val in zip(test_columns, row)}
-                        new_row = [row_dict.get(col, "") for col in header_fields]
-                        lines.append(
-                            f"{i}=({header_line_final}) VALUES {format_row(new_row)}"
-                        )
-                    if sections:
-                        sections.append("")
-                    sections.append(f"[{sku}]\n" + "\n".join(lines))
-
-                # Info 区放最前面
-                info_match = re.search(
-                    r"\[Info\]\s*\n(.*?)(?=\n\[|\Z)", content, re.DOTALL
-                )
-                if info_match:
-                    info_section = f"[Info]\n{info_match.group(1).strip()}\n"
-                    sections = [info_section] + sections
-
-                content = "\n".join(sections)
-
-                # 保存备份
-                with open(filename, "w", encoding="utf-8") as f:
-                    f.write(content)
+                # Info 区直接用UI变量，保证导出和UI一致
+                self.doc.info["UnitCount"] = self.unit_count_var.get()
+                self.doc.info["Export Date"] = self.export_date_var.get()
+                wanchai_core.dump(self.doc, filename)
 
                 messagebox.showinfo("Success", f"The file is saved: {filename}")
         except Exception as e:
@@ -2198,7 +1829,7 @@ class WanchaiEditor:
 
     def update_overlay(self):
         """根据表格是否有数据，显示或隐藏覆盖层提示"""
-        if not self.tree.get_children():
+        if not self.view.rows:
             # 判断是否有 SKU 被选中
             sku_selected = (
                 bool(self.sku_var.get()) if hasattr(self, "sku_var") else False
@@ -2206,7 +1837,11 @@ class WanchaiEditor:
             search_active = (
                 bool(self.search_var.get()) if hasattr(self, "search_var") else False
             )
-            if sku_selected and search_active:
+            if self._reading_sku:
+                self.overlay_label.config(text=f"Reading SKU {self._reading_sku}...")
+            elif sku_selected and search_active and self._search_error:
+                self.overlay_label.config(text=f"Invalid search: {self._search_error}")
+            elif sku_selected and search_active:
                 self.overlay_label.config(
                     text="No test item matches the current filter."
                 )
@@ -2224,16 +1859,19 @@ class WanchaiEditor:
         msg = "This will clear all loaded data and reset the application to its initial state.\nAre you sure you want to proceed?"
         if not messagebox.askyesno("Confirm Initialize", msg, icon="warning"):
             return
+        if self._load_job is not None:
+            self._load_job.cancel()
+            self._load_job = None
+            self.load_frame.grid_remove()
         self.ini_file = ""
         self.file_path_var.set("")
         self.unit_count_var.set("")
         self.export_date_var.set("")
-        self._all_rows = []
-        self._all_rows_with_sku = []
-        self._sku_list = []
+        self.doc = WanchaiDocument()
         self.sku_combobox["values"] = []
         self.sku_var.set("")
-        self.tree.delete(*self.tree.get_children())
+        self.view.set_rows([])
+        self._render_tree()
         if hasattr(self, "search_var"):
             self.search_var.set("")
         if hasattr(self, "sku_suffix_var"):
@@ -2242,155 +1880,40 @@ class WanchaiEditor:
 
     def copy_selected_item(self):
         """复制选中行到剪贴板（导出格式），并在所有选中行的最后一条之后一并插入副本（顺序与原选中项一致）"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if not selected:
             messagebox.showinfo("Copy", "Please select at least one row to copy.")
             return
-        header = "(Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters)"
-        current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        # 构建 index 到 row 的映射（当前 SKU）
-        index_to_row = {
-            str(row[0]): row
-            for (row, sku) in self._all_rows_with_sku
-            if sku == current_sku
-        }
-        ui_order = list(self.tree.get_children())
-        selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-        selected_ui_pos.sort()
-
-        def format_row_export(row):
-            formatted = []
-            for i, v in enumerate(row):
-                if i == 3 and str(v) in ("0", "1"):
-                    formatted.append(str(v))
-                else:
-                    formatted.append(f"'{v}'")
-            return f"({','.join(formatted)})"
-
-        rows = []
-        for idx, (ui_pos, item) in enumerate(selected_ui_pos, 1):
-            values = self.tree.item(item)["values"]
-            index = str(values[0])
-            row = index_to_row.get(index, list(values))
-            export_row = [current_sku] + list(row[2:])  # row[2:] 跳过 Index, Identifier
-            export_row.insert(0, row[1])  # Identifier
-            line = f"{row[0]}={header} VALUES {format_row_export(export_row)}"
-            rows.append(line)
-        text = "\n".join(rows)
-        self.root.clipboard_clear()
-        self.root.clipboard_append(text)
-        self.root.update()
+        uids = self._copy_selection_to_clipboard()
         # 插入副本
-        sku_rows = [
-            (i, row, sku)
-            for i, (row, sku) in enumerate(self._all_rows_with_sku)
-            if sku == current_sku
-        ]
-        ui_items = list(self.tree.get_children())
-        selected_ui_pos = [(ui_items.index(item), item) for item in selected]
-        selected_ui_pos.sort()
-        if not selected_ui_pos:
-            return
-        max_ui_pos = max(pos for pos, _ in selected_ui_pos)
-        insert_at = max_ui_pos + 1
-        if insert_at > len(sku_rows):
-            insert_at = len(sku_rows)
-        global_insert_at = (
-            sku_rows[insert_at - 1][0] + 1
-            if insert_at > 0 and insert_at <= len(sku_rows)
-            else (sku_rows[-1][0] + 1 if sku_rows else len(self._all_rows_with_sku))
-        )
-        new_rows = []
-        for _, item in selected_ui_pos:
-            values = self.tree.item(item)["values"]
-            index = str(values[0])
-            row = index_to_row.get(index, list(values))
-            new_row = ["TMP_INDEX"] + list(row[1:])
-            new_rows.append(new_row)
-        for offset, new_row in enumerate(new_rows):
-            self._all_rows_with_sku.insert(
-                global_insert_at + offset, (new_row, current_sku)
-            )
-            self._all_rows.insert(global_insert_at + offset, new_row)
-        self.renumber_index_for_current_sku()
+        self.doc.duplicate_rows(self.sku_var.get(), uids)
         self.filter_tests()
 
     def copy_to_all_skus(self):
         """将选中行分别插入到所有其他 SKU 的相同 index 位置（如超出则插入末尾），并自动编号"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if not selected:
             messagebox.showinfo(
                 "Copy To Other SKUs", "Please select at least one row to copy."
             )
             return
         current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        all_skus = list(self.sku_combobox["values"])
-        other_skus = [sku for sku in all_skus if sku != current_sku]
-        if not other_skus:
+        if not [sku for sku in self.doc.sku_list if sku != current_sku]:
             messagebox.showinfo("Copy To Other SKUs", "No other SKUs to copy to.")
             return
-        # 构建 index 到 row 的映射（当前 SKU）
-        index_to_row = {
-            str(row[0]): row
-            for (row, sku) in self._all_rows_with_sku
-            if sku == current_sku
-        }
-        selected_rows = []
-        for item in selected:
-            values = self.tree.item(item)["values"]
-            index = str(values[0])
-            row = index_to_row.get(index, list(values))
-            selected_rows.append((int(index), row))
-        selected_rows.sort()
-        for sku in other_skus:
-            sku_indices = [
-                i for i, (row, s) in enumerate(self._all_rows_with_sku) if s == sku
-            ]
-            sku_rows = [self._all_rows_with_sku[i][0] for i in sku_indices]
-            for sel_idx, row in selected_rows:
-                insert_pos = sel_idx - 1
-                if insert_pos > len(sku_rows):
-                    insert_pos = len(sku_rows)
-                global_insert_at = (
-                    sku_indices[insert_pos]
-                    if insert_pos < len(sku_indices)
-                    else (
-                        sku_indices[-1] + 1
-                        if sku_indices
-                        else len(self._all_rows_with_sku)
-                    )
-                )
-                new_row = ["TMP_INDEX"] + list(row[1:])
-                columns = getattr(self, "_test_columns", None)
-                if columns and "Identifier" in columns:
-                    idx = columns.index("Identifier")
-                    new_row[idx] = sku
-                else:
-                    new_row[1] = sku
-                self._all_rows_with_sku.insert(global_insert_at, (list(new_row), sku))
-                self._all_rows.insert(global_insert_at, list(new_row))
-                sku_indices = [
-                    i for i, (row, s) in enumerate(self._all_rows_with_sku) if s == sku
-                ]
-                sku_rows = [self._all_rows_with_sku[i][0] for i in sku_indices]
-        for sku in other_skus:
-            idx = 1
-            for i, (row, s) in enumerate(self._all_rows_with_sku):
-                if s == sku:
-                    row[0] = str(idx)
-                    idx += 1
-        self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
+        self.doc.copy_to_other_skus(current_sku, self._selected_uids())
         self.filter_tests()
         messagebox.showinfo("Copy To Other SKUs", "Copy To Other SKUs completed!")
 
     def renumber_index_for_current_sku(self):
+        if self._loading_blocked():
+            return
         current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        idx = 1
-        for i, (row, sku) in enumerate(self._all_rows_with_sku):
-            if sku == current_sku:
-                row[0] = str(idx)
-                idx += 1
-        self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
+        self.doc.renumber(current_sku)
         self.filter_tests()
 
     def _on_tree_drag_start(self, event):
@@ -2399,6 +1922,10 @@ class WanchaiEditor:
         if not item:
             self._dragging_item = None
             return
+        # 普通单击会重新选择，先清掉滚出窗口的选中行；Ctrl 单击保留
+        if not event.state & 0x0004:
+            self.view.selection = set()
+        self.view.anchor = self.view.top + self.tree.index(item)
         self._dragging_item = item
         self._dragging_index = self.tree.index(item)
         self._last_target_item = None
@@ -2407,6 +1934,11 @@ class WanchaiEditor:
         # 仅选中目标行，不再高亮目标行
         if not hasattr(self, "_dragging_item") or not self._dragging_item:
             return
+        # 拖到表格上/下边缘时自动滚动
+        if event.y < TREE_ROW_HEIGHT:
+            self._scroll_tree_to(self.view.top - 1)
+        elif event.y > self.tree.winfo_height() - TREE_ROW_HEIGHT // 2:
+            self._scroll_tree_to(self.view.top + 1)
         target_item = self.tree.identify_row(event.y)
         if target_item:
             self.tree.selection_set(target_item)
@@ -2424,241 +1956,72 @@ class WanchaiEditor:
             return
         # 只允许当前SKU下拖动
         current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        # 获取当前UI顺序的所有行
-        ui_items = list(self.tree.get_children())
-        from_idx = ui_items.index(self._dragging_item)
-        to_idx = ui_items.index(target_item)
-        # 取出当前SKU下的所有行在 _all_rows_with_sku 的索引
-        sku_indices = [
-            i
-            for i, (row, sku) in enumerate(self._all_rows_with_sku)
-            if sku == current_sku
-        ]
-        # 只允许拖动当前SKU下的行
-        if from_idx >= len(sku_indices) or to_idx >= len(sku_indices):
-            self._dragging_item = None
-            if hasattr(self, "_dragging_item") and self._dragging_item:
-                self.tree.item(self._dragging_item, tags=())
-            return
-        real_from = sku_indices[from_idx]
-        real_to = sku_indices[to_idx]
-        # 移动数据
-        row = self._all_rows_with_sku.pop(real_from)
-        self._all_rows_with_sku.insert(real_to, row)
-        # 同步 _all_rows
-        self._all_rows = [r for (r, s) in self._all_rows_with_sku]
-        self.renumber_index_for_current_sku()
-        # 修正：同步 _all_rows_with_sku 的 index 字段
-        for i, (row, sku) in enumerate(self._all_rows_with_sku):
-            row[0] = self._all_rows[i][0]
-        self.filter_tests()
+        from_pos = self.doc.position(self._dragging_item)
+        to_pos = self.doc.position(target_item)
+        if (
+            from_pos is not None
+            and to_pos is not None
+            and not self._loading_blocked()
+        ):
+            self.doc.move_row(current_sku, from_pos, to_pos)
+            self.filter_tests()
         self._dragging_item = None
         if hasattr(self, "_dragging_item") and self._dragging_item:
             self.tree.item(self._dragging_item, tags=())
 
     def cut_selected_item(self):
         """剪切选中行到剪贴板，并从当前SKU删除"""
-        selected = self.tree.selection()
+        if self._loading_blocked():
+            return
+        selected = self._selected_uids()
         if not selected:
             messagebox.showinfo("Cut", "Please select at least one row to cut.")
             return
-        header = "(Identifier,TestID,Description,Enabled,StringLimit,LowLimit,HighLimit,LimitType,Unit,Parameters)"
-        current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
-        # 构建 index 到 row 的映射（当前 SKU）
-        index_to_row = {
-            str(row[0]): row
-            for (row, sku) in self._all_rows_with_sku
-            if sku == current_sku
-        }
-        ui_order = list(self.tree.get_children())
-        selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-        selected_ui_pos.sort()
-
-        def format_row_export(row):
-            formatted = []
-            for i, v in enumerate(row):
-                if i == 3 and str(v) in ("0", "1"):
-                    formatted.append(str(v))
-                else:
-                    formatted.append(f"'{v}'")
-            return f"({','.join(formatted)})"
-
-        rows = []
-        selected_indices = set()
-        for idx, (ui_pos, item) in enumerate(selected_ui_pos, 1):
-            values = self.tree.item(item)["values"]
-            index = str(values[0])
-            row = index_to_row.get(index, list(values))
-            export_row = [row[1]] + list(row[2:])
-            line = f"{row[0]}={header} VALUES {format_row_export(export_row)}"
-            rows.append(line)
-            selected_indices.add(index)
-        text = "\n".join(rows)
-        self.root.clipboard_clear()
-        self.root.clipboard_append(text)
-        self.root.update()
-
-        # 删除选中项（从 _all_rows_with_sku 和 _all_rows）
+        uids = self._copy_selection_to_clipboard()
         # 只删除当前 SKU 下的选中项
-        new_all_rows_with_sku = []
-        for row, sku in self._all_rows_with_sku:
-            if sku == current_sku and str(row[0]) in selected_indices:
-                continue
-            new_all_rows_with_sku.append((row, sku))
-        self._all_rows_with_sku = new_all_rows_with_sku
-        self._all_rows = [row for (row, sku) in self._all_rows_with_sku]
+        self.doc.delete_items(uids)
         self.renumber_index_for_current_sku()
-
-        def show_toast(msg, duration=2000):
-            toast = tk.Toplevel(self.root)
-            toast.overrideredirect(True)
-            toast.attributes("-topmost", True)
-            toast.configure(bg="#333")
-            label = tk.Label(
-                toast,
-                text=msg,
-                fg="white",
-                bg="#333",
-                font=("Segoe UI", 12),
-                padx=20,
-                pady=10,
-            )
-            label.pack()
-            self.root.update_idletasks()
-            x = (
-                self.root.winfo_rootx()
-                + self.root.winfo_width() // 2
-                - toast.winfo_reqwidth() // 2
-            )
-            y = self.root.winfo_rooty() + 60
-            toast.geometry(f"+{x}+{y}")
-            toast.after(duration, toast.destroy)
-
-        show_toast("Selected items are cut to clipboard.")
+        self.show_toast("Selected items are cut to clipboard.")
 
     def paste_selected_item(self):
         """从剪贴板粘贴 test item/items 到当前选中区块最后一行的下一个位置（与 Ctrl+V 逻辑一致）"""
+        if self._loading_blocked():
+            return
         try:
             text = self.root.clipboard_get()
         except Exception:
             return
         if not text:
             return
-        pattern = r"^(\d+)=.*?VALUES \((.*)\)$"
-        lines = text.strip().splitlines()
-        parsed_rows = []
-        for line in lines:
-            m = re.match(r"^(\d+)=.*?VALUES \((.*)\)$", line)
-            if not m:
-                continue
-            values_str = m.group(2)
-            values = []
-            current = ""
-            in_quotes = False
-            i = 0
-            while i < len(values_str):
-                c = values_str[i]
-                if c == "'":
-                    in_quotes = not in_quotes
-                    current += c
-                elif c == "," and not in_quotes:
-                    v = current.strip()
-                    if v.startswith("'") and v.endswith("'"):
-                        v = v[1:-1]
-                    values.append(v)
-                    current = ""
-                else:
-                    current += c
-                i += 1
-            if current:
-                v = current.strip()
-                if v.startswith("'") and v.endswith("'"):
-                    v = v[1:-1]
-                values.append(v)
-            if len(values) != 10:
-                continue
-            parsed_rows.append(values)
+        skipped = []
+        parsed_rows = parse_clipboard(text, self.doc.test_columns, skipped)
         if not parsed_rows:
+            messagebox.showwarning(
+                "Warning", "The clipboard does not contain any test item to paste."
+            )
             return
         current_sku = self.sku_var.get() if hasattr(self, "sku_var") else ""
         if not current_sku:
+            messagebox.showwarning(
+                "Warning", "No SKU selected. Please select SKU/SKUs first."
+            )
             return
-        columns = getattr(self, "_test_columns", None)
-        id_idx = (
-            columns.index("Identifier")
-            if columns and "Identifier" in columns
-            else 1
-        )
-        selected = self.tree.selection()
-        sku_indices = [
-            i
-            for i, (row, sku) in enumerate(self._all_rows_with_sku)
-            if sku == current_sku
-        ]
+        # 计算插入点：选中项最后一个在当前SKU中的位置+1，否则插入SKU末尾
         insert_at = None
-        if selected:
-            ui_order = list(self.tree.get_children())
-            selected_ui_pos = [(ui_order.index(item), item) for item in selected]
-            selected_ui_pos.sort()
-            last_selected_item = selected_ui_pos[-1][1]
-            last_selected_index = str(self.tree.item(last_selected_item)["values"][0])
-            insert_at = None
-            for idx in reversed(sku_indices):
-                if str(self._all_rows_with_sku[idx][0][0]) == last_selected_index:
-                    insert_at = idx + 1
-                    break
-            if insert_at is None:
-                insert_at = (
-                    sku_indices[-1] + 1
-                    if sku_indices
-                    else len(self._all_rows_with_sku)
-                )
-        else:
-            insert_at = (
-                sku_indices[-1] + 1 if sku_indices else len(self._all_rows_with_sku)
-            )
-        next_index = str(len(sku_indices) + 1)
-        if selected and insert_at > sku_indices[0]:
-            prev_idx = None
-            for idx in reversed(sku_indices):
-                if idx < insert_at:
-                    prev_idx = idx
-                    break
-            if prev_idx is not None:
-                next_index = str(int(self._all_rows_with_sku[prev_idx][0][0]) + 1)
-        for row_values in parsed_rows:
-            new_row = [next_index] + list(row_values)
-            new_row[id_idx] = current_sku
-            self._all_rows_with_sku.insert(insert_at, (new_row, current_sku))
-            self._all_rows.insert(insert_at, new_row)
-            insert_at += 1
-            next_index = str(int(next_index) + 1)
-        self.renumber_index_for_current_sku()
-        def show_toast(msg, duration=2000):
-            toast = tk.Toplevel(self.root)
-            toast.overrideredirect(True)
-            toast.attributes("-topmost", True)
-            toast.configure(bg="#333")
-            label = tk.Label(
-                toast,
-                text=msg,
-                fg="white",
-                bg="#333",
-                font=("Segoe UI", 12),
-                padx=20,
-                pady=10,
-            )
-            label.pack()
-            self.root.update_idletasks()
-            x = (
-                self.root.winfo_rootx()
-                + self.root.winfo_width() // 2
-                - toast.winfo_reqwidth() // 2
+        uids = self._selected_uids()
+        if uids:
+            pos = self.doc.position(uids[-1])
+            if pos is not None:
+                insert_at = pos + 1
+        rows = [self.doc.make_row(current_sku, values) for values in parsed_rows]
+        self.doc.insert_rows(current_sku, insert_at, rows)
+        self.filter_tests()
+        if skipped:
+            self.show_toast(
+                f"{len(rows)} items are pasted, {len(skipped)} invalid lines skipped."
             )
-            y = self.root.winfo_rooty() + 60
-            toast.geometry(f"+{x}+{y}")
-            toast.after(duration, toast.destroy)
-        show_toast("Items are pasted to the list.")
+        else:
+            self.show_toast("Items are pasted to the list.")
 
 
 def main():
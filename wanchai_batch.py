@@ -0,0 +1,238 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import wanchai_core
+from wanchai_search import compile_query
+
+# 注意：本模块不依赖 tkinter，供 wanchai-cli.py 批量处理 INI 文件
+#
+# 编辑脚本为 JSON：{"operations": [操作, ...]}（也可以直接是操作列表），按顺序对每个文件执行。
+# 操作与界面中的功能对应：
+#   {"op": "set_field", "where": ..., "field": "LowLimit", "value": "-3", "sku": 可选}
+#   {"op": "add_suffix", "suffix": "_GRC", "sku": 可选，默认所有 SKU}
+#   {"op": "copy_to_all_skus", "sku": "38599-000-889", "where": ...}
+#   {"op": "delete", "where": ..., "sku": 可选}
+#   {"op": "update_export_date", "value": 可选，默认当前时间}
+# where 为 {"列名": "值" 或 ["值", ...], ...}（各列去掉首尾空白后等于该值或列表中任一个），
+# 或搜索框的查询串（如 "TestID:RF_* AND Enabled=1"）。set_field 和 delete 的查询串必须
+# 用到查询语法，不接受普通文本（整行子串匹配很容易误改、误删其他行）。
+
+
+class ScriptError(ValueError):
+    pass
+
+
+def _op_set_field(doc, op):
+    col = _column(doc, op["field"])
+    rows = select_rows(doc, op["where"], op.get("sku"), text=False)
+    return doc.set_field(rows, col, str(op["value"]))
+
+
+def _op_add_suffix(doc, op):
+    sku = op.get("sku")
+    if sku is None:
+        return len(doc.add_suffix_to_all(op["suffix"]))
+    if sku not in doc.sku_list:
+        return 0
+    doc.add_suffix(sku, op["suffix"])
+    return 1
+
+
+def _op_copy_to_all_skus(doc, op):
+    sku = op["sku"]
+    if sku not in doc.sku_list:
+        return 0
+    rows = select_rows(doc, op["where"], sku)
+    if not rows:
+        return 0
+    targets = doc.copy_to_other_skus(sku, [row.uid for row in rows])
+    return len(rows) * len(targets)
+
+
+def _op_delete(doc, op):
+    rows = select_rows(doc, op["where"], op.get("sku"), text=False)
+    for sku in doc.delete_items([row.uid for row in rows]):
+        doc.renumber(sku)
+    return len(rows)
+
+
+def _op_update_export_date(doc, op):
+    if "value" in op:
+        doc.info["Export Date"] = str(op["value"])
+    else:
+        doc.update_export_date()
+    return 1
+
+
+# 操作名 -> (函数, 必填参数)
+_OPERATIONS = {
+    "set_field": (_op_set_field, ("where", "field", "value")),
+    "add_suffix": (_op_add_suffix, ("suffix",)),
+    "copy_to_all_skus": (_op_copy_to_all_skus, ("sku", "where")),
+    "delete": (_op_delete, ("where",)),
+    "update_export_date": (_op_update_export_date, ()),
+}
+
+
+def _column(doc, name):
+    if name not in doc.test_columns:
+        raise ScriptError(f"Unknown column '{name}'")
+    return doc.test_columns.index(name)
+
+
+def select_rows(doc, where, sku=None, text=True):
+    """where 匹配的行（按 SKU 顺序）；sku 不为 None 时只在该 SKU 中查找。
+    text 为 False 时 where 为普通文本（没有查询语法的子串查找）抛出 ScriptError。
+    """
+    if isinstance(where, dict):
+        tests = [(_column(doc, k), _keys(v)) for k, v in where.items()]
+    else:
+        query = compile_query(where, doc.test_columns)
+        if query is None and not text:
+            raise ScriptError(
+                f"'where' {where!r} is plain text; use an object of column values "
+                "or a query such as 'TestID:RF_*'"
+            )
+    skus = doc.sku_list if sku is None else [sku]
+    rows = list(chain.from_iterable(doc.rows(s) for s in skus))
+    if isinstance(where, dict):
+        return [
+            row
+            for row in rows
+            if all(str(row[c]).strip() in keys for c, keys in tests)
+        ]
+    if query is None:
+        return doc.filter_rows(None, where, rows)
+    return query.filter(rows, doc)
+
+
+def _keys(value):
+    """where 中一列的取值：单个值或值列表（等于其中任一个即可）"""
+    values = value if isinstance(value, list) else [value]
+    return {str(v).strip() for v in values}
+
+
+def parse_script(data):
+    """检查 JSON 脚本内容，返回操作列表；格式错误抛出 ScriptError"""
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        raise ScriptError("The script must be a list of operations")
+    for i, op in enumerate(operations, 1):
+        if not isinstance(op, dict) or op.get("op") not in _OPERATIONS:
+            name = op.get("op") if isinstance(op, dict) else op
+            raise ScriptError(
+                f"Operation {i}: unknown operation {name!r}, "
+                f"expected one of {', '.join(_OPERATIONS)}"
+            )
+        for key in _OPERATIONS[op["op"]][1]:
+            if key not in op:
+                raise ScriptError(f"Operation {i} ({op['op']}): missing '{key}'")
+        where = op.get("where")
+        if where is not None and not isinstance(where, (dict, str)):
+            raise ScriptError(
+                f"Operation {i} ({op['op']}): 'where' must be an object or a query string"
+            )
+    return operations
+
+
+def load_script(path):
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ScriptError(f"{path}: invalid JSON: {e}")
+    return parse_script(data)
+
+
+def expand_paths(patterns):
+    """展开文件名、通配符（支持 **）和目录（其中的 *.ini），去重并保持顺序"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, "*.ini")))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def apply_operations(doc, operations):
+    """按顺序执行操作，返回 [(操作名, 影响的行数/SKU 数), ...]"""
+    return [(op["op"], _OPERATIONS[op["op"]][0](doc, op)) for op in operations]
+
+
+def process_file(path, operations, output=None):
+    """处理一个文件（在工作进程中执行）；output 为 None 时只执行不保存。
+    返回摘要 {"path", "output", "ok", "changes", "error", "seconds"}，出错不抛出异常。
+    """
+    start = time.perf_counter()
+    summary = {"path": path, "output": output, "ok": True, "changes": [], "error": None}
+    try:
+        doc = wanchai_core.load(path)
+        summary["changes"] = apply_operations(doc, operations)
+        if output is not None:
+            wanchai_core.dump(doc, output)
+    except Exception as e:
+        summary["ok"] = False
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def _process_args(args):
+    return process_file(*args)
+
+
+def output_paths(paths, output_dir=None, in_place=False):
+    """各文件的保存位置（都为 None 时只执行不保存）；输出目录中有重名文件时抛出 ScriptError"""
+    if in_place:
+        return list(paths)
+    if output_dir is None:
+        return [None] * len(paths)
+    outputs = [os.path.join(output_dir, os.path.basename(path)) for path in paths]
+    names = {}
+    for path, output in zip(paths, outputs):
+        key = os.path.normcase(output)
+        if key in names:
+            raise ScriptError(
+                f"{path} and {names[key]} would both be written to {output}"
+            )
+        names[key] = path
+    return outputs
+
+
+def run(paths, operations, output_dir=None, in_place=False, jobs=None):
+    """用进程池处理所有文件，按 paths 的顺序逐个产出摘要；jobs 为 1 时在当前进程中依次处理"""
+    outputs = output_paths(paths, output_dir, in_place)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, operations, output) for path, output in zip(paths, outputs)]
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield process_file(*task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        workers = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (workers * 4))
+        for summary in pool.map(_process_args, tasks, chunksize=chunksize):
+            yield summary
+
+
+def format_summary(summary):
+    """一行文本摘要"""
+    if not summary["ok"]:
+        return f"{summary['path']}: FAILED ({summary['seconds']:.2f}s) {summary['error']}"
+    changes = " ".join(f"{name}={count}" for name, count in summary["changes"])
+    target = f" -> {summary['output']}" if summary["output"] else " (not saved)"
+    return f"{summary['path']}: ok ({summary['seconds']:.2f}s) {changes}{target}"
@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import marshal
+import os
+import struct
+import sys
+
+# 注意：本模块不依赖 tkinter，也不依赖 wanchai_core（由 wanchai_core.load 调用）
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".wanchai-editor", "cache")
+DEFAULT_MAX_BYTES = 256 << 20
+
+_MAGIC = b"WANCHAI-CACHE 2\n"
+_ENTRY_SUFFIX = ".wcache"
+# 记录头：区块名长度、数据长度
+_RECORD = struct.Struct(">II")
+_HASH_CHUNK = 1 << 20
+# marshal 格式随 Python 版本变化，所以也放进指纹
+_FORMAT = f"{sys.version_info[0]}.{sys.version_info[1]}/{marshal.version}"
+
+logger = logging.getLogger(__name__)
+
+
+class ParseCache:
+    """解析结果的本地缓存：每个 INI 文件一个缓存文件，以 (路径, 大小, 修改时间, 内容哈希) 为指纹。
+    SKU 区块第一次从原文件解析后，解析出的行以 marshal 格式追加到缓存文件，
+    下次打开同一文件（指纹一致）时直接读出，不再分割 VALUES。
+    大小和修改时间与缓存中的相同时不再计算内容哈希；不同时才读全文件算哈希，
+    内容没变（只是修改时间变了）时沿用已有缓存。
+    缓存目录总大小超过 max_bytes 时按最近使用时间删除最旧的缓存文件。
+    缓存读写出错只会退回到解析原文件，不影响加载。
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def open(self, path, f=None):
+        """返回 path 的 CacheEntry：指纹一致时沿用已有缓存，否则新建（原文件已修改时旧缓存作废）。
+        f 为调用方已经以二进制方式打开的原文件时从这个句柄取指纹，
+        这样文件在打开前后被替换也不会把旧内容的缓存用到新内容上。
+        无法使用缓存时返回 None。
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entry_path = self._entry_path(path)
+            st = os.fstat(f.fileno()) if f is not None else os.stat(path)
+            entry = CacheEntry(self, entry_path, None)
+            stored = entry.read_index()
+            quick = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+            if stored is not None and stored[:3] == quick and stored[4] == _FORMAT:
+                # 大小和修改时间都没变，不再计算哈希
+                entry.fingerprint = stored
+            else:
+                entry.fingerprint = file_fingerprint(path, f)
+                if stored is not None and _same_content(stored, entry.fingerprint):
+                    # 只是修改时间变了（例如被 touch），沿用已解析的区块
+                    entry.update_fingerprint()
+                else:
+                    entry.create()
+            # 修改时间即最近使用时间，供 LRU 淘汰
+            os.utime(entry_path)
+            self.evict(keep=entry_path)
+            return entry
+        except OSError as e:
+            logger.warning("Parse cache unavailable for %s: %s", path, e)
+            return None
+
+    def evict(self, keep=None):
+        """缓存目录超过 max_bytes 时删除最久没用的缓存文件（keep 最后才删）"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            full = os.path.join(self.directory, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((full == keep, st.st_mtime, full, st.st_size))
+            total += st.st_size
+        entries.sort()
+        for _, _, full, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(full)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """删除所有缓存文件"""
+        for name in os.listdir(self.directory):
+            if name.endswith(_ENTRY_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _entry_path(self, path):
+        key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+
+class CacheEntry:
+    """一个 INI 文件的缓存：文件头为指纹，之后每条记录是一个已解析的 SKU 区块，
+    内容由 wanchai_core 决定（可被 marshal 序列化的任意对象）
+    """
+
+    def __init__(self, cache, path, fingerprint):
+        self.cache = cache
+        self.path = path
+        self.fingerprint = fingerprint
+        # {区块名: (数据位置, 数据长度)}
+        self._records = {}
+        # 文件头中指纹记录的字节数
+        self._header_size = None
+
+    def read_index(self):
+        """读出缓存文件中的指纹和各区块记录的位置，返回指纹；缓存不存在或已损坏时返回 None"""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        with f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            try:
+                header = self._read_record(f)
+                if header is None:
+                    return None
+                fingerprint = marshal.loads(header[1])
+                if not isinstance(fingerprint, tuple) or len(fingerprint) != 5:
+                    return None
+            except (EOFError, ValueError, TypeError):
+                return None
+            self._header_size = f.tell() - len(_MAGIC)
+            while True:
+                record = self._read_record(f, skip_data=True)
+                if record is None:
+                    break  # 文件结束（最后一条记录没写完时也到此为止）
+                name, pos, size = record
+                self._records[name] = (pos, size)
+        return fingerprint
+
+    def create(self):
+        """新建只有指纹的缓存文件（覆盖旧缓存）"""
+        self._records = {}
+        header = self._pack("", self.fingerprint)
+        self._header_size = len(header)
+        with open(self.path, "wb") as f:
+            f.write(_MAGIC + header)
+
+    def update_fingerprint(self):
+        """保留已有的区块记录，只改写文件头中的指纹；长度变了时改为新建"""
+        header = self._pack("", self.fingerprint)
+        if len(header) != self._header_size:
+            self.create()
+            return
+        with open(self.path, "r+b") as f:
+            f.seek(len(_MAGIC))
+            f.write(header)
+
+    def get(self, sku):
+        """读出区块的记录，没有缓存或读取失败时返回 None"""
+        record = self._records.get(sku)
+        if record is None:
+            return None
+        pos, size = record
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(pos)
+                data = f.read(size)
+            return marshal.loads(data)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning("Failed to read parse cache for SKU %s: %s", sku, e)
+            self._records.pop(sku, None)
+            return None
+
+    def put(self, sku, record):
+        """追加一个解析好的区块的记录"""
+        if sku in self._records:
+            return
+        data = self._pack(sku, record)
+        try:
+            # 缓存文件已被淘汰时不再写入（r+b 不会新建文件）
+            with open(self.path, "r+b") as f:
+                end = f.seek(0, os.SEEK_END)
+                f.write(data)
+            self.cache.evict(keep=self.path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning("Failed to write parse cache for SKU %s: %s", sku, e)
+            return
+        name_size, size = _RECORD.unpack_from(data)
+        self._records[sku] = (end + _RECORD.size + name_size, size)
+
+    @staticmethod
+    def _pack(name, obj):
+        name_bytes = name.encode("utf-8")
+        data = marshal.dumps(obj)
+        return _RECORD.pack(len(name_bytes), len(data)) + name_bytes + data
+
+    @staticmethod
+    def _read_record(f, skip_data=False):
+        """读一条记录：返回 (区块名, 数据) 或 skip_data 时 (区块名, 数据位置, 数据长度)；
+        文件结束或记录不完整时返回 None
+        """
+        head = f.read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            return None
+        name_size, size = _RECORD.unpack(head)
+        name = f.read(name_size)
+        if len(name) < name_size:
+            return None
+        name = name.decode("utf-8", "replace")
+        pos = f.tell()
+        if skip_data:
+            if f.seek(size, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                return None
+            return name, pos, size
+        data = f.read(size)
+        if len(data) < size:
+            return None
+        return name, data
+
+
+def file_fingerprint(path, f=None):
+    """(绝对路径, 大小, 修改时间, 内容 SHA-1, marshal 格式)，要读完整个文件。
+    f 为已经以二进制方式打开的 path 时从头读这个句柄，不再重新打开。
+    """
+    if f is None:
+        with open(path, "rb") as f:
+            st, digest = _hash_file(f)
+    else:
+        st, digest = _hash_file(f)
+    return (
+        os.path.abspath(path),
+        st.st_size,
+        st.st_mtime_ns,
+        digest.hexdigest(),
+        _FORMAT,
+    )
+
+
+def _hash_file(f):
+    """从头读完文件对象 f，返回它的 fstat 和内容的 SHA-1"""
+    st = os.fstat(f.fileno())
+    digest = hashlib.sha1()
+    f.seek(0)
+    chunk = f.read(_HASH_CHUNK)
+    while chunk:
+        digest.update(chunk)
+        chunk = f.read(_HASH_CHUNK)
+    return st, digest
+
+
+def _same_content(old, new):
+    """两个指纹是否为同一文件的相同内容（不管修改时间）"""
+    return (old[0], old[1], old[3], old[4]) == (new[0], new[1], new[3], new[4])
@@ -0,0 +1,1424 @@
+import contextlib
+import functools
+import io
+import itertools
+import logging
+import mmap
+import operator
+import os
+import re
+import stat
+import sys
+import tempfile
+import zlib
+from datetime import datetime
+
+from wanchai_parser import (
+    INFO_SECTION,
+    TOKEN_COUNT,
+    TOKEN_END,
+    TOKEN_INFO,
+    TOKEN_ITEM,
+    TOKEN_SECTION,
+    iter_lines,
+    parse_header,
+    scan_headers,
+    section_name,
+    split_values_many,
+    tokenize,
+)
+
+# 注意：本模块不依赖 tkinter，可在无界面的脚本/服务器中直接使用
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = [
+    "Identifier",
+    "TestID",
+    "Description",
+    "Enabled",
+    "StringLimit",
+    "LowLimit",
+    "HighLimit",
+    "LimitType",
+    "Unit",
+    "Parameters",
+]
+DEFAULT_HEADER = ",".join(DEFAULT_FIELDS)
+DEFAULT_COLUMNS = ["Index"] + DEFAULT_FIELDS
+INFO_KEYS = ["UnitCount", "Export Date"]
+
+# Apply Change To 选项
+APPLY_ALL_BY_FIELD = "all_by_field"
+APPLY_ALL = "all"
+APPLY_SKU_BY_FIELD = "sku_by_field"
+APPLY_SKU_ONLY = "sku_only"
+APPLY_CURRENT = "current"
+
+_CLIPBOARD_LINE_RE = re.compile(r"^(\d+)=.*?VALUES \((.*)\)$")
+
+# 解析时每攒够这么多条 test item 就批量分割一次 VALUES
+_SPLIT_BATCH = 1024
+
+# 导出时复制原文的块大小，以及重新生成的区块每批写出的行数
+_COPY_CHUNK = 1 << 20
+_WRITE_BATCH = 1000
+
+# 加载时读取区块开头多少字节来找 Count=
+_PEEK_SIZE = 4096
+
+
+def format_row(values, enabled_idx=3):
+    """按导出格式格式化一行字段（enabled_idx 位置的 Enabled 字段为 0/1 时不加引号）"""
+    formatted = []
+    for i, v in enumerate(values):
+        if i == enabled_idx and str(v) in ("0", "1"):
+            formatted.append(str(v))
+        else:
+            formatted.append(f"'{v}'")
+    return f"({','.join(formatted)})"
+
+
+def format_export_date(now=None):
+    """生成 Info 区 Export Date 字段格式的时间串"""
+    if now is None:
+        now = datetime.now()
+    return f"{now.month}/{now.day}/{now.year} {now.strftime('%I:%M:%S %p')}"
+
+
+def format_clipboard(rows, columns=DEFAULT_COLUMNS):
+    """把行（含 Index，按 columns 顺序）格式化为剪贴板文本，与导出格式一致"""
+    header = ",".join(columns[1:])
+    enabled_idx = columns.index("Enabled") - 1 if "Enabled" in columns else -1
+    lines = []
+    for row in rows:
+        values = format_row(row[1 : len(columns)], enabled_idx)
+        lines.append(f"{row[0]}=({header}) VALUES {values}")
+    return "\n".join(lines)
+
+
+def parse_clipboard(text, columns=DEFAULT_COLUMNS, skipped=None):
+    """解析剪贴板文本中的 test item 行，按各行自己的表头把字段放到 columns 对应的位置，
+    返回字段列表（按 columns[1:] 顺序，不含 Index）。columns 中没有的列被忽略。
+    不是 test item 的行和字段数不够的行被跳过；skipped 为列表时把这些行追加进去，由调用方提示。
+    """
+    lines = [(line, _CLIPBOARD_LINE_RE.match(line)) for line in text.strip().splitlines()]
+    split = iter(split_values_many([m.group(2) for _, m in lines if m]))
+    layouts = {}
+    parsed_rows = []
+    for line, m in lines:
+        if m:
+            header = parse_header(line.partition("=")[2].strip())
+            layout = layouts.get(header)
+            if layout is None:
+                layout = layouts[header] = Layout(header, columns)
+            values = next(split)
+            if len(values) >= len(layout.fields):
+                parsed_rows.append(layout.build("", values, len(columns))[1:])
+                continue
+        if skipped is not None:
+            skipped.append(line)
+    return parsed_rows
+
+
+class Layout:
+    """一种 test item 表头 "(Identifier,TestID,...)" 编译出的字段映射：
+    fields 为表头中的列名，positions 为各列在 columns（文档的 test_columns）中的位置。
+    解析时按 positions 把 VALUES 中的字段放到文档的列上，导出时按 positions 取出字段，
+    同一种表头只编译一次，逐行处理时不再查列名。header 为 None 时使用默认表头。
+    """
+
+    __slots__ = ("header", "fields", "positions", "enabled_idx", "_identity", "_get")
+
+    def __init__(self, header, columns):
+        if header is None:
+            header = DEFAULT_HEADER
+        self.header = header.strip()
+        if self.header:
+            self.fields = [h.strip() for h in self.header.split(",")]
+        else:
+            self.fields = list(DEFAULT_FIELDS)
+        self.positions = [
+            columns.index(f) if f in columns else None for f in self.fields
+        ]
+        self.enabled_idx = (
+            self.fields.index("Enabled") if "Enabled" in self.fields else -1
+        )
+        # 表头与 columns 的顺序一致时直接切片
+        self._identity = self.positions == list(range(1, len(self.fields) + 1))
+        known = [p for p in self.positions if p is not None]
+        if len(known) == 1:
+            self._get = lambda values, p=known[0]: (values[p],)
+        else:
+            self._get = operator.itemgetter(*known) if known else lambda values: ()
+
+    def build(self, index, values, width):
+        """按表头把 VALUES 中的字段放到宽度为 width 的文档行上（第 0 列为 index），多出的字段忽略"""
+        if self._identity:
+            row = [index]
+            row += values[: len(self.fields)]
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            return row
+        row = [index] + [""] * (width - 1)
+        for pos, value in zip(self.positions, values):
+            if pos is not None:
+                row[pos] = value
+        return row
+
+    def extract(self, values):
+        """按表头顺序取出文档行中的字段"""
+        return self._get(values)
+
+
+def intern_values(values):
+    """驻留字段字符串：Identifier、Unit、LimitType、Enabled 等大量重复的值只保留一份"""
+    return [sys.intern(v) if type(v) is str else v for v in values]
+
+
+class SkuSection:
+    """一个 SKU 区块：name 为区块名（即 SKU 名称），rows 为其下按顺序排列的 TestItem。
+    行的 Identifier 与区块名相同时，该字段里存的就是区块对象本身，
+    显示/导出时才取 name 填入，因此重命名 SKU 只需修改 name。
+    load 得到的区块按需解析：第一次访问 rows 时才从原文件读出并解析该区块。
+    """
+
+    __slots__ = (
+        "name",
+        "_rows",
+        "header",
+        "source",
+        "declared_count",
+        "_loader",
+        "_renamed",
+    )
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self._rows = rows if rows is not None else []
+        # 区块中第一条 test item 的表头 "(...)" 内的列名串，导出时按它的列顺序写出；None 为默认表头
+        self.header = None
+        # 加载后未修改时为该区块在原文件中的字节范围和内容校验值 (start, end, crc32)，修改后置为 None
+        self.source = None
+        # 原文件中的 Count= 值，区块还没解析时用作行数
+        self.declared_count = None
+        # 解析函数 loader(section)，解析后置为 None
+        self._loader = None
+        # 解析前已改名：解析出的行 Identifier 都改为新名称（与先解析再改名的结果相同）
+        self._renamed = False
+
+    @property
+    def rows(self):
+        loader = self._loader
+        if loader is not None:
+            self._loader = None
+            self._rows = []
+            try:
+                loader(self)
+            except BaseException:
+                self._loader = loader
+                raise
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._loader = None
+        self._rows = rows
+
+    @property
+    def parsed(self):
+        return self._loader is None
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        if not self.parsed:
+            return f"SkuSection({self.name!r}, not parsed)"
+        return f"SkuSection({self.name!r}, {len(self._rows)} rows)"
+
+
+class TestItem:
+    """一条测试项目：values 为按 test_columns 顺序的字段（含 Index），section 为所属 SKU 区块，
+    uid 为加载/创建时分配的稳定 ID（不随 Index 重新编号而变化，界面 Treeview 的 iid 即为 uid）。
+    支持按下标读写和切片，可以像原来的行列表一样使用；通过下标/迭代读出的 Identifier 已填好 SKU 名称，
+    values 中则可能是 SkuSection 对象。
+    """
+
+    __slots__ = ("uid", "section", "values", "_haystack")
+
+    def __init__(self, uid, section, values):
+        self.uid = uid
+        self.section = section
+        self.values = values
+        # 除 Index 外所有字段的小写拼接，搜索时才生成，字段修改后失效；
+        # 以 "\x01" 开头表示有字段引用所在区块（区块名不拼进去，改名后也不用失效）
+        self._haystack = None
+
+    @property
+    def sku(self):
+        return self.section.name
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        if type(value) is SkuSection:
+            return value.name
+        if type(i) is slice:
+            return [v.name if type(v) is SkuSection else v for v in value]
+        return value
+
+    def __setitem__(self, i, value):
+        self.values[i] = sys.intern(value) if type(value) is str else value
+        if i != 0:
+            self._haystack = None
+
+    def set_values(self, values):
+        """整行替换字段"""
+        self.values = intern_values(values)
+        self._haystack = None
+
+    def haystack(self):
+        """返回（必要时生成）_haystack"""
+        haystack = self._haystack
+        if haystack is None:
+            marker = ""
+            fields = []
+            for v in self.values[1:]:
+                if type(v) is SkuSection:
+                    marker = "\x01"
+                else:
+                    fields.append(str(v).lower())
+            haystack = marker + "\x00".join(fields)
+            self._haystack = haystack
+        return haystack
+
+    def matches(self, term):
+        """任一字段包含 term（须已转为小写）即匹配"""
+        haystack = self.haystack()
+        if term in haystack or term in str(self.values[0]):
+            return True
+        return haystack[:1] == "\x01" and term in self.section.name.lower()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return (v.name if type(v) is SkuSection else v for v in self.values)
+
+    def __repr__(self):
+        return f"TestItem({self.uid!r}, {self.sku!r}, {self[:]!r})"
+
+
+_HAYSTACK = operator.attrgetter("_haystack")
+_SECTION = operator.attrgetter("section")
+_VALUES = operator.attrgetter("values")
+_FIRST = operator.itemgetter(0)
+
+
+def strings(values):
+    """把一列字段转为字符串列表；通常本来就都是字符串（只有引用区块的 Identifier 不是），不逐个转换"""
+    if set(map(type, values)) <= {str}:
+        return values
+    return list(map(str, values))
+
+
+def match_rows(rows, term):
+    """rows 中 matches(term) 为真的行（按原顺序，term 须已转为小写）。
+    逐行判断都用 map 在 C 里完成，不再逐行调用 matches
+    """
+    haystacks = list(map(_HAYSTACK, rows))
+    if None in haystacks:
+        haystacks = [row.haystack() for row in rows]
+    terms = itertools.repeat(term)
+    hits = map(operator.contains, haystacks, terms)
+    indexes = strings(list(map(_FIRST, map(_VALUES, rows))))
+    hits = list(map(operator.or_, hits, map(operator.contains, indexes, terms)))
+    # Identifier 引用区块的行按区块名匹配，每个区块只判断一次
+    named = {s for s in set(map(_SECTION, rows)) if term in s.name.lower()}
+    if named:
+        for i, row in enumerate(rows):
+            if not hits[i] and haystacks[i][:1] == "\x01" and row.section in named:
+                hits[i] = True
+    return list(itertools.compress(rows, hits))
+
+
+class ValueIndex:
+    """倒排索引：(列, 去掉首尾空白后的值) -> 持有该值的行 uid（不索引 Index 列）。
+    只有一行时直接存 uid，多行时存 set，减少内存。
+    引用所在区块的 Identifier 字段（SkuSection）不进索引，按区块查找即可。
+    """
+
+    def __init__(self, width):
+        self._columns = [None] + [{} for _ in range(1, width)]
+        # 该列所有值都与索引的键相同（没有首尾空白），搜索时可以只判断各个不同的键
+        self._exact = [False] + [True] * (width - 1)
+
+    def add(self, row):
+        for col in range(1, len(self._columns)):
+            self._add(col, row.values[col], row.uid)
+
+    def remove(self, row):
+        for col in range(1, len(self._columns)):
+            self._remove(col, row.values[col], row.uid)
+
+    def update(self, row, col, old_value, new_value):
+        if col:
+            self._remove(col, old_value, row.uid)
+            self._add(col, new_value, row.uid)
+
+    def lookup(self, col, value):
+        """该列值（去掉首尾空白后）等于 value 的行 uid 列表"""
+        found = self._columns[col].get(str(value).strip())
+        if found is None:
+            return []
+        if type(found) is int:
+            return [found]
+        return list(found)
+
+    def distinct(self, col):
+        """该列不同的值（键）的个数"""
+        return len(self._columns[col])
+
+    def select(self, col, test):
+        """该列值满足 test(值) 的行 uid 集合，每个不同的值只判断一次；
+        该列有首尾带空白的值时键与原值不同，返回 None
+        """
+        if not self._exact[col]:
+            return None
+        uids = set()
+        for key, found in self._columns[col].items():
+            if test(key):
+                if type(found) is int:
+                    uids.add(found)
+                else:
+                    uids.update(found)
+        return uids
+
+    def _add(self, col, value, uid):
+        if type(value) is SkuSection:
+            return
+        key = str(value).strip()
+        if key != value:
+            self._exact[col] = False
+        table = self._columns[col]
+        found = table.get(key)
+        if found is None:
+            table[key] = uid
+        elif type(found) is int:
+            if found != uid:
+                table[key] = {found, uid}
+        else:
+            found.add(uid)
+
+    def _remove(self, col, value, uid):
+        if type(value) is SkuSection:
+            return
+        key = str(value).strip()
+        table = self._columns[col]
+        found = table.get(key)
+        if found is None:
+            return
+        if type(found) is int:
+            if found == uid:
+                del table[key]
+        else:
+            found.discard(uid)
+            if len(found) == 1:
+                table[key] = found.pop()
+
+
+class WanchaiDocument:
+    """WanChai INI 文档模型：Info 字段、SKU 列表和所有测试项目"""
+
+    def __init__(self):
+        self.path = None
+        # 加载的原文件 (路径, 大小, 修改时间)，导出时据此复制未修改的区块
+        self.source = None
+        self.info = {}
+        self.has_info = False
+        # 所有区块表头中出现过的列（默认列在前，其他列按出现顺序追加，只增不减），
+        # 每行的 values 都按这个顺序存放
+        self.test_columns = list(DEFAULT_COLUMNS)
+        # {表头串: Layout}
+        self._layouts = {}
+        # SKU 顺序
+        self.sku_list = []
+        # {sku: SkuSection}，每条 TestItem 只存这一份
+        # 按 SKU 分开存放，单个 SKU 的查询/编号只需遍历该 SKU 的行
+        self.sections = {}
+        # {uid: TestItem}
+        self._items = {}
+        self._next_uid = itertools.count(1)
+        # 每次修改行数据时递增，供搜索等缓存判断是否失效
+        self.version = 0
+        # 值 -> 行 的倒排索引，第一次批量修改时才建立，之后随修改同步更新
+        # （因此文档内修改字段都要经过 _set_field / _set_values）
+        self._value_index = None
+        # Identifier 与所在 SKU 不一致的行 uid，下次批量修改时需要重新归组
+        self._detached = set()
+
+    @property
+    def id_idx(self):
+        if "Identifier" in self.test_columns:
+            return self.test_columns.index("Identifier")
+        return 1
+
+    def layout(self, header):
+        """表头串（None 为默认表头）对应的 Layout；表头中有新列时先加入 test_columns"""
+        layout = self._layouts.get(header)
+        if layout is None:
+            fields = Layout(header, self.test_columns).fields
+            self.add_columns([f for f in fields if f not in self.test_columns])
+            layout = self._layouts[header] = Layout(header, self.test_columns)
+        return layout
+
+    def add_columns(self, names):
+        """在 test_columns 末尾追加列，已有的行补空字段"""
+        names = [n for n in dict.fromkeys(names) if n not in self.test_columns]
+        if not names:
+            return
+        self.version += 1
+        self.test_columns.extend(names)
+        padding = [""] * len(names)
+        for item in self._items.values():
+            item.values.extend(padding)
+        # 倒排索引按列建立，列变了就下次重新建立
+        self._value_index = None
+
+    def section(self, sku):
+        """返回 SKU 区块，不存在时新建（不加入 sku_list）"""
+        section = self.sections.get(sku)
+        if section is None:
+            section = self.sections[sku] = SkuSection(sku)
+        return section
+
+    def new_item(self, sku, values):
+        """创建一条带新 uid 的 TestItem（尚未放入任何 SKU）"""
+        return self._new_item(self.section(sku), values)
+
+    def _new_item(self, section, values):
+        item = TestItem(next(self._next_uid), section, intern_values(values))
+        self._attach_identifier(item)
+        self._items[item.uid] = item
+        if self._value_index is not None:
+            self._value_index.add(item)
+        return item
+
+    def _attach_identifier(self, row):
+        """Identifier 与所在 SKU 相同时改为引用区块对象，不同时记入 _detached"""
+        id_idx = self.id_idx
+        values = row.values
+        if id_idx >= len(values):
+            return
+        value = values[id_idx]
+        if type(value) is SkuSection:
+            value = value.name
+        if value == row.section.name:
+            values[id_idx] = row.section
+            self._detached.discard(row.uid)
+        else:
+            values[id_idx] = value
+            self._detached.add(row.uid)
+
+    def value_index(self):
+        """返回（必要时建立）值 -> 行 的倒排索引"""
+        if self._value_index is None:
+            # 索引覆盖全部行，先解析所有区块
+            self.parse_all()
+            index = ValueIndex(len(self.test_columns))
+            for item in self._items.values():
+                index.add(item)
+            self._value_index = index
+        return self._value_index
+
+    def search_index(self):
+        """搜索用的倒排索引：已建立时直接返回；还没建立时只在所有区块都已解析时才建立，
+        否则返回 None（不为了搜索去解析其他区块）
+        """
+        if self._value_index is None:
+            if not all(section.parsed for section in self.sections.values()):
+                return None
+        return self.value_index()
+
+    def select_uids(self, col, test):
+        """该列值满足 test(值) 的行 uid 集合（通过 search_index，每个不同的值只判断一次）；
+        没有索引或索引不能代替逐行判断时返回 None
+        """
+        index = self.search_index()
+        uids = index.select(col, test) if index is not None else None
+        if uids is not None and col == self.id_idx:
+            # 引用区块的 Identifier 不在索引里，按区块名判断
+            for section in self.sections.values():
+                if test(section.name):
+                    uids.update(
+                        row.uid for row in section.rows if row.values[col] is section
+                    )
+        return uids
+
+    def _set_field(self, row, col, value):
+        """修改一个字段并同步倒排索引"""
+        old_value = row.values[col]
+        row[col] = value
+        row.section.source = None
+        if col == self.id_idx:
+            self._attach_identifier(row)
+        if self._value_index is not None:
+            self._value_index.update(row, col, old_value, row.values[col])
+
+    def _set_values(self, row, values):
+        if self._value_index is not None:
+            self._value_index.remove(row)
+        row.set_values(values)
+        row.section.source = None
+        self._attach_identifier(row)
+        if self._value_index is not None:
+            self._value_index.add(row)
+
+    def _touch(self, sku):
+        """标记 SKU 区块已修改，导出时需重新生成"""
+        section = self.sections.get(sku)
+        if section is not None:
+            section.source = None
+
+    # ---------- 查询 ----------
+
+    def get_item(self, uid):
+        """按 uid 查找 TestItem（uid 可以是 Treeview 返回的字符串），找不到返回 None"""
+        try:
+            return self._items.get(int(uid))
+        except (TypeError, ValueError):
+            return None
+
+    def position(self, uid):
+        """uid 对应的行在其 SKU 内的位置（从 0 开始），找不到返回 None"""
+        item = self.get_item(uid)
+        if item is None:
+            return None
+        try:
+            return self.rows(item.sku).index(item)
+        except ValueError:
+            return None
+
+    def rows(self, sku):
+        """某个 SKU 下的所有行（按顺序，返回内部列表，不要直接修改）"""
+        section = self.sections.get(sku)
+        return section.rows if section is not None else []
+
+    def iter_rows(self):
+        """按 SKU 顺序遍历所有 (row, sku)"""
+        for sku in self.sku_list:
+            for row in self.rows(sku):
+                yield row, sku
+
+    def count(self, sku):
+        """SKU 的行数；区块还没解析时取原文件中的 Count= 值，不触发解析"""
+        section = self.sections.get(sku)
+        if section is None:
+            return 0
+        if not section.parsed and section.declared_count is not None:
+            return section.declared_count
+        return len(section.rows)
+
+    def parse_all(self):
+        """解析所有还没解析的区块"""
+        for section in list(self.sections.values()):
+            section.rows
+
+    def find_row(self, sku, index):
+        """按 Index 查找某个 SKU 下的行"""
+        index = str(index)
+        for row in self.rows(sku):
+            if str(row[0]) == index:
+                return row
+        return None
+
+    def position_of(self, sku, index):
+        """某个 Index 在 SKU 内的位置（从 0 开始），找不到返回 None"""
+        index = str(index)
+        for pos, row in enumerate(self.rows(sku)):
+            if str(row[0]) == index:
+                return pos
+        return None
+
+    def filter_rows(self, sku, search_term="", rows=None):
+        """某个 SKU 下任一字段包含 search_term（不区分大小写）的行；rows 不为 None 时只在 rows 中查找"""
+        search_term = search_term.lower()
+        if rows is None:
+            rows = self.rows(sku)
+        if not search_term:
+            return list(rows)
+        return match_rows(rows, search_term)
+
+    # ---------- SKU 操作 ----------
+
+    def rename_sku(self, sku, new_sku):
+        """重命名 SKU：只改区块名，其下各行的 Identifier 随之改变"""
+        if new_sku in self.sku_list:
+            raise ValueError(
+                "Target SKU name is duplicated with another SKU, please check."
+            )
+        self.version += 1
+        if sku in self.sku_list:
+            self.sku_list[self.sku_list.index(sku)] = new_sku
+        section = self.sections.pop(sku, None)
+        if section is not None:
+            section.name = new_sku
+            section.source = None
+            section._renamed = not section.parsed
+            self.sections[new_sku] = section
+            self._reattach_detached({section})
+        return new_sku
+
+    def add_suffix(self, sku, suffix):
+        """给单个 SKU 添加后缀，返回新的 SKU 名称"""
+        return self.rename_sku(sku, sku + suffix)
+
+    def backspace_sku(self, sku):
+        """删除 SKU 名称的最后一个字符，返回新的 SKU 名称"""
+        if not sku or len(sku) <= 1:
+            return None
+        return self.rename_sku(sku, sku[:-1])
+
+    def add_suffix_to_all(self, suffix):
+        """给所有 SKU 添加后缀，返回 {旧名称: 新名称}"""
+        self.version += 1
+        sku_map = {sku: sku + suffix for sku in self.sku_list}
+        sections = {}
+        for sku, section in self.sections.items():
+            section.name = sku_map.get(sku, sku)
+            section.source = None
+            section._renamed = not section.parsed
+            sections[section.name] = section
+        self.sections = sections
+        self.sku_list = [sku_map[sku] for sku in self.sku_list]
+        self._reattach_detached(set(sections.values()))
+        return sku_map
+
+    def add_sku(self, sku, position=None, header=None):
+        """新建空的 SKU 区块，插入到 sku_list 的 position 位置（None 为末尾）；
+        header 为区块的表头串（None 为默认表头）
+        """
+        if sku in self.sku_list:
+            raise ValueError(f"SKU {sku} already exists.")
+        self.version += 1
+        section = self.section(sku)
+        section.header = header
+        self.layout(header)
+        if position is None:
+            self.sku_list.append(sku)
+        else:
+            self.sku_list.insert(position, sku)
+        return section
+
+    def remove_sku(self, sku):
+        """删除整个 SKU 区块及其下所有行"""
+        section = self.sections.get(sku)
+        if section is not None:
+            # 还没解析的区块没有登记任何行，直接丢弃，不必先解析
+            if section.parsed:
+                self.delete_items([row.uid for row in section.rows])
+            del self.sections[sku]
+        if sku in self.sku_list:
+            self.sku_list.remove(sku)
+        self.version += 1
+
+    def _reattach_detached(self, sections):
+        """改名后，这些区块内 Identifier 不一致的行也改为新的区块名（与改名前逐行改写的结果相同）"""
+        id_idx = self.id_idx
+        for uid in list(self._detached):
+            row = self._items.get(uid)
+            if row is not None and row.section in sections:
+                self._set_field(row, id_idx, row.section.name)
+
+    # ---------- 行操作 ----------
+
+    def renumber(self, sku):
+        """重新编号某个 SKU 下的 Index 字段，返回是否有编号变化；
+        编号都没变时不算修改（区块仍可原样导出）
+        """
+        changed = False
+        for idx, row in enumerate(self.rows(sku), 1):
+            index = str(idx)
+            if row.values[0] != index:
+                row[0] = index
+                changed = True
+        if changed:
+            self.version += 1
+            self._touch(sku)
+        return changed
+
+    def _rows_changed(self, sku):
+        """SKU 的行列表被直接修改（插入、替换、移动）后标记区块已修改并重新编号"""
+        self.version += 1
+        self._touch(sku)
+        self.renumber(sku)
+
+    def make_row(self, sku, values):
+        """用字段值（不含 Index）构造一行，Identifier 字段设为 sku"""
+        row = ["TMP_INDEX"] + [str(v) if v is not None else "" for v in values]
+        row += [""] * (len(self.test_columns) - len(row))
+        row[self.id_idx] = sku
+        return self.new_item(sku, row)
+
+    def insert_rows(self, sku, position, rows):
+        """在 SKU 内的 position 位置插入多行（None 表示末尾），并重新编号"""
+        sku_rows = self.section(sku).rows
+        if position is None or position >= len(sku_rows):
+            sku_rows.extend(rows)
+        else:
+            sku_rows[position:position] = rows
+        self._rows_changed(sku)
+
+    def set_rows(self, sku, rows):
+        """把 SKU 的行按顺序替换为 rows（可包含 make_row / new_item 新建的行），并重新编号；
+        不再保留的原有行须先用 delete_items 删除
+        """
+        self.section(sku).rows[:] = rows
+        self._rows_changed(sku)
+
+    def delete_items(self, uids):
+        """删除 uid 在 uids 中的行（只影响这些行所在的 SKU），返回受影响的 SKU 列表"""
+        self.version += 1
+        by_sku = {}
+        for uid in uids:
+            item = self._items.pop(int(uid), None)
+            if item is not None:
+                if self._value_index is not None:
+                    self._value_index.remove(item)
+                self._detached.discard(item.uid)
+                by_sku.setdefault(item.sku, set()).add(item.uid)
+        for sku, sku_uids in by_sku.items():
+            self._touch(sku)
+            rows = self.rows(sku)
+            if rows:
+                rows[:] = [row for row in rows if row.uid not in sku_uids]
+        return list(by_sku)
+
+    def move_row(self, sku, from_pos, to_pos):
+        """在 SKU 内把 from_pos 位置的行移动到 to_pos，并重新编号"""
+        rows = self.rows(sku)
+        if from_pos >= len(rows) or to_pos >= len(rows):
+            return False
+        if from_pos != to_pos:
+            rows.insert(to_pos, rows.pop(from_pos))
+            self._rows_changed(sku)
+        return True
+
+    def duplicate_rows(self, sku, uids):
+        """把选中行的副本按原顺序插入到最后一个选中行之后"""
+        rows = self.rows(sku)
+        uids = {int(uid) for uid in uids}
+        selected = [(pos, row) for pos, row in enumerate(rows) if row.uid in uids]
+        if not selected:
+            return
+        copies = [self.new_item(sku, ["TMP_INDEX"] + row[1:]) for (pos, row) in selected]
+        self.insert_rows(sku, selected[-1][0] + 1, copies)
+
+    def copy_to_other_skus(self, sku, uids):
+        """把选中行分别插入到所有其他 SKU 的相同 index 位置（超出则插入末尾），返回目标 SKU 列表"""
+        selected_rows = []
+        for uid in uids:
+            row = self.get_item(uid)
+            if row is not None and row.sku == sku:
+                selected_rows.append((int(row[0]), row))
+        selected_rows.sort(key=lambda pair: pair[0])
+        other_skus = [s for s in self.sku_list if s != sku]
+        id_idx = self.id_idx
+        for target in other_skus:
+            target_rows = self.section(target).rows
+            # 等价于按 index 顺序逐行 insert(min(sel_idx - 1, 当前长度))，
+            # 但只模拟新行之间的先后，原有行不动：placed 为 [(前面的原有行数, 新行), ...]
+            size = len(target_rows)
+            placed = []
+            for k, (sel_idx, row) in enumerate(selected_rows):
+                values = ["TMP_INDEX"] + row[1:]
+                values[id_idx] = target
+                pos = min(sel_idx - 1, size + k)
+                # index 递增时新行总是排在已插入的新行之后，只有 index 重复时才需要往前找
+                j = len(placed)
+                while j and placed[j - 1][0] + j - 1 >= pos:
+                    j -= 1
+                placed.insert(j, (pos - j, self.new_item(target, values)))
+            # 一次归并出新的行列表
+            merged = []
+            start = 0
+            for gap, new_row in placed:
+                merged.extend(target_rows[start:gap])
+                start = gap
+                merged.append(new_row)
+            merged.extend(target_rows[start:])
+            target_rows[:] = merged
+            self._rows_changed(target)
+        return other_skus
+
+    def _edit_plan(self, old_row, new_values, apply_to):
+        """批量修改要做的替换：[(列, 原值, 新值), ...]，按执行顺序排列"""
+        columns = self.test_columns
+        old_values = [v if v is not None else "" for v in old_row[1:]]
+        plan = []
+        if apply_to in (APPLY_ALL, APPLY_SKU_ONLY):
+            # 任意字段：所有等于原值的字段都替换为新值
+            for j, old_val in enumerate(old_values):
+                new_val = new_values[j + 1]
+                if old_val == new_val:
+                    continue
+                for c in range(1, len(columns)):  # 跳过 Index
+                    plan.append((c, old_val, new_val))
+        elif apply_to in (APPLY_ALL_BY_FIELD, APPLY_SKU_BY_FIELD):
+            # 精确字段：只替换被修改字段中等于原值的
+            old_full = [old_row[0]] + old_values
+            for c in range(len(columns)):
+                if old_full[c] != new_values[c]:
+                    plan.append((c, old_full[c], new_values[c]))
+        return plan
+
+    def _rows_with_value(self, col, value, sku=None):
+        """该列值（去掉首尾空白后）等于 value 的行；sku 不为 None 时只限该 SKU"""
+        if col == 0:
+            # Index 列每次重新编号都会变化，不进索引，直接扫描
+            key = str(value).strip()
+            rows = self.rows(sku) if sku is not None else self.all_rows()
+            return [row for row in rows if str(row[0]).strip() == key]
+        if sku is not None and self._value_index is None:
+            # 只涉及一个 SKU 且还没建索引时直接扫描该 SKU，不必为建索引解析所有区块
+            key = str(value).strip()
+            return [row for row in self.rows(sku) if str(row[col]).strip() == key]
+        items = self._items
+        rows = [items[uid] for uid in self.value_index().lookup(col, value)]
+        if col == self.id_idx:
+            # 引用区块的 Identifier 不在索引里，按区块名找
+            key = str(value).strip()
+            for section in self.sections.values():
+                if section.name.strip() == key:
+                    rows.extend(row for row in section.rows if row.values[col] is section)
+        if sku is not None:
+            rows = [row for row in rows if row.sku == sku]
+        return rows
+
+    def _edit_writes(self, old_row, new_values, apply_to, written=None):
+        """按 _edit_plan 依次产出批量修改要写的 (行, 列, 新值)，由调用方写入文档。
+        written 不为 None 时为试算：不修改文档，写入记在 written {(uid, 列): (行, 新值)} 中，
+        后面的步骤按写入后的值匹配，前面写入的值被后面的步骤再次替换（连锁替换）时与真正执行的结果相同
+        """
+        sku = old_row.sku if apply_to in (APPLY_SKU_ONLY, APPLY_SKU_BY_FIELD) else None
+        # 试算写入的值 -> 行：{(列, 去掉首尾空白的值): {uid: 行}}
+        by_value = {}
+        for col, old_val, new_val in self._edit_plan(old_row, new_values, apply_to):
+            rows = self._rows_with_value(col, old_val, sku)
+            if written:
+                rows = [row for row in rows if (row.uid, col) not in written]
+                rows.extend(by_value.get((col, str(old_val).strip()), {}).values())
+            for row in rows:
+                yield row, col, new_val
+                if written is not None:
+                    key = (row.uid, col)
+                    if key in written:
+                        previous = str(written[key][1]).strip()
+                        by_value[(col, previous)].pop(row.uid, None)
+                    written[key] = (row, new_val)
+                    by_value.setdefault((col, str(new_val).strip()), {})[row.uid] = row
+
+    def preview_needs_index(self, uid, new_row, apply_to=APPLY_CURRENT):
+        """count_edit_changes 是否要先建立倒排索引（会解析所有还没解析的区块）"""
+        old_row = self.get_item(uid)
+        return (
+            old_row is not None
+            and apply_to in (APPLY_ALL, APPLY_ALL_BY_FIELD)
+            and self._value_index is None
+            and bool(self._edit_plan(old_row, list(new_row), apply_to))
+        )
+
+    def count_edit_changes(self, uid, new_row, apply_to=APPLY_CURRENT):
+        """预览：apply_edit 实际会改变多少行（执行后至少有一个字段与原来不同的行数）"""
+        old_row = self.get_item(uid)
+        if old_row is None:
+            return 0
+        if apply_to == APPLY_CURRENT:
+            return 1
+        written = {}
+        for _ in self._edit_writes(old_row, list(new_row), apply_to, written):
+            pass
+        return len(
+            {uid for (uid, col), (row, value) in written.items() if row[col] != value}
+        )
+
+    def apply_edit(self, uid, new_row, apply_to=APPLY_CURRENT):
+        """保存编辑对话框的修改；new_row 为按 test_columns 顺序的完整一行（含 Index）。
+        批量模式通过倒排索引只访问持有原值的行；有 Identifier 与 SKU 不一致时重新按 SKU 归组并编号。
+        """
+        old_row = self.get_item(uid)
+        if old_row is None:
+            return
+        self.version += 1
+        new_values = list(new_row)
+        if apply_to == APPLY_CURRENT:
+            self._set_values(old_row, new_values)
+            return
+        for row, col, new_val in self._edit_writes(old_row, new_values, apply_to):
+            self._set_field(row, col, new_val)
+        if self._detached:
+            self._regroup_by_identifier()
+
+    def set_field(self, rows, col, value):
+        """把 rows 中各行第 col 列设为 value，返回实际修改的行数；
+        修改了 Identifier 时与 apply_edit 一样重新按 SKU 归组并编号
+        """
+        self.version += 1
+        changed = 0
+        for row in rows:
+            if row[col] != value:
+                self._set_field(row, col, value)
+                changed += 1
+        if self._detached:
+            self._regroup_by_identifier()
+        return changed
+
+    def all_rows(self):
+        """按 SKU 顺序返回所有行"""
+        return [row for row, sku in self.iter_rows()]
+
+    def _regroup_by_identifier(self):
+        """按 Identifier 字段重新归组行，重新编号所有 SKU 并同步 SKU 列表（保持原有顺序）"""
+        id_idx = self.id_idx
+        all_rows = self.all_rows()
+        sections = {}
+        for row in all_rows:
+            sku = row[id_idx]
+            section = sections.get(sku)
+            if section is None:
+                # 已有同名区块时沿用该区块对象，否则新建（沿用该行原区块的表头）
+                section = self.sections.get(sku)
+                if section is None:
+                    section = SkuSection(sku)
+                    section.header = row.section.header
+                section.rows = []
+                section.source = None
+                sections[sku] = section
+            if row.section is not section:
+                row.section = section
+                self._set_field(row, id_idx, sku)
+            section.rows.append(row)
+            row[0] = str(len(section.rows))
+        self.sections = sections
+        self.sku_list = list(sections)
+
+    def update_export_date(self, now=None):
+        self.info["Export Date"] = format_export_date(now)
+        return self.info["Export Date"]
+
+
+def loads(lines):
+    """从字符串行迭代器（如文件对象）解析出 WanchaiDocument"""
+    doc = WanchaiDocument()
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    _parse(doc, lines)
+    return doc
+
+
+def _parse(doc, lines):
+    """一次性解析全部内容到 doc 中"""
+    current = None
+    pending = []
+    for token in tokenize(lines):
+        kind = token[0]
+        if kind == TOKEN_ITEM:
+            if current is None:
+                continue
+            _, idx, header, values_str = token
+            section = doc.sections[current]
+            if section.header is None:
+                section.header = header
+            pending.append((idx, values_str, header, section))
+            if len(pending) >= _SPLIT_BATCH:
+                _flush_items(doc, pending)
+                pending = []
+        elif kind == TOKEN_SECTION:
+            if token[1] == INFO_SECTION:
+                doc.has_info = True
+                current = None
+            else:
+                current = token[1]
+                if current not in doc.sections:
+                    doc.sku_list.append(current)
+                    doc.section(current)
+        elif kind == TOKEN_END:
+            current = None
+        elif kind == TOKEN_INFO:
+            doc.info.setdefault(token[1], token[2])
+    _flush_items(doc, pending)
+
+
+def _flush_items(doc, pending):
+    """批量分割攒下的 test item [(index, VALUES 串, 表头串, SkuSection), ...]，
+    按各自的表头放到文档的列上并追加到所在区块，返回有解析失败行的 SKU
+    """
+    split = split_values_many([p[1] for p in pending if p[1] is not None])
+    pos = 0
+    failed = set()
+    for idx, values_str, header, section in pending:
+        if values_str is None:
+            values = []
+        else:
+            values = split[pos]
+            pos += 1
+        layout = doc.layout(header)
+        if len(values) < len(layout.fields):
+            logger.warning(
+                "Failed to parse test item in %s: index=%s, content=%s",
+                section.name,
+                idx,
+                values_str,
+            )
+            failed.add(section.name)
+            continue
+        values = layout.build(idx, values, len(doc.test_columns))
+        if section._renamed:
+            values[doc.id_idx] = section.name
+        section.rows.append(doc._new_item(section, values))
+    return failed
+
+
+class LoadCancelled(Exception):
+    """由 load 的 progress 回调抛出，用于中止加载"""
+
+
+class SourceChanged(Exception):
+    """按需解析区块时发现原文件中该区块的内容在加载后被修改，或原文件已被删除"""
+
+
+def load(path, progress=None, cache=None):
+    """读取 INI 文件：在内存映射的文件中扫描区块头，建立各 SKU 区块在原文件中的字节范围索引
+    （并读出 Info 区和 Count= 值），各 SKU 的行在第一次用到时才解析（见 SkuSection.rows），
+    没用到的区块不会被解码，也不占内存；导出时未修改的区块直接复制原文。
+    各区块记下内容的 crc32，原文件的大小或修改时间变了时按内容判断区块是否还能使用。
+    progress(doc, sku, done, total) 在索引建好后对每个 SKU 调用一次，done/total 为该区块结束位置/总字节数；
+    回调中抛出 LoadCancelled 可中止加载。
+    cache 为 wanchai_cache.ParseCache 时，区块优先从缓存读出，从原文件解析的区块也写入缓存。
+    """
+    doc = WanchaiDocument()
+    with open(path, "rb") as f, _mapped(f) as data:
+        # 缓存的指纹取自同一个文件句柄，与下面扫描的内容一致
+        entry = cache.open(path, f) if cache is not None else None
+        st = os.fstat(f.fileno())
+        headers = scan_headers(data)
+        # {sku: [(start, end), ...]}，同名区块出现多次时有多个范围
+        ranges = {}
+        for i, (start, line) in enumerate(headers):
+            end = headers[i + 1][0] if i + 1 < len(headers) else st.st_size
+            name = section_name(line.decode("utf-8").rstrip("\r\n"))
+            if name is None:
+                continue
+            if name == INFO_SECTION:
+                doc.has_info = True
+                for token in tokenize(iter_lines(data, start, end)):
+                    if token[0] == TOKEN_INFO:
+                        doc.info.setdefault(token[1], token[2])
+                continue
+            byte_range = (start, end, _checksum(data, start, end))
+            if name in ranges:
+                ranges[name].append(byte_range)
+                continue
+            ranges[name] = [byte_range]
+            doc.sku_list.append(name)
+            section = doc.section(name)
+            section.declared_count, section.header = _peek_section(data, start, end)
+            # 先登记表头中的列，界面打开文件时就能显示所有列
+            doc.layout(section.header)
+            section._loader = functools.partial(
+                _parse_section, doc, ranges[name], name, entry
+            )
+    doc.path = path
+    doc.source = (path, st.st_size, st.st_mtime_ns)
+    for name, section_ranges in ranges.items():
+        # 出现多次的区块导出时不能直接复制原文
+        if len(section_ranges) == 1:
+            doc.sections[name].source = section_ranges[0]
+    if progress is not None:
+        for name in doc.sku_list:
+            progress(doc, name, ranges[name][0][1], st.st_size)
+    return doc
+
+
+def _parse_section(doc, ranges, name, entry, section):
+    """解析一个 SKU 区块的行（section 的 loader）；name 为原文件中的区块名，entry 为缓存（可以为 None）"""
+    cached = entry.get(name) if entry is not None else None
+    if cached is not None:
+        _fill_section(doc, section, *cached)
+        return
+    source, changed = _open_source(doc)
+    if source is None:
+        raise SourceChanged(f"{doc.path} no longer exists, please open it again.")
+    if changed and not all(_range_matches(source, r) for r in ranges):
+        source.close()
+        raise SourceChanged(
+            f"[{name}] in {doc.path} has been changed since it was loaded, "
+            "please open the file again."
+        )
+    pending = []
+    failed = set()
+    try:
+        with source, _mapped(source) as data:
+            for start, end, _ in ranges:
+                for token in tokenize(iter_lines(data, start, end)):
+                    if token[0] != TOKEN_ITEM:
+                        continue
+                    _, idx, header, values_str = token
+                    if section.header is None:
+                        section.header = header
+                    pending.append((idx, values_str, header, section))
+                    if len(pending) >= _SPLIT_BATCH:
+                        failed.update(_flush_items(doc, pending))
+                        pending = []
+        failed.update(_flush_items(doc, pending))
+    except BaseException:
+        # 撤销已创建的行，下次访问时重新解析
+        for row in section._rows:
+            doc._items.pop(row.uid, None)
+            doc._detached.discard(row.uid)
+            if doc._value_index is not None:
+                doc._value_index.remove(row)
+        raise
+    if failed:
+        section.source = None
+    if entry is not None and not section._renamed:
+        rows = [list(row) for row in section._rows]
+        entry.put(name, (section.header, doc.test_columns, rows, bool(failed)))
+
+
+def _fill_section(doc, section, header, columns, rows, failed):
+    """用缓存中的解析结果 (表头串, 当时的 test_columns, 行, 是否有解析失败的行) 填充区块"""
+    if section.header is None:
+        section.header = header
+    if columns != doc.test_columns:
+        # 缓存时文档的列不同，按列名重新排列
+        doc.add_columns(columns)
+        positions = [doc.test_columns.index(c) for c in columns]
+        width = len(doc.test_columns)
+        remapped = []
+        for values in rows:
+            row = [""] * width
+            for pos, value in zip(positions, values):
+                row[pos] = value
+            remapped.append(row)
+        rows = remapped
+    id_idx = doc.id_idx
+    for values in rows:
+        if section._renamed:
+            values[id_idx] = section.name
+        section._rows.append(doc._new_item(section, values))
+    if failed:
+        section.source = None
+
+
+@contextlib.contextmanager
+def _mapped(f):
+    """只读映射以二进制方式打开的文件，空文件（无法映射）时给出 b"" """
+    if not os.fstat(f.fileno()).st_size:
+        yield b""
+        return
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield data
+    finally:
+        data.close()
+
+
+def _peek_section(data, start, end):
+    """只看区块开头一小段，取出 Count= 的值和第一条 test item 的表头（没有时为 None）"""
+    head = data[start : min(end, start + _PEEK_SIZE)]
+    lines = head.split(b"\n")
+    if len(head) < end - start:
+        lines.pop()  # 最后一行可能不完整
+    count = None
+    for token in tokenize(line.decode("utf-8", "replace") for line in lines):
+        if token[0] == TOKEN_COUNT and token[1].isdecimal():
+            count = int(token[1])
+        elif token[0] == TOKEN_ITEM:
+            return count, token[2]
+    return count, None
+
+
+def write(doc, f, newline=os.linesep):
+    """把文档逐段写入以二进制方式打开的文件 f。
+    有原文且未修改的 SKU 区块直接复制原文字节（换行统一为 newline），其余区块重新生成。
+    """
+    source, changed = _open_source(doc)
+    try:
+        separator = ""
+        # Info 区放最前面
+        if doc.has_info:
+            info_lines = [f"{key}={doc.info.get(key, '')}" for key in INFO_KEYS]
+            text = "[Info]\n" + "\n".join(info_lines).strip() + "\n"
+            f.write(_encode(text, newline))
+            separator = newline
+        for sku in doc.sku_list:
+            f.write(separator.encode("utf-8"))
+            separator = newline + newline
+            section = doc.sections.get(sku)
+            copy = source is not None and section is not None and section.source
+            if copy and changed and not _range_matches(source, section.source):
+                # 原文中的区块已被改掉，改为从已解析的行（或解析缓存）重新生成
+                section.source = None
+                copy = False
+            if copy:
+                _copy_range(source, section.source, f, newline.encode("utf-8"))
+            else:
+                # 分批生成并写出，大区块也不会整段放进内存
+                lines = _section_lines(doc, sku)
+                batch = list(itertools.islice(lines, _WRITE_BATCH))
+                joiner = ""
+                while batch:
+                    f.write(_encode(joiner + "\n".join(batch), newline))
+                    joiner = "\n"
+                    batch = list(itertools.islice(lines, _WRITE_BATCH))
+    finally:
+        if source is not None:
+            source.close()
+
+
+def _section_lines(doc, sku):
+    """逐行生成 SKU 区块的文本（不含换行符），各行按区块自己的表头排列字段"""
+    section = doc.sections.get(sku)
+    rows = section.rows if section is not None else []
+    layout = doc.layout(section.header if section is not None else None)
+    header_line = layout.header
+    extract = layout.extract
+    enabled_idx = layout.enabled_idx
+    yield f"[{sku}]"
+    yield f"Count={len(rows)}"
+    for i, row in enumerate(rows, 1):
+        # Identifier 字段可能是 SkuSection 对象，格式化时取其 name
+        values = format_row(extract(row.values), enabled_idx)
+        yield f"{i}=({header_line}) VALUES {values}"
+
+
+def _encode(text, newline):
+    if newline != "\n":
+        text = text.replace("\n", newline)
+    return text.encode("utf-8")
+
+
+def _open_source(doc):
+    """打开加载时的原文件，返回 (f, changed)；文件已不存在时返回 (None, True)。
+    changed 为文件的大小或修改时间与加载时不同，此时要用 _range_matches 核对区块内容后才能使用原文。
+    """
+    if doc.source is None:
+        return None, True
+    path, size, mtime = doc.source
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None, True
+    st = os.fstat(f.fileno())
+    return f, st.st_size != size or st.st_mtime_ns != mtime
+
+
+def _checksum(data, start, end):
+    """bytes 或 mmap 中 [start, end) 的 crc32，不复制内容"""
+    with memoryview(data) as view, view[start:end] as part:
+        return zlib.crc32(part)
+
+
+def _range_matches(source, byte_range):
+    """原文件中 (start, end, crc32) 范围的内容是否与加载时相同"""
+    start, end, expected = byte_range
+    source.seek(start)
+    remaining = end - start
+    crc = 0
+    while remaining > 0:
+        chunk = source.read(min(_COPY_CHUNK, remaining))
+        if not chunk:
+            return False
+        remaining -= len(chunk)
+        crc = zlib.crc32(chunk, crc)
+    return crc == expected
+
+
+def section_source(doc, sku):
+    """SKU 区块没有修改过时返回它在原文件中的原文字节（去掉末尾空行），
+    区块已修改、出现多次或原文件中该区块的内容已变化时返回 None
+    """
+    section = doc.sections.get(sku)
+    if section is None or not section.source:
+        return None
+    source, changed = _open_source(doc)
+    if source is None:
+        return None
+    with source:
+        if changed and not _range_matches(source, section.source):
+            return None
+        start, end, _ = section.source
+        source.seek(start)
+        return source.read(end - start).rstrip(b"\r\n")
+
+
+def _copy_range(source, byte_range, f, newline):
+    """分块复制原文 (start, end, crc32) 范围的字节，去掉末尾的空行"""
+    start, end, _ = byte_range
+    source.seek(start)
+    remaining = end - start
+    # 暂不写出的换行，后面还有内容时才补上
+    pending = b""
+    while remaining > 0:
+        chunk = source.read(min(_COPY_CHUNK, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        body = chunk.rstrip(b"\r\n")
+        if body:
+            data = (pending + body).replace(b"\r\n", b"\n")
+            if newline != b"\n":
+                data = data.replace(b"\n", newline)
+            f.write(data)
+            pending = chunk[len(body) :]
+        else:
+            pending += chunk
+
+
+def dumps(doc):
+    """把文档序列化为 INI 文本"""
+    buf = io.BytesIO()
+    write(doc, buf, "\n")
+    return buf.getvalue().decode("utf-8")
+
+
+def dump(doc, path):
+    """把文档写入 INI 文件：先写到同目录下的临时文件并 fsync，再原子替换目标文件，
+    中途出错不会留下写了一半的文件。
+    """
+    if doc.source is not None and _same_path(doc.source[0], path):
+        # 覆盖原文件后就不能再从中按需解析，先把还没解析的区块都解析出来
+        doc.parse_all()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "wb", buffering=_COPY_CHUNK) as f:
+            write(doc, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _copy_file_mode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _same_path(a, b):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def _copy_file_mode(path, tmp_path):
+    """临时文件沿用目标文件的权限（目标不存在时按 umask 的默认权限）"""
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(tmp_path, mode)
@@ -0,0 +1,303 @@
+from bisect import bisect_left
+from operator import itemgetter
+
+from wanchai_core import INFO_KEYS, SkuSection, section_source
+
+# 注意：本模块不依赖 tkinter，界面（Compare）和 wanchai-cli.py diff 共用
+#
+# 按内容比较两个文档，不受 Index 重新编号影响：
+# - SKU 按名称对应，两边原文相同的 SKU 区块直接跳过（不解析）；
+# - SKU 内的 test item 按 TestID 对应（同一 TestID 出现多次时按出现顺序第 1 个对第 1 个……），
+#   字段按列名比较（不比较 Index），两边列不同时缺少的列按空串处理；
+# - 对应上的行中，在两边相对顺序不变的最多的一组（旧位置序列的最长递增子序列）视为没有移动，
+#   其余为移动过的行。
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+MOVED = "moved"
+
+
+class ItemDiff:
+    """一个 test item 的差异：kind 为 ADDED / REMOVED / CHANGED / MOVED（只移动、字段没变），
+    old / new 为两边的 TestItem（新增或删除时另一边为 None），position 为在 SKU 中的位置（从 1 开始），
+    moved 表示相对顺序变了，fields 为 [(列名, 旧值, 新值), ...]
+    """
+
+    __slots__ = (
+        "kind",
+        "test_id",
+        "old",
+        "new",
+        "old_position",
+        "new_position",
+        "moved",
+        "fields",
+    )
+
+    def __init__(
+        self,
+        kind,
+        test_id,
+        old=None,
+        new=None,
+        old_position=None,
+        new_position=None,
+        moved=False,
+        fields=(),
+    ):
+        self.kind = kind
+        self.test_id = test_id
+        self.old = old
+        self.new = new
+        self.old_position = old_position
+        self.new_position = new_position
+        self.moved = moved
+        self.fields = fields
+
+    def describe(self):
+        """一行说明，如 "LowLimit: -0.67 -> -5; moved from 3 to 7" """
+        parts = [f"{name}: {old!r} -> {new!r}" for name, old, new in self.fields]
+        if self.moved:
+            parts.append(f"moved from {self.old_position} to {self.new_position}")
+        return "; ".join(parts)
+
+
+class SkuDiff:
+    """一个 SKU 的差异：kind 为 ADDED / REMOVED（整个 SKU）或 CHANGED，
+    items 为 ItemDiff 列表，按新文件中的顺序排列（删除的行排在原来前一行的后面）
+    """
+
+    __slots__ = ("sku", "kind", "items")
+
+    def __init__(self, sku, kind, items):
+        self.sku = sku
+        self.kind = kind
+        self.items = items
+
+    def counts(self):
+        """{ADDED/REMOVED/MOVED/CHANGED: 数量}，既改了字段又移动过的行两边都算"""
+        counts = {ADDED: 0, REMOVED: 0, MOVED: 0, CHANGED: 0}
+        for item in self.items:
+            if item.kind == MOVED or item.moved:
+                counts[MOVED] += 1
+            if item.kind != MOVED:
+                counts[item.kind] += 1
+        return counts
+
+
+def diff_info(old_doc, new_doc):
+    """[Info] 中不同的字段：[(字段名, 旧值, 新值), ...]"""
+    keys = list(INFO_KEYS) + [
+        k for k in list(old_doc.info) + list(new_doc.info) if k not in INFO_KEYS
+    ]
+    changes = []
+    for key in dict.fromkeys(keys):
+        old = old_doc.info.get(key)
+        new = new_doc.info.get(key)
+        if old != new:
+            changes.append((key, old, new))
+    return changes
+
+
+def diff_documents(old_doc, new_doc):
+    """比较两个文档，返回有差异的 SKU 的 SkuDiff 列表：
+    先按新文档的 SKU 顺序，再是只在旧文档中有的 SKU
+    """
+    comparer = _Comparer(old_doc, new_doc)
+    diffs = []
+    for sku in new_doc.sku_list:
+        if sku not in old_doc.sections:
+            items = [
+                ItemDiff(ADDED, comparer.new_test_id(row), new=row, new_position=pos)
+                for pos, row in enumerate(new_doc.rows(sku), 1)
+            ]
+            diffs.append(SkuDiff(sku, ADDED, items))
+            continue
+        # 两边原文完全相同的区块不用解析
+        raw = section_source(new_doc, sku)
+        if raw is not None and raw == section_source(old_doc, sku):
+            continue
+        items = comparer.diff_rows(old_doc.rows(sku), new_doc.rows(sku))
+        if items:
+            diffs.append(SkuDiff(sku, CHANGED, items))
+    for sku in old_doc.sku_list:
+        if sku not in new_doc.sections:
+            items = [
+                ItemDiff(REMOVED, comparer.old_test_id(row), old=row, old_position=pos)
+                for pos, row in enumerate(old_doc.rows(sku), 1)
+            ]
+            diffs.append(SkuDiff(sku, REMOVED, items))
+    return diffs
+
+
+class _Comparer:
+    """两个文档的列对应关系，按列名取出要比较的字段"""
+
+    def __init__(self, old_doc, new_doc):
+        names = [
+            name
+            for name in dict.fromkeys(old_doc.test_columns + new_doc.test_columns)
+            if name != "Index"
+        ]
+        # Identifier 可能是 SkuSection 对象，单独比较
+        self.id_name = "Identifier"
+        self.names = [name for name in names if name != self.id_name]
+        self.old_get = field_getter(old_doc.test_columns, self.names)
+        self.new_get = field_getter(new_doc.test_columns, self.names)
+        self.old_id = index_of(old_doc.test_columns, self.id_name)
+        self.new_id = index_of(new_doc.test_columns, self.id_name)
+        self.old_key = index_of(old_doc.test_columns, "TestID")
+        self.new_key = index_of(new_doc.test_columns, "TestID")
+
+    def old_test_id(self, row):
+        return _cell(row.values, self.old_key)
+
+    def new_test_id(self, row):
+        return _cell(row.values, self.new_key)
+
+    def diff_rows(self, old_rows, new_rows):
+        """一个 SKU 内的差异（ItemDiff 列表，已按显示顺序排列）"""
+        old_keys = item_keys(old_rows, self.old_key)
+        old_pos = {key: pos for pos, key in enumerate(old_keys)}
+        new_keys = item_keys(new_rows, self.new_key)
+        # 对应上的行：(新位置, 旧位置)
+        pairs = []
+        entries = []
+        for new_pos, key in enumerate(new_keys):
+            pos = old_pos.pop(key, None)
+            if pos is None:
+                row = new_rows[new_pos]
+                item = ItemDiff(ADDED, key[0], new=row, new_position=new_pos + 1)
+                entries.append(((new_pos, 0), item))
+            else:
+                pairs.append((new_pos, pos))
+        stable = _increasing_subsequence([pos for _, pos in pairs])
+        anchors_old = []
+        anchors_new = []
+        old_get, new_get = self.old_get, self.new_get
+        old_id, new_id = self.old_id, self.new_id
+        for i, (new_pos, pos) in enumerate(pairs):
+            old_row, new_row = old_rows[pos], new_rows[new_pos]
+            moved = i not in stable
+            if not moved:
+                anchors_old.append(pos)
+                anchors_new.append(new_pos)
+            same = old_get(old_row.values) == new_get(new_row.values) and (
+                _cell(old_row.values, old_id) == _cell(new_row.values, new_id)
+            )
+            if same and not moved:
+                continue
+            fields = [] if same else self._changed_fields(old_row, new_row)
+            item = ItemDiff(
+                CHANGED if fields else MOVED,
+                old_keys[pos][0],
+                old_row,
+                new_row,
+                pos + 1,
+                new_pos + 1,
+                moved,
+                fields,
+            )
+            entries.append(((new_pos, 0), item))
+        # 删除的行排在旧文件中它前面最近的一个没移动的行之后
+        for key, pos in old_pos.items():
+            k = bisect_left(anchors_old, pos)
+            after = anchors_new[k - 1] if k else -1
+            item = ItemDiff(REMOVED, key[0], old=old_rows[pos], old_position=pos + 1)
+            entries.append(((after, 1, pos), item))
+        entries.sort(key=itemgetter(0))
+        return [item for _, item in entries]
+
+    def _changed_fields(self, old_row, new_row):
+        fields = []
+        old_id = _cell(old_row.values, self.old_id)
+        new_id = _cell(new_row.values, self.new_id)
+        if old_id != new_id:
+            fields.append((self.id_name, old_id, new_id))
+        old_values = self.old_get(old_row.values)
+        new_values = self.new_get(new_row.values)
+        for name, old, new in zip(self.names, old_values, new_values):
+            if old != new:
+                fields.append((name, old, new))
+        return fields
+
+
+def index_of(columns, name):
+    return columns.index(name) if name in columns else None
+
+
+def _cell(values, col):
+    if col is None or col >= len(values):
+        return ""
+    value = values[col]
+    return value.name if type(value) is SkuSection else value
+
+
+def field_getter(columns, names):
+    """按 names 的顺序取出字段，返回 tuple；缺少的列取空串"""
+    positions = [index_of(columns, name) for name in names]
+    if None not in positions:
+        if len(positions) == 1:
+            return lambda values, p=positions[0]: (values[p],)
+        return itemgetter(*positions) if positions else lambda values: ()
+    return lambda values: tuple(values[p] if p is not None else "" for p in positions)
+
+
+def item_keys(rows, col):
+    """各行的对应键 (TestID, 同一 TestID 的第几次出现)；col 为 TestID 列的位置"""
+    seen = {}
+    keys = []
+    for row in rows:
+        test_id = _cell(row.values, col).strip()
+        n = seen.get(test_id, 0)
+        seen[test_id] = n + 1
+        keys.append((test_id, n))
+    return keys
+
+
+def _increasing_subsequence(seq):
+    """seq（互不相同的数）的一个最长递增子序列，返回其中元素下标的集合"""
+    if all(a < b for a, b in zip(seq, seq[1:])):
+        return set(range(len(seq)))
+    # tails[k]：长度为 k + 1 的递增子序列中结尾最小的那个的结尾下标
+    tails = []
+    tail_values = []
+    previous = [-1] * len(seq)
+    for i, value in enumerate(seq):
+        k = bisect_left(tail_values, value)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    keep = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+
+def format_diff(sku_diffs, info_changes=()):
+    """生成文本报告的各行"""
+    for key, old, new in info_changes:
+        yield f"[Info] {key}: {old!r} -> {new!r}"
+    marks = {ADDED: "+", REMOVED: "-", CHANGED: "~", MOVED: ">"}
+    for sku_diff in sku_diffs:
+        mark = marks[sku_diff.kind]
+        if sku_diff.kind != CHANGED:
+            size = len(sku_diff.items)
+            yield f"{mark} [{sku_diff.sku}] SKU {sku_diff.kind} ({size} items)"
+            continue
+        counts = sku_diff.counts()
+        summary = ", ".join(f"{n} {kind}" for kind, n in counts.items())
+        yield f"{mark} [{sku_diff.sku}] {summary}"
+        for item in sku_diff.items:
+            position = item.new_position if item.new is not None else item.old_position
+            line = f"  {marks[item.kind]} {position} {item.test_id}"
+            details = item.describe()
+            yield f"{line}: {details}" if details else line
@@ -0,0 +1,344 @@
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import wanchai_core
+from wanchai_parser import (
+    INFO_SECTION,
+    TOKEN_END,
+    TOKEN_ITEM,
+    TOKEN_SECTION,
+    iter_lines,
+    split_values_many,
+    tokenize,
+)
+from wanchai_search import (
+    QueryError,
+    compile_sql,
+    quote_identifier,
+    register_sql_functions,
+)
+
+# 注意：本模块不依赖 tkinter，供 wanchai-cli.py index / query 使用
+#
+# 把大量 INI 文件的 test item 索引到一个 SQLite 数据库：
+#   files  每个文件一行：路径、大小、修改时间、内容 SHA-1
+#   items  每个 test item 一行：所在文件、SKU、在 SKU 中的位置（以下划线开头，不会与 INI 中的列重名），
+#          以及与 test_columns 同名的各列
+# 有文件带了额外的列时 items 表自动加上同名列（其他文件的该列为空串）。
+# 重新索引时，大小和修改时间都没变的文件直接跳过；变了的先比较内容哈希，哈希也一样时只更新修改时间。
+# 文件读不出来时删掉它原来的行，查询不会返回过时的内容。
+
+_META_COLUMNS = ("_file_id", "_sku", "_position")
+# 表结构变化时加一，旧版本的数据库在下次索引时重建
+_SCHEMA_VERSION = 2
+# 每攒够这么多行分割一次 VALUES
+_SPLIT_BATCH = 4096
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS files ("
+    "id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, size INTEGER NOT NULL, "
+    "mtime_ns INTEGER NOT NULL, sha1 TEXT NOT NULL, indexed_at TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS items ("
+    "_file_id INTEGER NOT NULL, _sku TEXT NOT NULL, _position INTEGER NOT NULL, "
+    + ", ".join(
+        f"{quote_identifier(name)} TEXT NOT NULL DEFAULT ''"
+        for name in wanchai_core.DEFAULT_COLUMNS
+    )
+    + ")",
+    "CREATE INDEX IF NOT EXISTS items_file ON items (_file_id)",
+    "CREATE INDEX IF NOT EXISTS items_sku ON items (_sku)",
+    'CREATE INDEX IF NOT EXISTS items_test_id ON items ("TestID" COLLATE NOCASE)',
+]
+
+
+def connect(db_path, create=True):
+    """打开索引数据库。create 为 True 时（索引）不存在则新建，旧版本的表结构重建；
+    为 False 时（查询）只读已有的数据库，不改表结构和日志模式，不存在时抛出 FileNotFoundError，
+    版本不对时抛出 QueryError。
+    """
+    if not create and not os.path.exists(db_path):
+        raise FileNotFoundError(f"No such index database: {db_path}")
+    conn = sqlite3.connect(db_path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if not create:
+        if version != _SCHEMA_VERSION:
+            conn.close()
+            raise QueryError(
+                f"{db_path} is not an index of this version, run 'index' again"
+            )
+        register_sql_functions(conn)
+        return conn
+    # WAL 下逐个文件提交也很快，查询和索引可以同时进行
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if version != _SCHEMA_VERSION:
+        conn.execute("DROP TABLE IF EXISTS items")
+        conn.execute("DROP TABLE IF EXISTS files")
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+    conn.commit()
+    register_sql_functions(conn)
+    return conn
+
+
+def item_columns(conn):
+    """items 表中与 test_columns 对应的列名（不含文件、SKU、位置）"""
+    names = [info[1] for info in conn.execute("PRAGMA table_info(items)")]
+    return [name for name in names if name not in _META_COLUMNS]
+
+
+def _ensure_columns(conn, columns):
+    existing = {name.lower() for name in item_columns(conn)}
+    existing.update(_META_COLUMNS)
+    for name in columns:
+        if name.lower() not in existing:
+            conn.execute(
+                f"ALTER TABLE items ADD COLUMN {quote_identifier(name)} "
+                "TEXT NOT NULL DEFAULT ''"
+            )
+            existing.add(name.lower())
+
+
+def _index_file(task):
+    """在工作进程中读一个文件：内容哈希与 known_sha1 相同时不解析（rows 为 None），
+    否则返回全部行 [(sku, 位置, 各列值...), ...]
+    """
+    path, known_sha1 = task
+    result = {"path": path, "error": None, "rows": None, "columns": None}
+    try:
+        # 只读一遍文件：算哈希和解析用同一份内容
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        sha1 = hashlib.sha1(data).hexdigest()
+        result.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha1=sha1)
+        if sha1 != known_sha1:
+            result["columns"], result["rows"] = _read_items(data)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _read_items(data):
+    """逐行读出文件内容（bytes）中的全部 test item，返回 (列名, [(sku, 位置, 各列值...), ...])。
+    字段按表头放到列上，解析失败的行跳过，与 wanchai_core.load 的结果一致，
+    但不建立 TestItem 等文档对象。
+    """
+    # 只用来登记表头和列
+    doc = wanchai_core.WanchaiDocument()
+    rows = []
+    positions = {}
+    pending = []
+
+    def flush():
+        split = iter(split_values_many([p[2] for p in pending if p[2] is not None]))
+        for sku, index, values_str, header in pending:
+            values = next(split) if values_str is not None else []
+            layout = doc.layout(header)
+            if len(values) < len(layout.fields):
+                continue
+            position = positions[sku] = positions.get(sku, 0) + 1
+            row = layout.build(index, values, len(doc.test_columns))
+            rows.append((sku, position) + tuple(row))
+        del pending[:]
+
+    sku = None
+    for token in tokenize(iter_lines(data, 0, len(data))):
+        kind = token[0]
+        if kind == TOKEN_ITEM:
+            if sku is not None:
+                _, index, header, values_str = token
+                pending.append((sku, index, values_str, header))
+                if len(pending) >= _SPLIT_BATCH:
+                    flush()
+        elif kind == TOKEN_SECTION:
+            sku = token[1] if token[1] != INFO_SECTION else None
+        elif kind == TOKEN_END:
+            sku = None
+    flush()
+    # 后面的区块带来新列时，前面的行补上空字段
+    width = len(_META_COLUMNS) - 1 + len(doc.test_columns)
+    rows = [
+        row + ("",) * (width - len(row)) if len(row) < width else row for row in rows
+    ]
+    return list(doc.test_columns), rows
+
+
+def index(db_path, paths, jobs=None, prune=False, progress=None):
+    """把 paths 中的文件增量索引到 db_path，用进程池并行解析（jobs 为 1 时在当前进程中依次处理）。
+    prune 为 True 时删除数据库中已不存在的文件。
+    progress(摘要) 在每个文件处理完后调用，摘要为 {"path", "status", "rows", "error"}，
+    status 为 "indexed" / "unchanged" / "failed"。返回各 status 的文件数及 "removed"。
+    """
+    conn = connect(db_path)
+    try:
+        known = {
+            path: (file_id, size, mtime_ns, sha1)
+            for file_id, path, size, mtime_ns, sha1 in conn.execute(
+                "SELECT id, path, size, mtime_ns, sha1 FROM files"
+            )
+        }
+        totals = {"indexed": 0, "unchanged": 0, "failed": 0, "removed": 0}
+
+        def report(path, status, rows=0, error=None):
+            if status == "failed" and path in known:
+                # 索引失败的文件不留下旧的行
+                _delete_file(conn, known.pop(path)[0])
+                conn.commit()
+            totals[status] += 1
+            if progress is not None:
+                progress({"path": path, "status": status, "rows": rows, "error": error})
+
+        tasks = []
+        for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                report(path, "failed", error=f"{type(e).__name__}: {e}")
+                continue
+            record = known.get(path)
+            if record is not None and record[1:3] == (st.st_size, st.st_mtime_ns):
+                report(path, "unchanged")
+                continue
+            tasks.append((path, record[3] if record is not None else None))
+        for result in _run(tasks, jobs):
+            path = result["path"]
+            if result["error"] is not None:
+                report(path, "failed", error=result["error"])
+                continue
+            record = known.get(path)
+            if result["rows"] is None:
+                # 只是修改时间变了，内容相同
+                conn.execute(
+                    "UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?",
+                    (result["size"], result["mtime_ns"], record[0]),
+                )
+                conn.commit()
+                report(path, "unchanged")
+                continue
+            try:
+                _store(conn, record[0] if record is not None else None, result)
+            except sqlite3.Error as e:
+                report(path, "failed", error=f"{type(e).__name__}: {e}")
+                continue
+            report(path, "indexed", rows=len(result["rows"]))
+        if prune:
+            for path, record in known.items():
+                if not os.path.exists(path):
+                    _delete_file(conn, record[0])
+                    totals["removed"] += 1
+            conn.commit()
+        return totals
+    finally:
+        conn.close()
+
+
+def _run(tasks, jobs):
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _index_file(task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        workers = jobs or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (workers * 4))
+        for result in pool.map(_index_file, tasks, chunksize=chunksize):
+            yield result
+
+
+def _store(conn, file_id, result):
+    """在一个事务中替换文件的全部行"""
+    columns = result["columns"]
+    _ensure_columns(conn, columns)
+    indexed_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        if file_id is None:
+            file_id = conn.execute(
+                "INSERT INTO files (path, size, mtime_ns, sha1, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    result["path"],
+                    result["size"],
+                    result["mtime_ns"],
+                    result["sha1"],
+                    indexed_at,
+                ),
+            ).lastrowid
+        else:
+            conn.execute("DELETE FROM items WHERE _file_id = ?", (file_id,))
+            conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, sha1 = ?, indexed_at = ? "
+                "WHERE id = ?",
+                (
+                    result["size"],
+                    result["mtime_ns"],
+                    result["sha1"],
+                    indexed_at,
+                    file_id,
+                ),
+            )
+        names = ", ".join(map(quote_identifier, _META_COLUMNS + tuple(columns)))
+        marks = ", ".join("?" * (len(_META_COLUMNS) + len(columns)))
+        conn.executemany(
+            f"INSERT INTO items ({names}) VALUES ({marks})",
+            ((file_id,) + row for row in result["rows"]),
+        )
+
+
+def _delete_file(conn, file_id):
+    conn.execute("DELETE FROM items WHERE _file_id = ?", (file_id,))
+    conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+
+def query(db_path, text="", columns=None, limit=None):
+    """按搜索框的查询语法在索引中查找，返回 (列名, 行列表)，
+    每行为 (文件路径, SKU, 所选各列值...)，按文件路径和文件中的顺序排列。
+    columns 默认为全部列；列名或语法错误抛出 QueryError。
+    """
+    conn = connect(db_path, create=False)
+    try:
+        available = item_columns(conn)
+        columns = _resolve_columns(available, columns)
+        where, params = compile_sql(text, available)
+        selected = ", ".join(f"items.{quote_identifier(name)}" for name in columns)
+        # 条件放在只有 items 表的子查询中，与 files 表同名的列（如 path）不会有歧义
+        sql = (
+            f"SELECT files.path, items._sku, {selected} FROM items "
+            "JOIN files ON files.id = items._file_id "
+            f"WHERE items.rowid IN (SELECT rowid FROM items WHERE {where}) "
+            "ORDER BY files.path, items.rowid"
+        )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return ["File", "SKU"] + columns, conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def summarize(db_path, text=""):
+    """各文件、各 SKU 中匹配的行数：[(文件路径, SKU, 行数), ...]"""
+    conn = connect(db_path, create=False)
+    try:
+        where, params = compile_sql(text, item_columns(conn))
+        sql = (
+            "SELECT files.path, items._sku, COUNT(*) FROM items "
+            "JOIN files ON files.id = items._file_id "
+            f"WHERE items.rowid IN (SELECT rowid FROM items WHERE {where}) "
+            "GROUP BY files.id, items._sku ORDER BY files.path, MIN(items.rowid)"
+        )
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def _resolve_columns(available, columns):
+    if not columns:
+        return available
+    by_name = {name.lower(): name for name in available}
+    unknown = [name for name in columns if name.lower() not in by_name]
+    if unknown:
+        raise QueryError(f"Unknown column(s): {', '.join(unknown)}")
+    return [by_name[name.lower()] for name in columns]
@@ -0,0 +1,75 @@
+"""编辑器的后台任务（不依赖 Tk）：工作线程读文件，进度和结果经队列交给界面线程轮询"""
+
+import logging
+import queue
+import threading
+
+import wanchai_core
+from wanchai_core import LoadCancelled, SourceChanged
+
+logger = logging.getLogger(__name__)
+
+
+class LoadJob:
+    """一次后台加载：工作线程解析文件，进度和结果经队列交给界面线程轮询"""
+
+    def __init__(self, path, previous, cache=None):
+        self.path = path
+        self.cache = cache
+        # 加载前的 (doc, ini_file, 选中的 SKU)，取消或出错时恢复
+        self.previous = previous
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        # 解析中的文档和已解析完的 SKU（界面线程维护）
+        self.doc = None
+        self.ready = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _run(self):
+        try:
+            doc = wanchai_core.load(
+                self.path, progress=self._progress, cache=self.cache
+            )
+            self.queue.put(("done", doc))
+        except LoadCancelled:
+            self.queue.put(("cancelled", None))
+        except Exception as e:
+            logger.exception("Error loading %s", self.path)
+            self.queue.put(("error", e))
+
+    def _progress(self, doc, sku, done, total):
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+        self.queue.put(("progress", (doc, sku, done, total)))
+
+
+class ParseJob:
+    """在工作线程中解析一个还没解析的 SKU 区块，第一次显示大区块时界面不会卡住。
+    完成后队列中为 ("done", sku) 或 ("error", 异常)；解析期间界面线程不能修改文档。
+    """
+
+    def __init__(self, doc, sku):
+        self.doc = doc
+        self.sku = sku
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.doc.rows(self.sku)
+            self.queue.put(("done", self.sku))
+        except (SourceChanged, UnicodeDecodeError) as e:
+            # 原文件在打开后被改掉了或不是 UTF-8，由界面提示
+            self.queue.put(("error", e))
+        except Exception as e:
+            logger.exception("Error parsing SKU %s", self.sku)
+            self.queue.put(("error", e))
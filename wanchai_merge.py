@@ -0,0 +1,350 @@
+from wanchai_core import INFO_KEYS, section_source
+from wanchai_diff import field_getter, index_of, item_keys
+
+# 注意：本模块不依赖 tkinter，界面（Merge）和 wanchai-cli.py merge 共用
+#
+# 三方合并：把 theirs 相对 base 的修改合并进 ours（直接修改 ours 文档）。
+# 与 wanchai_diff 一样按 SKU 名称和 (TestID, 第几次出现) 对应各行，按列名比较字段（不比较 Index 和 Identifier）：
+# - 只有一边改过的字段取改过的一边，两边改成相同的值也不算冲突；
+# - 同一字段两边改成不同的值（或两边新增了同一行但内容不同）为冲突，保留 ours 的值；
+# - 一边删除、另一边没改的行（或 SKU）删除；一边删除、另一边改过的为冲突，保留 ours 的状态；
+# - theirs 新增的行插在 theirs 中它前面最近的、ours 中也有的那一行之后，新增的 SKU 同理；
+# - 行和 SKU 的先后顺序以 ours 为准，只在 theirs 中调整过的顺序不合并。
+# theirs 中原文与 base 或 ours 相同的 SKU 区块直接跳过（不解析）；
+# 其余每个 SKU 的各边只按键建一次字典，合并时间与行数成正比。
+
+BOTH_CHANGED = "both changed"
+BOTH_ADDED = "both added"
+DELETED_BY_OURS = "deleted by ours"
+DELETED_BY_THEIRS = "deleted by theirs"
+
+
+class Conflict:
+    """一个合并冲突：kind 为 BOTH_CHANGED / BOTH_ADDED / DELETED_BY_OURS / DELETED_BY_THEIRS；
+    sku 为 None 表示 [Info] 中的字段，test_id 为 None 表示整个 SKU；
+    row 为合并结果中的 TestItem（ours 已删除时为 None），theirs 为 theirs 中的 TestItem；
+    fields 为 [(列名, base 值, ours 值, theirs 值), ...]，没有该行的一边为 None
+    """
+
+    __slots__ = ("kind", "sku", "test_id", "row", "theirs", "fields", "resolved")
+
+    def __init__(self, kind, sku, test_id=None, row=None, theirs=None, fields=()):
+        self.kind = kind
+        self.sku = sku
+        self.test_id = test_id
+        self.row = row
+        self.theirs = theirs
+        self.fields = fields
+        # 已用 ThreeWayMerge.take_theirs 改为 theirs 的内容
+        self.resolved = False
+
+    def location(self):
+        """如 "[38599-000-889] 12 RF_500"，Index 为合并结果中的行号"""
+        if self.sku is None:
+            return "[Info]"
+        if self.test_id is None:
+            return f"[{self.sku}] (whole SKU)"
+        if self.row is not None:
+            return f"[{self.sku}] {self.row[0]} {self.test_id}"
+        return f"[{self.sku}] {self.test_id}"
+
+    def describe(self):
+        """一行说明，如 "LowLimit: base '-1', ours '-2', theirs '-3'" """
+        return "; ".join(
+            f"{name}: base {base!r}, ours {ours!r}, theirs {theirs!r}"
+            for name, base, ours, theirs in self.fields
+        )
+
+
+def merge_documents(base, ours, theirs):
+    """把 theirs 相对 base 的修改合并进 ours，返回冲突列表"""
+    return ThreeWayMerge(base, ours, theirs).merge()
+
+
+class ThreeWayMerge:
+    """merge() 把 theirs 相对 base 的修改合并进 ours 并返回冲突列表，
+    之后可以用 take_theirs 把单个冲突改为 theirs 的内容
+    """
+
+    def __init__(self, base, ours, theirs):
+        self.base = base
+        self.ours = ours
+        self.theirs = theirs
+        self.conflicts = []
+        # ours 没有的列先补上，合并后的行能放下另外两边的所有字段
+        ours.add_columns(base.test_columns + theirs.test_columns)
+        self.names = [
+            name
+            for name in ours.test_columns
+            if name not in ("Index", "Identifier")
+        ]
+        self.base_get = field_getter(base.test_columns, self.names)
+        self.ours_get = field_getter(ours.test_columns, self.names)
+        self.theirs_get = field_getter(theirs.test_columns, self.names)
+        # names 中各列在 ours 行中的位置
+        self._cols = [ours.test_columns.index(name) for name in self.names]
+
+    def merge(self):
+        self._merge_info()
+        self._merge_skus()
+        return self.conflicts
+
+    def _merge_info(self):
+        base, ours, theirs = self.base.info, self.ours.info, self.theirs.info
+        keys = list(INFO_KEYS) + list(base) + list(ours) + list(theirs)
+        for key in dict.fromkeys(keys):
+            b, o, t = base.get(key), ours.get(key), theirs.get(key)
+            if o == t or t == b:
+                continue
+            if o == b:
+                self._set_info(key, t)
+            elif key != "Export Date":
+                # 两边都重新导出过时导出时间必然不同，保留 ours 的，不算冲突
+                self.conflicts.append(
+                    Conflict(BOTH_CHANGED, None, fields=[(key, b, o, t)])
+                )
+
+    def _set_info(self, key, value):
+        if value is None:
+            self.ours.info.pop(key, None)
+        else:
+            self.ours.info[key] = value
+            self.ours.has_info = True
+
+    def _merge_skus(self):
+        base, ours, theirs = self.base, self.ours, self.theirs
+        base_skus = set(base.sku_list)
+        theirs_skus = set(theirs.sku_list)
+        for sku in list(ours.sku_list):
+            if sku in theirs_skus:
+                self._merge_sku(sku)
+            elif sku in base_skus:
+                # theirs 删除了这个 SKU
+                if self._same_sku(base, self.base_get, ours, self.ours_get, sku):
+                    ours.remove_sku(sku)
+                else:
+                    self.conflicts.append(Conflict(DELETED_BY_THEIRS, sku))
+        ours_skus = set(ours.sku_list)
+        previous = None
+        for sku in theirs.sku_list:
+            if sku in ours_skus:
+                previous = sku
+            elif sku in base_skus:
+                # ours 删除了这个 SKU
+                if not self._same_sku(
+                    base, self.base_get, theirs, self.theirs_get, sku
+                ):
+                    self.conflicts.append(Conflict(DELETED_BY_OURS, sku))
+            else:
+                position = 0
+                if previous is not None:
+                    position = ours.sku_list.index(previous) + 1
+                self._add_sku(sku, position)
+                previous = sku
+
+    def _same_sku(self, a, a_get, b, b_get, sku):
+        """两个文档中的 SKU 内容（行的顺序和各字段）是否相同"""
+        raw = section_source(b, sku)
+        if raw is not None and raw == section_source(a, sku):
+            return True
+        a_rows, b_rows = a.rows(sku), b.rows(sku)
+        if len(a_rows) != len(b_rows):
+            return False
+        a_keys = item_keys(a_rows, index_of(a.test_columns, "TestID"))
+        b_keys = item_keys(b_rows, index_of(b.test_columns, "TestID"))
+        return a_keys == b_keys and all(
+            a_get(x.values) == b_get(y.values) for x, y in zip(a_rows, b_rows)
+        )
+
+    def _merge_sku(self, sku):
+        base, ours, theirs = self.base, self.ours, self.theirs
+        base_raw = section_source(base, sku)
+        ours_raw = section_source(ours, sku)
+        # theirs 没改过这个区块，或改得与 ours 相同
+        raw = section_source(theirs, sku)
+        if raw is not None and raw in (base_raw, ours_raw):
+            return
+        if ours_raw is not None and ours_raw == base_raw:
+            # ours 没改过这个区块：整块换成 theirs 的（同一 TestID 出现多次时也保持 theirs 的顺序）
+            ours.delete_items([row.uid for row in ours.rows(sku)])
+            self._copy_sku(sku)
+            return
+        base_get, ours_get, theirs_get = self.base_get, self.ours_get, self.theirs_get
+        base_rows = base.rows(sku)
+        base_map = dict(
+            zip(item_keys(base_rows, index_of(base.test_columns, "TestID")), base_rows)
+        )
+        theirs_rows = theirs.rows(sku)
+        theirs_keys = item_keys(theirs_rows, index_of(theirs.test_columns, "TestID"))
+        theirs_map = dict(zip(theirs_keys, theirs_rows))
+        ours_rows = list(ours.rows(sku))
+        ours_keys = item_keys(ours_rows, index_of(ours.test_columns, "TestID"))
+
+        deleted = []
+        for key, row in zip(ours_keys, ours_rows):
+            theirs_row = theirs_map.get(key)
+            base_row = base_map.get(key)
+            o = ours_get(row.values)
+            if theirs_row is None:
+                if base_row is None:
+                    # ours 新增的行
+                    continue
+                b = base_get(base_row.values)
+                if o == b:
+                    deleted.append(row.uid)
+                else:
+                    fields = [(n, bv, v, None) for n, bv, v in self._edited(b, o)]
+                    self.conflicts.append(
+                        Conflict(DELETED_BY_THEIRS, sku, key[0], row, None, fields)
+                    )
+                continue
+            t = theirs_get(theirs_row.values)
+            if o == t:
+                continue
+            b = base_get(base_row.values) if base_row is not None else None
+            if t == b:
+                continue
+            if o == b:
+                self._update(row, t)
+                continue
+            # 两边都改过（或都新增了这一行）：逐字段合并，同一字段改得不同的保留 ours
+            merged = list(o)
+            fields = []
+            for i, name in enumerate(self.names):
+                if o[i] == t[i]:
+                    continue
+                bv = b[i] if b is not None else None
+                if bv == o[i]:
+                    merged[i] = t[i]
+                elif bv != t[i]:
+                    fields.append((name, bv, o[i], t[i]))
+            if merged != list(o):
+                self._update(row, merged)
+            if fields:
+                kind = BOTH_ADDED if b is None else BOTH_CHANGED
+                self.conflicts.append(
+                    Conflict(kind, sku, key[0], row, theirs_row, fields)
+                )
+
+        # theirs 新增的行：{ours 中的前一行的键（None 为开头）: [新行, ...]}
+        ours_key_set = set(ours_keys)
+        inserts = {}
+        anchor = None
+        for key, theirs_row in zip(theirs_keys, theirs_rows):
+            if key in ours_key_set:
+                anchor = key
+                continue
+            t = theirs_get(theirs_row.values)
+            base_row = base_map.get(key)
+            if base_row is None:
+                inserts.setdefault(anchor, []).append(self._new_row(sku, t))
+                continue
+            # ours 删除了这一行
+            b = base_get(base_row.values)
+            if t != b:
+                fields = [(n, bv, None, v) for n, bv, v in self._edited(b, t)]
+                self.conflicts.append(
+                    Conflict(DELETED_BY_OURS, sku, key[0], None, theirs_row, fields)
+                )
+
+        if deleted:
+            ours.delete_items(deleted)
+        if inserts:
+            deleted = set(deleted)
+            rows = inserts.get(None, [])
+            for key, row in zip(ours_keys, ours_rows):
+                if row.uid not in deleted:
+                    rows.append(row)
+                rows.extend(inserts.get(key, ()))
+            ours.set_rows(sku, rows)
+        elif deleted:
+            ours.renumber(sku)
+
+    def _edited(self, base, values):
+        """values 相对 base 改过的字段：[(列名, base 值, 新值), ...]"""
+        return [
+            (name, b, v)
+            for name, b, v in zip(self.names, base, values)
+            if b != v
+        ]
+
+    def _update(self, row, values):
+        """把按 names 顺序的字段写回 ours 的行"""
+        new_row = list(row)
+        for col, value in zip(self._cols, values):
+            new_row[col] = value
+        self.ours.apply_edit(row.uid, new_row)
+
+    def _new_row(self, sku, values):
+        """用按 names 顺序的字段在 ours 中构造一行（尚未放入 SKU）"""
+        row = [""] * (len(self.ours.test_columns) - 1)
+        for col, value in zip(self._cols, values):
+            row[col - 1] = value
+        return self.ours.make_row(sku, row)
+
+    def _add_sku(self, sku, position):
+        self.ours.add_sku(sku, position)
+        self._copy_sku(sku)
+
+    def _copy_sku(self, sku):
+        """把 theirs 中 SKU 的表头和所有行复制到 ours 的同名区块（区块须已没有行）"""
+        section = self.theirs.sections[sku]
+        self.ours.section(sku).header = section.header
+        self.ours.layout(section.header)
+        theirs_get = self.theirs_get
+        rows = [self._new_row(sku, theirs_get(row.values)) for row in section.rows]
+        self.ours.set_rows(sku, rows)
+
+    def take_theirs(self, conflict):
+        """把一个冲突改为 theirs 的内容（修改 ours），
+        返回 False 表示已解决过，或相关的行 / SKU 已被其他操作改掉而无法解决
+        """
+        if conflict.resolved:
+            return False
+        ours = self.ours
+        row = conflict.row
+        if conflict.sku is None:
+            for key, _, _, value in conflict.fields:
+                self._set_info(key, value)
+        elif conflict.kind == DELETED_BY_THEIRS:
+            if conflict.test_id is None:
+                if conflict.sku not in ours.sku_list:
+                    return False
+                ours.remove_sku(conflict.sku)
+            else:
+                if ours.get_item(row.uid) is None:
+                    return False
+                sku = row.sku
+                ours.delete_items([row.uid])
+                ours.renumber(sku)
+                conflict.row = None
+        elif conflict.kind == DELETED_BY_OURS:
+            if conflict.test_id is None:
+                if conflict.sku in ours.sku_list:
+                    return False
+                self._add_sku(conflict.sku, None)
+            else:
+                if conflict.sku not in ours.sku_list:
+                    return False
+                # 放回 theirs 中的同一位置（超出则放在末尾）
+                position = self.theirs.rows(conflict.sku).index(conflict.theirs)
+                values = self.theirs_get(conflict.theirs.values)
+                conflict.row = self._new_row(conflict.sku, values)
+                ours.insert_rows(conflict.sku, position, [conflict.row])
+        else:
+            if ours.get_item(row.uid) is None:
+                return False
+            values = list(self.ours_get(row.values))
+            for name, _, _, value in conflict.fields:
+                values[self.names.index(name)] = value
+            self._update(row, values)
+        conflict.resolved = True
+        return True
+
+
+def format_conflicts(conflicts):
+    """生成冲突列表的各行"""
+    for conflict in conflicts:
+        line = f"! {conflict.location()} {conflict.kind}"
+        details = conflict.describe()
+        yield f"{line}: {details}" if details else line
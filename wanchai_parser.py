@@ -0,0 +1,227 @@
+import re
+
+# 记号类型
+TOKEN_INFO = "info"
+TOKEN_SECTION = "section"
+TOKEN_COUNT = "count"
+TOKEN_ITEM = "item"
+TOKEN_END = "end"
+
+INFO_SECTION = "Info"
+
+_VALUES_RE = re.compile(r"VALUES\s*\((.*)\)")
+
+
+def tokenize(lines):
+    """逐行扫描 INI 内容（只读一遍），依次产出记号:
+    (TOKEN_SECTION, name)
+    (TOKEN_INFO, key, value)
+    (TOKEN_COUNT, count)
+    (TOKEN_ITEM, index, header, values)
+    (TOKEN_END,)                    区块结束（遇到下一个 "[" 开头的行或文件结束）
+    其中 header 为 "(...)" 内的列名串（没有则为 None），values 为 VALUES (...) 括号内的原始串（没有则为 None）。
+    lines 可以是文件对象或任意字符串行迭代器，不会整体读入内存。
+    """
+    section = None
+    in_info = False
+    item_index = None
+    item_lines = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] == "[":
+            # 新区块开始，先结束上一个 test item
+            if item_index is not None:
+                yield _item_token(item_index, item_lines)
+                item_index = None
+            if section is not None:
+                yield (TOKEN_END,)
+            section = section_name(line)
+            if section is not None:
+                in_info = section == INFO_SECTION
+                yield (TOKEN_SECTION, section)
+            continue
+        if section is None:
+            continue
+        key, sep, value = line.partition("=")
+        if sep:
+            key = key.strip()
+            if in_info:
+                yield (TOKEN_INFO, key, value.strip())
+                continue
+            if key.isdecimal():
+                if item_index is not None:
+                    yield _item_token(item_index, item_lines)
+                item_index = key
+                item_lines = [value.lstrip()]
+                continue
+            if key == "Count" and item_index is None:
+                yield (TOKEN_COUNT, value.strip())
+                continue
+        # 多行内容
+        if item_index is not None:
+            item_lines.append(line)
+    if item_index is not None:
+        yield _item_token(item_index, item_lines)
+    if section is not None:
+        yield (TOKEN_END,)
+
+
+def section_name(line):
+    """以 "[" 开头的行对应的区块名，不是合法的区块头时返回 None"""
+    stripped = line.rstrip()
+    if stripped.endswith("]") and len(stripped) > 2:
+        return stripped[1:-1]
+    return None
+
+
+def scan_headers(data):
+    """在 bytes 或 mmap 中查找所有以 "[" 开头的行（不做其他解析），
+    返回 [(行首字节位置, 行内容 bytes), ...]。查找在 C 里完成，不复制其他内容。
+    """
+    headers = []
+    # find 找不到时返回 -1，所以下面的 start 为 0 表示没有下一个区块头
+    start = 0 if data[:1] == b"[" else data.find(b"\n[") + 1
+    if not start and data[:1] != b"[":
+        return headers
+    while True:
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = len(data)
+        headers.append((start, data[start:end]))
+        start = data.find(b"\n[", end) + 1
+        if not start:
+            return headers
+
+
+def iter_lines(data, start, end, encoding="utf-8"):
+    """逐行解码 bytes 或 mmap 中 [start, end) 范围的内容，供 tokenize 使用；
+    每次只复制并解码一行，不会把整段范围读进内存。
+    """
+    find = data.find
+    pos = start
+    while pos < end:
+        stop = find(b"\n", pos, end)
+        stop = end if stop == -1 else stop + 1
+        yield data[pos:stop].decode(encoding)
+        pos = stop
+
+
+def _item_token(index, value_lines):
+    if len(value_lines) == 1:
+        text = value_lines[0].strip()
+    else:
+        text = "\n".join(value_lines).strip()
+    return (TOKEN_ITEM, index, parse_header(text), extract_values(text))
+
+
+def parse_header(text):
+    """提取 test item 开头 "(...)" 内的列名串"""
+    if text[:1] != "(":
+        return None
+    close = text.find(")")
+    if close == -1:
+        return None
+    return text[1:close]
+
+
+def extract_values(text):
+    """提取 VALUES (...) 括号内的原始串"""
+    match = _VALUES_RE.search(text)
+    if not match:
+        return None
+    return match.group(1)
+
+
+# VALUES 字段分割规则（与旧版逐字符实现的输出完全一致）：
+# - 单引号只起开关作用：引号内的逗号属于字段内容，引号外的逗号才是分隔符；
+# - 每个字段去掉首尾空白后，若首尾都是单引号，则去掉这一对引号；
+# - 字段内部的单引号原样保留，不做转义或反转义（'it''s' 读出为 it''s），
+#   导出时也原样写回，因此可以无损往返；
+# - 以逗号结尾时末尾的空字段不计入，空串得到空列表。
+_FIELD_RE = re.compile(r"\s*(?:(')([^']*)'\s*(?=,|$)|((?:[^',]+|'[^']*'?)*))(?:,|$)")
+_MARK = "\x00"
+_SEP = "\x01"
+_ROW_SEP = "\x02"
+
+
+def split_values(values_str):
+    """按上述规则分割 VALUES 括号内的字段"""
+    parts = values_str.split("'")
+    if (
+        len(parts) & 1
+        and _MARK not in values_str
+        and _SEP not in values_str
+        and _ROW_SEP not in values_str
+    ):
+        # 引号外的部分拼成骨架，每个引号段用一个 _MARK 占位
+        skeleton = _MARK.join(parts[0::2])
+        if _is_simple_skeleton(skeleton):
+            values = _join_quoted(parts, skeleton).split(_SEP)
+            if not values_str or values_str[-1] == ",":
+                values.pop()
+            return values
+    return _split_values_general(values_str)
+
+
+def split_values_many(values_strs):
+    """批量分割多行 VALUES，结果与逐行调用 split_values 相同，但整批只做几次 C 级字符串操作"""
+    if len(values_strs) < 2:
+        return [split_values(s) for s in values_strs]
+    text = _ROW_SEP.join(values_strs)
+    parts = text.split("'")
+    rows = len(values_strs)
+    if (
+        len(parts) & 1
+        and _MARK not in text
+        and _SEP not in text
+        and text.count(_ROW_SEP) == rows - 1
+    ):
+        skeleton = _MARK.join(parts[0::2])
+        if (
+            # 行分隔符都在引号外，说明每行的引号各自成对
+            skeleton.count(_ROW_SEP) == rows - 1
+            and _is_simple_skeleton(skeleton)
+            # 空行或以逗号结尾的行需要特殊处理，交给逐行分割
+            and skeleton[0] not in (_ROW_SEP, ",")
+            and skeleton[-1] not in (_ROW_SEP, ",")
+            and _ROW_SEP + _ROW_SEP not in skeleton
+            and "," + _ROW_SEP not in skeleton
+        ):
+            text = _join_quoted(parts, skeleton)
+            return [row.split(_SEP) for row in text.split(_ROW_SEP)]
+    return [split_values(s) for s in values_strs]
+
+
+def _is_simple_skeleton(skeleton):
+    """快速路径的前提：引号外没有空白，且每个引号段都独占一个字段（可以是 'a''b' 这样相邻的几段）"""
+    if skeleton and skeleton.split() != [skeleton]:
+        return False
+    double = _MARK + _MARK
+    while double in skeleton:
+        skeleton = skeleton.replace(double, _MARK)
+    fields = skeleton.replace(_ROW_SEP, ",").split(",")
+    return fields.count(_MARK) == skeleton.count(_MARK)
+
+
+def _join_quoted(parts, skeleton):
+    """把骨架里的逗号换成 _SEP 后与引号段拼回去：去掉外层引号，相邻引号段之间保留原样的 ''"""
+    double = _MARK + _MARK
+    while double in skeleton:
+        skeleton = skeleton.replace(double, _MARK + "''" + _MARK)
+    parts[0::2] = skeleton.replace(",", _SEP).split(_MARK)
+    return "".join(parts)
+
+
+def _split_values_general(values_str):
+    fields = _FIELD_RE.findall(values_str)
+    fields.pop()  # findall 在串尾总会多匹配出一个空字段
+    values = []
+    for quote, quoted, raw in fields:
+        if quote:
+            values.append(quoted)
+        else:
+            raw = raw.strip()
+            if len(raw) >= 2 and raw[0] == "'" and raw[-1] == "'":
+                raw = raw[1:-1]
+            values.append(raw)
+    return values
@@ -0,0 +1,468 @@
+import fnmatch
+import operator
+import re
+from itertools import chain, compress, groupby
+
+from wanchai_core import match_rows, strings
+
+
+class IncrementalSearch:
+    """搜索框的过滤器。
+    普通文本：同一 SKU、文档未修改、新搜索词包含上一次的搜索词时，只在上一次的结果中查找；
+    查询语法（见 compile_query）：同一查询串只编译一次。
+    """
+
+    def __init__(self):
+        # (doc, version, sku, term, rows)
+        self._last = None
+        # (text, columns, Query)
+        self._query = None
+
+    def compile(self, search_term, columns):
+        """编译（并缓存）查询，普通文本返回 None，语法错误抛出 QueryError"""
+        cached = self._query
+        if cached is None or cached[0] != search_term or cached[1] != columns:
+            cached = (search_term, list(columns), compile_query(search_term, columns))
+            self._query = cached
+        return cached[2]
+
+    def filter(self, doc, sku, search_term=""):
+        """返回 sku 下匹配 search_term 的行（普通文本时与 doc.filter_rows 结果相同）"""
+        query = self.compile(search_term, doc.test_columns)
+        if query is not None:
+            self._last = None
+            return query.filter(doc.rows(sku), doc)
+        term = search_term.lower()
+        rows = None
+        last = self._last
+        if (
+            last is not None
+            and last[0] is doc
+            and last[1] == doc.version
+            and last[2] == sku
+            and last[3] in term
+        ):
+            rows = last[4]
+        result = doc.filter_rows(sku, term, rows)
+        self._last = (doc, doc.version, sku, term, result)
+        return result
+
+    def reset(self):
+        self._last = None
+
+
+# ---------- 查询语法 ----------
+# 以空白分隔的若干条件，相邻条件默认为 AND，可用 AND / OR 连接（AND 优先）：
+#   text            任一字段包含 text（不区分大小写）
+#   col:text        该列包含 text；text 含 * 或 ? 时按通配符整体匹配，如 TestID:RF_*
+#   col=value       该列等于 value（两边都是数字时按数值比较），col!=value 为不等于
+#   col>num         数值比较，支持 > < >= <=，如 LowLimit>-1
+#   col>col2        两列按数值比较，如 LowLimit>HighLimit
+#   col~regex       该列匹配正则表达式（re.search，不区分大小写）
+#   /regex/         任一字段匹配正则表达式
+# 含空白的值用双引号括起来，如 Parameters:"UC, Link"。
+# 列名不区分大小写；不是已知列名时整个词按普通文本处理。
+
+_QUERY_TOKEN_RE = re.compile(r'(?:[^\s"]|"[^"]*")+')
+_QUERY_TERM_RE = re.compile(r"^(\w+)(>=|<=|!=|=|>|<|:|~)(.*)$", re.S)
+_NUMBER_CACHE = {}
+_MISSING = object()
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _unquote(text):
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1]
+    return text.replace('"', "")
+
+
+def _to_number(text):
+    """字段转数字（带缓存），不是数字时返回 None。
+    "nan" 按文本处理（SQLite 中 NaN 会变成 NULL，两边才能一致），"inf" 是数字。
+    """
+    num = _NUMBER_CACHE.get(text, _MISSING)
+    if num is _MISSING:
+        try:
+            num = float(text)
+        except (TypeError, ValueError):
+            num = None
+        if num != num:
+            num = None
+        if len(_NUMBER_CACHE) < 200000:
+            _NUMBER_CACHE[text] = num
+    return num
+
+
+def _compile_regex(pattern):
+    try:
+        return re.compile(pattern, re.I)
+    except re.error as e:
+        raise QueryError(f"Invalid regular expression '{pattern}': {e}")
+
+
+_COMPARE = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+# 每个条件编译为 filter(rows, doc) -> rows，按列取值后整列处理：
+# 先对该列的不同取值各判断一次（Identifier/Enabled/Unit 等列的取值大量重复），
+# 再用 map/compress 按集合查找过滤行，逐行部分尽量在 C 里完成。
+# 行数多时单列条件改用文档的倒排索引（doc.select_uids）：不同的值直接取自索引，
+# 不必先逐行取出该列，再按 uid 过滤行。
+_NAN = float("nan")
+_UID = operator.attrgetter("uid")
+_SECTION = operator.attrgetter("section")
+_VALUES = operator.attrgetter("values")
+
+# 至少这么多行时单列条件才使用倒排索引
+INDEX_MIN_ROWS = 5000
+
+
+def _column(rows, col):
+    # Identifier 字段可能是 SkuSection 对象，统一转成字符串
+    return strings(list(map(operator.itemgetter(col), map(_VALUES, rows))))
+
+
+def _indexed_uids(rows, doc, col, test):
+    """用倒排索引求该列满足 test 的行 uid；行数少、或该列不同的值比行还多时逐行判断更快，返回 None"""
+    if doc is None or len(rows) < INDEX_MIN_ROWS:
+        return None
+    index = doc.search_index()
+    if index is None or index.distinct(col) >= len(rows):
+        return None
+    return doc.select_uids(col, test)
+
+
+def _numbers(values):
+    """数字化一列；不是数字的记为 NaN（与任何数比较都为 False）"""
+    table = {}
+    for value in set(values):
+        num = _to_number(value)
+        table[value] = _NAN if num is None else num
+    return list(map(table.__getitem__, values))
+
+
+def _column_filter(col, test):
+    def filter_rows(rows, doc=None):
+        uids = _indexed_uids(rows, doc, col, test)
+        if uids is not None:
+            return list(compress(rows, map(uids.__contains__, map(_UID, rows))))
+        values = _column(rows, col)
+        ok = set(filter(test, set(values)))
+        return list(compress(rows, map(ok.__contains__, values)))
+
+    return filter_rows
+
+
+def _indexed_any(rows, doc, test):
+    """用倒排索引求任一列满足 test 的行（Index 列不在索引中，按不同的值逐个判断）；
+    有一列不能使用索引时返回 None
+    """
+    if doc is None:
+        return None
+    uids = set()
+    for col in range(1, len(doc.test_columns)):
+        found = _indexed_uids(rows, doc, col, test)
+        if found is None:
+            return None
+        uids |= found
+    hits = list(map(uids.__contains__, map(_UID, rows)))
+    # Index 列只需判断其他列都没匹配的行
+    indexes = _column(rows, 0)
+    ok = set(filter(test, set(compress(indexes, map(operator.not_, hits)))))
+    if ok:
+        hits = list(map(operator.or_, hits, map(ok.__contains__, indexes)))
+    return list(compress(rows, hits))
+
+
+def _any_column_filter(test):
+    def filter_rows(rows, doc=None):
+        found = _indexed_any(rows, doc, test)
+        if found is not None:
+            return found
+        values = list(map(_VALUES, rows))
+        distinct = set(chain.from_iterable(values))
+        ok = {value for value in distinct if test(str(value))}
+        disjoint = map(ok.isdisjoint, values)
+        return list(compress(rows, map(operator.not_, disjoint)))
+
+    return filter_rows
+
+
+def _column_compare_filter(col, other, compare):
+    """两列按数值比较"""
+
+    def filter_rows(rows, doc=None):
+        a = _numbers(_column(rows, col))
+        b = _numbers(_column(rows, other))
+        return list(compress(rows, map(compare, a, b)))
+
+    return filter_rows
+
+
+def _column_pair_filter(col, other, test):
+    """两列比较：test(a, b) 的参数为两列的原始字符串"""
+
+    def filter_rows(rows, doc=None):
+        a = _column(rows, col)
+        b = _column(rows, other)
+        return list(compress(rows, map(test, a, b)))
+
+    return filter_rows
+
+
+def _text_filter(term):
+    def filter_rows(rows, doc=None):
+        return match_rows(rows, term)
+
+    return filter_rows
+
+
+def _compare_test(compare, number):
+    def test(value):
+        num = _to_number(value)
+        return num is not None and compare(num, number)
+
+    return test
+
+
+def _equal_test(value, negate):
+    number = _to_number(value)
+    text = value.lower()
+
+    def test(cell):
+        if number is not None:
+            num = _to_number(cell)
+            if num is not None:
+                return (num == number) != negate
+        return (cell.lower() == text) != negate
+
+    return test
+
+
+def _pair_equal_test(negate):
+    def test(a, b):
+        na, nb = _to_number(a), _to_number(b)
+        if na is not None and nb is not None:
+            return (na == nb) != negate
+        return (a.lower() == b.lower()) != negate
+
+    return test
+
+
+def _term_filter(token, columns):
+    """把一个条件编译为 filter(rows)；普通文本返回 None"""
+    if len(token) >= 2 and token[0] == "/" and token[-1] == "/":
+        return _any_column_filter(_compile_regex(_unquote(token[1:-1])).search)
+    m = _QUERY_TERM_RE.match(token)
+    col = columns.get(m.group(1).lower()) if m else None
+    if col is None:
+        return None
+    op, raw = m.group(2), m.group(3)
+    value = _unquote(raw)
+    if op == ":":
+        if "*" in value or "?" in value:
+            return _column_filter(col, _compile_regex(fnmatch.translate(value)).match)
+        needle = value.lower()
+        return _column_filter(col, lambda cell: needle in cell.lower())
+    if op == "~":
+        return _column_filter(col, _compile_regex(value).search)
+    # 右边是列名（且没有加引号）时两列比较
+    other = columns.get(raw.lower()) if raw == value else None
+    if op in _COMPARE:
+        if other is not None:
+            return _column_compare_filter(col, other, _COMPARE[op])
+        number = _to_number(value)
+        if number is None:
+            raise QueryError(f"'{token}': '{value}' is not a number")
+        return _column_filter(col, _compare_test(_COMPARE[op], number))
+    # = / !=
+    negate = op == "!="
+    if other is not None:
+        return _column_pair_filter(col, other, _pair_equal_test(negate))
+    return _column_filter(col, _equal_test(value, negate))
+
+
+class Query:
+    """编译好的查询：OR 连接的若干 AND 组，每组是 filter 函数列表"""
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def filter(self, rows, doc=None):
+        """按原顺序返回匹配的行；doc 为 rows 所在的文档时，行数多的单列条件使用其倒排索引"""
+        if len(self.groups) == 1:
+            return self._filter_group(self.groups[0], rows, doc)
+        hits = set()
+        for group in self.groups:
+            hits.update(map(id, self._filter_group(group, rows, doc)))
+        return list(compress(rows, map(hits.__contains__, map(id, rows))))
+
+    @staticmethod
+    def _filter_group(group, rows, doc):
+        # 逐个条件缩小范围
+        for filter_rows in group:
+            if not rows:
+                break
+            rows = filter_rows(rows, doc)
+        return rows
+
+
+def compile_query(text, columns):
+    """把搜索框文本编译为 Query；只有普通文本（没有任何查询语法）时返回 None，
+    这时按原来的方式把整个搜索串当作一个子串查找。语法错误抛出 QueryError。
+    """
+    column_map = {name.lower(): i for i, name in enumerate(columns)}
+    groups = [[]]
+    simple = True
+    for token in _QUERY_TOKEN_RE.findall(text):
+        if token in ("AND", "OR"):
+            simple = False
+            if token == "OR" and groups[-1]:
+                groups.append([])
+            continue
+        filter_rows = _term_filter(token, column_map)
+        if filter_rows is None:
+            filter_rows = _text_filter(_unquote(token).lower())
+        else:
+            simple = False
+        groups[-1].append(filter_rows)
+    if simple:
+        return None
+    groups = [group for group in groups if group]
+    if not groups:
+        return None
+    return Query(groups)
+
+
+def search_all_skus(doc, search_term):
+    """在所有 SKU 中搜索（一次遍历全部行），返回 [(sku, [row, ...]), ...]，
+    按 SKU 顺序，只包含有命中的 SKU。语法错误抛出 QueryError。
+    """
+    rows = list(chain.from_iterable(doc.rows(sku) for sku in doc.sku_list))
+    query = compile_query(search_term, doc.test_columns)
+    if query is None:
+        hits = doc.filter_rows(None, search_term, rows)
+    else:
+        hits = query.filter(rows, doc)
+    # 命中的行按 SKU 顺序排列，同一 SKU 的行相邻
+    return [(section.name, list(group)) for section, group in groupby(hits, _SECTION)]
+
+
+# ---------- 查询语法转 SQL ----------
+# 供 wanchai_fleet 在 SQLite 索引上查询，语义与 compile_query 相同。
+# 数值比较和正则用 register_sql_functions 注册的 wanchai_num / regexp 函数，
+# 不是数字的值 wanchai_num 返回 NULL，与任何数比较都不成立（相当于上面的 NaN）。
+# 列值为 NULL 时按空串处理（与文档中缺少的列一样）。
+
+
+def compile_sql(text, columns):
+    """把查询串编译为 SQL 条件，返回 (sql, 参数列表)；columns 为表中可查询的列名，
+    普通文本在所有这些列中查找（不区分大小写）。空查询返回 ("1", [])。语法错误抛出 QueryError。
+    """
+    column_map = {name.lower(): quote_identifier(name) for name in columns}
+    groups = [[]]
+    params = []
+    simple = True
+    for token in _QUERY_TOKEN_RE.findall(text):
+        if token in ("AND", "OR"):
+            simple = False
+            if token == "OR" and groups[-1]:
+                groups.append([])
+            continue
+        simple = simple and _is_text_term(token, column_map)
+        groups[-1].append(_term_sql(token, column_map, params))
+    groups = [" AND ".join(group) for group in groups if group]
+    if simple or not groups:
+        # 与 compile_query 返回 None 时一样，把整个查询串当作一个子串查找
+        if not text:
+            return "1", []
+        params = [text.lower()] * len(column_map)
+        return _any_sql("instr(lower(COALESCE({}, '')), ?) > 0", column_map), params
+    return " OR ".join(f"({group})" for group in groups), params
+
+
+def register_sql_functions(conn):
+    """在 sqlite3 连接上注册 compile_sql 生成的条件用到的函数"""
+    conn.create_function("wanchai_num", 1, _to_number)
+    conn.create_function("regexp", 2, _sql_regexp)
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_regexp(pattern, value):
+    # re 模块自带编译缓存，同一模式不会逐行重新编译
+    return re.search(pattern, value or "", re.I) is not None
+
+
+def _is_text_term(token, column_map):
+    """token 是普通文本（不是 /regex/，也不是 列名+运算符）"""
+    if len(token) >= 2 and token[0] == "/" and token[-1] == "/":
+        return False
+    m = _QUERY_TERM_RE.match(token)
+    return m is None or m.group(1).lower() not in column_map
+
+
+def _term_sql(token, column_map, params):
+    """把一个条件编译为 SQL，参数按出现顺序追加到 params"""
+    if len(token) >= 2 and token[0] == "/" and token[-1] == "/":
+        pattern = _unquote(token[1:-1])
+        _compile_regex(pattern)
+        params.extend([pattern] * len(column_map))
+        return _any_sql("{} REGEXP ?", column_map)
+    m = _QUERY_TERM_RE.match(token)
+    col = column_map.get(m.group(1).lower()) if m else None
+    if col is None:
+        params.extend([_unquote(token).lower()] * len(column_map))
+        return _any_sql("instr(lower(COALESCE({}, '')), ?) > 0", column_map)
+    op, raw = m.group(2), m.group(3)
+    value = _unquote(raw)
+    text = f"COALESCE({col}, '')"
+    if op == ":":
+        params.append(value.lower())
+        if "*" in value or "?" in value:
+            return f"lower({text}) GLOB ?"
+        return f"instr(lower({text}), ?) > 0"
+    if op == "~":
+        _compile_regex(value)
+        params.append(value)
+        return f"{col} REGEXP ?"
+    # 右边是列名（且没有加引号）时两列比较
+    other = column_map.get(raw.lower()) if raw == value else None
+    if op in _COMPARE:
+        if other is not None:
+            return f"wanchai_num({col}) {op} wanchai_num({other})"
+        number = _to_number(value)
+        if number is None:
+            raise QueryError(f"'{token}': '{value}' is not a number")
+        params.append(number)
+        return f"wanchai_num({col}) {op} ?"
+    # = / !=：两边都是数字时按数值比较，否则不区分大小写比较文本
+    negate = "NOT " if op == "!=" else ""
+    if other is not None:
+        return (
+            f"{negate}(COALESCE(wanchai_num({col}) = wanchai_num({other}), 0)"
+            f" OR lower({text}) = lower(COALESCE({other}, '')))"
+        )
+    number = _to_number(value)
+    if number is None:
+        params.append(value)
+        if value and not negate:
+            # NULL 本来就不等于非空文本，不包 COALESCE，这样能用上 TestID 列的索引
+            return f"{col} = ? COLLATE NOCASE"
+        return f"{negate}({text} = ? COLLATE NOCASE)"
+    params.extend([number, value.lower()])
+    return f"{negate}(COALESCE(wanchai_num({col}) = ?, 0) OR lower({text}) = ?)"
+
+
+def _any_sql(template, column_map):
+    return "(" + " OR ".join(template.format(c) for c in column_map.values()) + ")"
@@ -0,0 +1,365 @@
+import json
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit
+
+import wanchai_batch
+import wanchai_core
+from wanchai_search import QueryError
+
+# 注意：本模块不依赖 tkinter，供 wanchai-cli.py serve 使用
+#
+# 只监听 127.0.0.1 的 JSON-over-HTTP 服务：打开的 INI 文件解析一次后常驻内存，
+# 之后的查询、修改、导出都直接在内存中的文档上进行，不再重新解析。
+# 请求和响应都是 JSON（POST 的请求体为 JSON 对象），路径：
+#   GET  /files                                   已打开的文件
+#   POST /open    {"path", "reload", "force"}      打开（或重新加载）文件，返回 SKU 列表等；
+#                 有没导出到原文件的修改时不重新加载，除非 force
+#   POST /close   {"path"}                        从内存中移除
+#   POST /query   {"path", "sku", "where", "columns"}  查询行（sku/where/columns 可选）
+#   POST /edit    {"path", "operations": [...]}   执行一批操作，格式与 wanchai_batch 的编辑脚本相同
+#   POST /export  {"path", "output": 可选}         导出到 output（默认覆盖原文件）
+# where 与编辑脚本相同，例如 {"TestID": ["RF_500", "AUD_583"]}。
+# 还没打开的文件在第一次请求时自动打开。
+#
+# 浏览器中的网页也能向 127.0.0.1 发请求（跨站请求、DNS rebinding），所以：
+# Host 必须是 localhost 或 127.0.0.1，POST 的 Content-Type 必须是 application/json
+# （浏览器跨站发这种请求前要先预检，本服务不应答预检）；
+# output 只能在原文件所在的目录中，除非以 allow_any_output 启动。
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+LOCALHOST = "127.0.0.1"
+ALLOWED_HOSTS = ("localhost", LOCALHOST)
+# 请求体的大小上限（字节）
+MAX_BODY_BYTES = 16 << 20
+
+logger = logging.getLogger(__name__)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class OpenFile:
+    """常驻内存的一个文档；文档不是线程安全的，所有访问都要持有 lock。
+    saved_version 为文档与原文件内容一致时的 doc.version（加载或导出到原文件时更新）。
+    """
+
+    __slots__ = ("path", "doc", "lock", "saved_version")
+
+    def __init__(self, path, doc):
+        self.path = path
+        self.doc = doc
+        self.lock = threading.Lock()
+        self.saved_version = doc.version
+
+    def modified(self):
+        with self.lock:
+            return self.doc.version != self.saved_version
+
+
+class DocumentStore:
+    """按绝对路径保存已打开的文档，并把请求分派到各个处理函数。
+    与 HTTP 无关，可以直接调用 handle 测试。
+    """
+
+    def __init__(self, cache=None, allow_any_output=False):
+        self.cache = cache
+        # 为 False 时 /export 只能写到原文件所在的目录
+        self.allow_any_output = allow_any_output
+        self._files = {}
+        self._lock = threading.Lock()
+        # {路径: 锁}，同一文件同时只有一个请求在加载
+        self._loading = {}
+        self._routes = {
+            ("GET", "/files"): self._files_route,
+            ("POST", "/open"): self._open_route,
+            ("POST", "/close"): self._close_route,
+            ("POST", "/query"): self._query_route,
+            ("POST", "/edit"): self._edit_route,
+            ("POST", "/export"): self._export_route,
+        }
+
+    def open(self, path, reload=False, force=False):
+        """返回已打开的文件，没有打开（或 reload）时加载并解析全部区块。
+        同一文件的并发请求只加载一次；reload 时文档有未导出到原文件的修改则抛出
+        RequestError(409)，force 时丢弃这些修改。
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            opened = self._files.get(path)
+            if opened is not None and not reload:
+                return opened
+            loading = self._loading.setdefault(path, threading.Lock())
+        with loading:
+            with self._lock:
+                current = self._files.get(path)
+            if current is not opened:
+                # 等锁期间另一个请求已经加载（或重新加载）了这个文件
+                return current
+            if opened is not None and not force and opened.modified():
+                raise RequestError(
+                    409,
+                    f"{path} has changes that were not exported, "
+                    "export it first or reload with 'force'",
+                )
+            doc = wanchai_core.load(path, cache=self.cache)
+            # 全部解析后不再依赖原文件，原文件之后被修改也不影响内存中的文档
+            doc.parse_all()
+            opened = OpenFile(path, doc)
+            with self._lock:
+                self._files[path] = opened
+        return opened
+
+    def close(self, path):
+        with self._lock:
+            return self._files.pop(os.path.abspath(path), None) is not None
+
+    def handle(self, method, target, body=b""):
+        """处理一个请求，返回 (HTTP 状态码, 可转为 JSON 的响应)"""
+        route = self._routes.get((method, urlsplit(target).path.rstrip("/")))
+        if route is None:
+            return 404, {"error": f"No such endpoint: {method} {target}"}
+        try:
+            params = json.loads(body.decode("utf-8")) if body else {}
+            if not isinstance(params, dict):
+                raise RequestError(400, "The request body must be a JSON object")
+            return 200, route(params)
+        except RequestError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, QueryError) as e:
+            # 包括 JSON 格式错误、wanchai_batch.ScriptError 和 SKU 操作的参数错误
+            return 400, {"error": str(e)}
+        except FileNotFoundError as e:
+            return 404, {"error": str(e)}
+        except wanchai_core.SourceChanged as e:
+            return 409, {"error": str(e)}
+        except Exception as e:
+            logger.exception("Request %s %s failed", method, target)
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    def _file(self, params):
+        return self.open(_path(params))
+
+    def _files_route(self, params):
+        with self._lock:
+            files = list(self._files.values())
+        return {"files": [_describe(opened) for opened in files]}
+
+    def _open_route(self, params):
+        opened = self.open(
+            _path(params),
+            reload=bool(params.get("reload")),
+            force=bool(params.get("force")),
+        )
+        return _describe(opened)
+
+    def _close_route(self, params):
+        return {"closed": self.close(_path(params))}
+
+    def _query_route(self, params):
+        where = params.get("where") or {}
+        if not isinstance(where, (dict, str)):
+            raise RequestError(400, "'where' must be an object or a query string")
+        columns = params.get("columns")
+        if columns is not None and not (
+            isinstance(columns, list) and all(isinstance(c, str) for c in columns)
+        ):
+            raise RequestError(400, "'columns' must be a list of column names")
+        sku = params.get("sku")
+        if sku is not None and not isinstance(sku, str):
+            raise RequestError(400, "'sku' must be a string")
+        opened = self._file(params)
+        with opened.lock:
+            doc = opened.doc
+            columns = columns or doc.test_columns
+            unknown = [name for name in columns if name not in doc.test_columns]
+            if unknown:
+                raise RequestError(400, f"Unknown column(s): {', '.join(unknown)}")
+            cols = [doc.test_columns.index(name) for name in columns]
+            rows = wanchai_batch.select_rows(doc, where, sku)
+            return {
+                "path": opened.path,
+                "version": doc.version,
+                "rows": [
+                    dict(zip(columns, [row[c] for c in cols]), SKU=row.sku)
+                    for row in rows
+                ],
+            }
+
+    def _edit_route(self, params):
+        opened = self._file(params)
+        operations = wanchai_batch.parse_script(params.get("operations"))
+        with opened.lock:
+            changes = wanchai_batch.apply_operations(opened.doc, operations)
+            return {
+                "path": opened.path,
+                "version": opened.doc.version,
+                "changes": changes,
+            }
+
+    def _export_route(self, params):
+        output = params.get("output")
+        if output is not None and not isinstance(output, str):
+            raise RequestError(400, "'output' must be a path")
+        opened = self._file(params)
+        output = os.path.abspath(output or opened.path)
+        if not self.allow_any_output and not _same_directory(output, opened.path):
+            raise RequestError(
+                403,
+                f"'output' must be in {os.path.dirname(opened.path)} "
+                "(start the server with --allow-any-output to write elsewhere)",
+            )
+        with opened.lock:
+            wanchai_core.dump(opened.doc, output)
+            if output == opened.path:
+                opened.saved_version = opened.doc.version
+        return {"path": opened.path, "output": output}
+
+
+def _path(params):
+    path = params.get("path")
+    if not isinstance(path, str) or not path:
+        raise RequestError(400, "Missing 'path'")
+    return path
+
+
+def _same_directory(path, other):
+    """两个文件是否在同一目录中（解析符号链接后比较）"""
+    directory = os.path.dirname(os.path.realpath(path))
+    return os.path.normcase(directory) == os.path.normcase(
+        os.path.dirname(os.path.realpath(other))
+    )
+
+
+def check_headers(method, headers):
+    """检查请求头，不接受时返回 (HTTP 状态码, 原因)，否则返回 None"""
+    host = (headers.get("Host") or "").strip().lower()
+    name, _, port = host.partition(":")
+    if name not in ALLOWED_HOSTS or (port and not port.isdecimal()):
+        return 403, f"Host {host!r} is not allowed, use {LOCALHOST}"
+    if method == "POST":
+        content_type = headers.get("Content-Type") or ""
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            return 415, "Content-Type must be application/json"
+    return None
+
+
+def content_length(headers):
+    """请求体的字节数；Content-Length 不是非负整数时抛出 RequestError(400)，
+    超过 MAX_BODY_BYTES 时抛出 RequestError(413)
+    """
+    value = (headers.get("Content-Length") or "0").strip()
+    if not value.isdecimal():
+        raise RequestError(400, f"Invalid Content-Length {value!r}")
+    length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise RequestError(
+            413, f"The request body must not exceed {MAX_BODY_BYTES} bytes"
+        )
+    return length
+
+
+def _describe(opened):
+    with opened.lock:
+        doc = opened.doc
+        return {
+            "path": opened.path,
+            "version": doc.version,
+            "info": dict(doc.info),
+            "columns": list(doc.test_columns),
+            "skus": [{"name": sku, "count": doc.count(sku)} for sku in doc.sku_list],
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 默认保持连接，同一客户端的后续请求复用同一个连接
+    protocol_version = "HTTP/1.1"
+    # 空闲连接超时后关闭，让出工作线程
+    timeout = 30
+    # 小响应不等 Nagle 合包，避免保持连接时每个请求多等 40ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        try:
+            length = content_length(self.headers)
+        except RequestError as e:
+            # 请求体没有读出来，这个连接不能再用于后续请求
+            self.close_connection = True
+            self._respond(e.status, {"error": str(e)})
+            return
+        body = self.rfile.read(length) if length else b""
+        rejected = check_headers(method, self.headers)
+        if rejected is not None:
+            status, payload = rejected[0], {"error": rejected[1]}
+        else:
+            status, payload = self.server.store.handle(method, self.path, body)
+        self._respond(status, payload)
+
+    def _respond(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class DocumentServer(HTTPServer):
+    """只监听本机的服务；每个连接交给线程池中的一个线程处理（连接保持期间一直占用该线程）"""
+
+    def __init__(
+        self, store, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, verbose=False
+    ):
+        super().__init__((LOCALHOST, port), _Handler)
+        self.store = store
+        self.verbose = verbose
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        # 正在处理的连接，关闭服务时断开，不用等空闲连接超时
+        self._active = set()
+        self._active_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        with self._active_lock:
+            self._active.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._active_lock:
+                self._active.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        with self._active_lock:
+            active = list(self._active)
+        for request in active:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,88 @@
+"""测试项目表格虚拟滚动的模型（不依赖 Tk）：编辑器的 Treeview 里只放它给出的可见窗口"""
+
+
+class RowWindow:
+    """过滤后的行列表上的可见窗口和选中状态。
+    rows 为过滤后的所有 TestItem，top 为可见窗口第一行在 rows 中的位置，
+    selection 为选中行的 uid（包括滚出窗口的行），anchor 为 Shift 多选和方向键的起点位置。
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.top = 0
+        # 生成 rows 的条件（如 (sku, 搜索词)），变化时回到顶部
+        self.key = None
+        self.selection = set()
+        self.anchor = None
+
+    def set_rows(self, rows, key=None):
+        """换成新的过滤结果并清空选中；key 与上一次相同时保持滚动位置"""
+        if key != self.key:
+            self.key = key
+            self.top = 0
+        self.rows = rows
+        self.selection = set()
+        self.anchor = None
+
+    def window(self, visible, overscan=0):
+        """把 top 限制在有效范围内，返回从 top 开始的 visible + overscan 行"""
+        self.top = max(0, min(self.top, len(self.rows) - visible))
+        return self.rows[self.top : self.top + visible + overscan]
+
+    def fractions(self, visible):
+        """纵向滚动条的 (first, last)"""
+        total = len(self.rows)
+        if not total:
+            return 0.0, 1.0
+        return self.top / total, min(1.0, (self.top + visible) / total)
+
+    def moveto(self, fraction):
+        """滚动条拖到 fraction 处"""
+        self.top = int(fraction * len(self.rows))
+
+    def selected_uids(self):
+        """选中行的 uid，按 rows 的顺序"""
+        selected = self.selection
+        if not selected:
+            return []
+        return [row.uid for row in self.rows if row.uid in selected]
+
+    def sync_selection(self, shown, selected):
+        """shown 为窗口中显示的 uid，selected 为其中选中的 uid；窗口外的选中不变"""
+        self.selection = (self.selection - set(shown)) | set(selected)
+
+    def select_range(self, pos):
+        """选中 anchor 到 pos 之间的行（可以跨越可见窗口），没有 anchor 时只选中 pos"""
+        anchor = pos if self.anchor is None else self.anchor
+        start, end = min(anchor, pos), max(anchor, pos)
+        self.selection = {row.uid for row in self.rows[start : end + 1]}
+
+    def move(self, step, visible):
+        """把选中行从 anchor 移动 step 行并滚动到可见，返回选中行的 uid；没有行时返回 None"""
+        total = len(self.rows)
+        if not total:
+            return None
+        if self.anchor is None:
+            pos = self.top
+        else:
+            pos = max(0, min(total - 1, self.anchor + step))
+        if pos < self.top:
+            self.top = pos
+        elif pos >= self.top + visible:
+            self.top = pos - visible + 1
+        self.anchor = pos
+        uid = self.rows[pos].uid
+        self.selection = {uid}
+        return uid
+
+    def reveal(self, row, visible):
+        """选中 row 并滚动到窗口中间；row 不在 rows 中时返回 False"""
+        for pos, r in enumerate(self.rows):
+            if r is row:
+                break
+        else:
+            return False
+        self.top = pos - visible // 2
+        self.selection = {row.uid}
+        self.anchor = pos
+        return True